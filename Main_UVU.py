@@ -15,16 +15,55 @@ Developed with:
 Python version 3.7.2
 Tkinter version 8.6
 """
+import os
 import re
 from functools import partial
+from itertools import chain
 from tkinter import *
 from tkinter import ttk
 from tkinter.messagebox import showinfo, askokcancel, askyesno, WARNING
 from idlelib.tooltip import Hovertip
 
 from employee_database import *
+from ingest import InputTracker, PeriodPartitions, read_binary_totals
+from payroll import PayLedger, apply_new_receipts, apply_new_timecards, \
+    apply_receipts, apply_timecards, pay_period
+from report import ReportCache, ReportReader, write_report
 
 uvuEmpDat = EmployeeDB()
+# Number of worker processes used to parse large reads of "timecards.csv"
+#   and "receipts.csv" for the all employee report, e.g. the first one
+#   after the app starts. 1 parses them in this process, which is faster
+#   unless the files are tens of megabytes and there are as many CPUs as
+#   workers. See ingest.InputTracker.update.
+PAYROLL_WORKERS = 1
+# Number of worker processes used to render the blocks of the all
+#   employee report. 1 renders it in this process.
+REPORT_WORKERS = 1
+# Running totals of "timecards.csv" and "receipts.csv", so each report
+#   only reads the lines appended since the last one.
+TIMECARDS = InputTracker("timecards.csv")
+RECEIPTS = InputTracker("receipts.csv")
+# Read "timecards.bin" and "receipts.bin", made by running ingest.py,
+#   instead of the csv files.
+BINARY_INPUTS = False
+# Copy new timecards and receipts into per pay period files in
+#   "input_periods" and pay each employee for the current period's only,
+#   instead of for everything in the csv files.
+PARTITIONED_INPUTS = False
+PERIODS = None
+# What each employee was paid in each pay period, used for pay stubs.
+#   Opened by _pay_ledger the first time it's needed.
+PAY_LEDGER = None
+# Machine-readable exports of each report's pay, written with the report
+#   for payroll providers and accounting tools. None skips an export.
+CSV_EXPORT = "payroll_export.csv"
+JSONL_EXPORT = "payroll_export.jsonl"
+# The report blocks of the last all employee report, so the next one only
+#   renders the employees that changed since.
+REPORT_CACHE = ReportCache()
+# Number of lines of the report shown at once in the report window.
+REPORT_PAGE_LINES = 40
 HOURLY_LABEL = None
 HOURLY_ENTRY = None
 SALARY_LABEL = None
@@ -39,36 +78,69 @@ ACCOUNT_LABEL = None
 ACCOUNT_ENTRY = None
 
 
-def read_receipts():
-    """Reads in all receipt lists from the "receipts.csv" file, and adds
-    them to the commissioned employees' individual records.
+def read_receipts(workers=1):
+    """Reads in the receipts appended to the "receipts.csv" file since the
+    last read, and updates the commissioned employees they are for with
+    their receipts in the whole file. With BINARY_INPUTS,
+    "receipts.bin" is read instead, and with PARTITIONED_INPUTS, the
+    current pay period's receipts. Large reads of the csv file are parsed
+    by workers processes, see ingest.InputTracker.update.
+    Output: the InputTotals of the whole file, including any malformed
+    lines that were skipped.
     """
-    with open("receipts.csv", 'r', encoding="utf8") as receipts:
-        for line in receipts:
-            sales = line.split(',')
-            emp_id = int(sales.pop(0))
-            employee = find_employee_by_id(emp_id, uvuEmpDat.emp_list)
-
-            if employee:
-                if str(employee.classification) == "commissioned":
-                    for receipt in sales:
-                        employee.classification.add_receipt(float(receipt))
+    if not BINARY_INPUTS and not PARTITIONED_INPUTS:
+        apply_new_receipts(uvuEmpDat, RECEIPTS,
+                           RECEIPTS.update(workers=workers))
+        return RECEIPTS.totals
+    if BINARY_INPUTS:
+        receipts = read_binary_totals("receipts.bin", keep_values=True)
+    else:
+        receipts = _period_totals("receipts")
+    apply_receipts(uvuEmpDat, receipts)
+    return receipts
 
 
-def read_timecards():
-    """Reads in all timecard lists from the "timecards.csv" file, and adds
-    them to the hourly employees' individual records.
+def _period_totals(kind):
+    """Copies the new lines of "timecards.csv" or "receipts.csv" into the
+    current pay period's partition, and returns that period's InputTotals.
     """
-    with open("timecards.csv", 'r', encoding="utf8") as timecards:
-        for line in timecards:
-            times = line.split(',')
-            emp_id = int(times.pop(0))
-            employee = find_employee_by_id(emp_id, uvuEmpDat.emp_list)
+    global PERIODS
+    if PERIODS is None:
+        PERIODS = PeriodPartitions()
+    period = pay_period()
+    PERIODS.ingest(kind, f"{kind}.csv", period)
+    return PERIODS.totals(kind, period, keep_values=True)
 
-            if employee:
-                if str(employee.classification) == "hourly":
-                    for time in times:
-                        employee.classification.add_timecard(float(time))
+
+def _pay_ledger():
+    """Returns the pay ledger, opening "pay_ledger.db" the first time.
+    """
+    global PAY_LEDGER
+    if PAY_LEDGER is None:
+        PAY_LEDGER = PayLedger()
+    return PAY_LEDGER
+
+
+def read_timecards(workers=1):
+    """Reads in the timecards appended to the "timecards.csv" file since
+    the last read, and updates the hourly employees they are for with
+    their timecards in the whole file. With BINARY_INPUTS,
+    "timecards.bin" is read instead, and with PARTITIONED_INPUTS, the
+    current pay period's timecards. Large reads of the csv file are parsed
+    by workers processes, see ingest.InputTracker.update.
+    Output: the InputTotals of the whole file, including any malformed
+    lines that were skipped.
+    """
+    if not BINARY_INPUTS and not PARTITIONED_INPUTS:
+        apply_new_timecards(uvuEmpDat, TIMECARDS,
+                            TIMECARDS.update(workers=workers))
+        return TIMECARDS.totals
+    if BINARY_INPUTS:
+        timecards = read_binary_totals("timecards.bin", keep_values=True)
+    else:
+        timecards = _period_totals("timecards")
+    apply_timecards(uvuEmpDat, timecards)
+    return timecards
 
 
 def validate_login(username, password):  # working as designed.
@@ -80,11 +152,11 @@ def validate_login(username, password):  # working as designed.
     """
     valid_username = False
     valid_password = False
-    for employee in uvuEmpDat.emp_list:
-        if employee.id == username:
-            valid_username = True
-            if employee.password == password:
-                valid_password = True
+    employee = uvuEmpDat.find_employee(username)
+    if employee is not None:
+        valid_username = True
+        if employee.password == password:
+            valid_password = True
     return valid_username, valid_password
 
 
@@ -105,7 +177,7 @@ def login():
         username_valid, password_valid = validate_login(users_id,
                                                         user_password)
         if username_valid and password_valid:
-            employee = find_employee_by_id(users_id, uvuEmpDat.emp_list)
+            employee = uvuEmpDat.find_employee(users_id)
             if employee.permission == "admin":
                 open_admin()
             else:
@@ -171,23 +243,21 @@ def open_admin():
             employee_list.delete(record)
         # Populating the treeview with findings of the sort
         record_count = 0
-        for emp in uvuEmpDat.emp_list:
-            # Will check if the search is in the name of employee then
-            #   show
-            if lookup_record.lower() in str(emp).lower():
-                if record_count % 2 == 0:
-                    employee_list.insert('', END, values=(emp.id,
-                                                          emp.first_name, emp.last_name, emp.ssn,
-                                                          emp.phone, emp.email, emp.start_date,
-                                                          emp.end_date, str(emp.classification),
-                                                          emp.title, emp.dept), tags=("evenrows",))
-                else:
-                    employee_list.insert('', END, values=(emp.id, emp.first_name, emp.last_name,
-                                                          emp.ssn, emp.phone, emp.email,
-                                                          emp.start_date, emp.end_date,
-                                                          str(emp.classification), emp.title,
-                                                          emp.dept), tags=("oddrows",))
-                record_count += 1
+        # Only employees with the search in their name are found.
+        for emp in uvuEmpDat.search_names(lookup_record):
+            if record_count % 2 == 0:
+                employee_list.insert('', END, values=(emp.id,
+                                                      emp.first_name, emp.last_name, emp.ssn,
+                                                      emp.phone, emp.email, emp.start_date,
+                                                      emp.end_date, str(emp.classification),
+                                                      emp.title, emp.dept), tags=("evenrows",))
+            else:
+                employee_list.insert('', END, values=(emp.id, emp.first_name, emp.last_name,
+                                                      emp.ssn, emp.phone, emp.email,
+                                                      emp.start_date, emp.end_date,
+                                                      str(emp.classification), emp.title,
+                                                      emp.dept), tags=("oddrows",))
+            record_count += 1
 
     # Search frame on Admin list
     search_frame = Frame(ADMIN_WINDOW)
@@ -337,7 +407,7 @@ def open_admin():
         for selected_emp_idx in employee_list.selection():
             emp_data = employee_list.item(selected_emp_idx)
             emp_id = emp_data["values"][0]
-            emp = find_employee_by_id(emp_id, uvuEmpDat.emp_list)
+            emp = uvuEmpDat.find_employee(emp_id)
             open_employee(emp, "admin")
 
     # Double-Click to bring up employee information
@@ -589,6 +659,9 @@ def add_employee_screen():
         data_validity.append(validate_emp_data("First_Name", emp_f_name))
 
         if False not in data_validity:
+            # The ID is only taken once the employee is sure to be made,
+            #   so a cancelled or invalid form doesn't use one up.
+            new_id = uvuEmpDat.allocate_id()
             add_new_employee(uvuEmpDat, new_id, emp_f_name, emp_l_name,
                              emp_address, emp_city, emp_state, emp_zip, emp_class,
                              emp_pay_num, emp_b_day, emp_ssn, emp_phone, emp_email,
@@ -603,17 +676,10 @@ def add_employee_screen():
         
         return False
 
-    max_id = 0
-    for emp in uvuEmpDat.emp_list + uvuEmpDat.archived_list:
-        if emp.id > max_id:
-            max_id = emp.id
-
-    new_id = max_id + 1
-
     # ID Entry:
 
     Label(add_emp_window, text="Employee ID:").grid(row=1, column=1, padx=25, pady=5)
-    Label(add_emp_window, text=new_id).grid(row=1, column=2, padx=50, pady=5)
+    Label(add_emp_window, text="Assigned when created").grid(row=1, column=2, padx=50, pady=5)
 
     Label(add_emp_window, text="First Name:").grid(row=2, column=1, padx=25, pady=5)
     first_name = StringVar(add_emp_window)
@@ -1291,183 +1357,191 @@ def prompt_report_all_employees():
 
 
 def open_report_window():
+    """Opens report.csv in a window that shows one page of it at a time,
+    read through a ReportReader, so large reports open quickly without
+    being loaded into memory. Employees can be found by ID, and text
+    searched for, from the bar at the top.
+    """
+    reader = ReportReader("report.csv")
     report_window = Toplevel(login_window)
     report_window.geometry("1475x700")
-    # Create Textbox for report data
-    report_text = Text(report_window, width=120, height=100)
-    # Add report data to textbox
-    with open("report.csv", 'r', encoding="utf8") as file:
-        the_report = file.read()
-        report_text.insert("1.0", the_report)
-    report_text.pack(side=LEFT)
-    report_text.config(state='disabled')
-
-    # Scrollbar
+    # Line number of the first line shown, and of the last employee or
+    #   search match found, which is highlighted.
+    top = 0
+    found = None
+
+    # Bar with the employee ID and search boxes
+    bar_frame = Frame(report_window)
+    bar_frame.pack(side=TOP, fill=X)
+    Label(bar_frame, text="Employee ID:").pack(side=LEFT, padx=5, pady=5)
+    id_entry = Entry(bar_frame, width=12)
+    id_entry.pack(side=LEFT, pady=5)
+    Label(bar_frame, text="Search:").pack(side=LEFT, padx=5, pady=5)
+    search_entry = Entry(bar_frame, width=30)
+    search_entry.pack(side=LEFT, pady=5)
+    page_label = Label(bar_frame)
+
+    # Create Textbox for the page of report data, and its scrollbar
+    report_text = Text(report_window, width=120, height=REPORT_PAGE_LINES,
+                       wrap=NONE)
+    report_text.tag_config("found", background="yellow")
     report_scrollbar = Scrollbar(report_window)
     report_scrollbar.pack(side=RIGHT, fill=Y)
+    report_text.pack(side=LEFT, fill=BOTH, expand=True)
+
+    def show(line):
+        """Shows the page of the report starting at line.
+        """
+        nonlocal top
+        total = len(reader)
+        top = max(0, min(line, total - REPORT_PAGE_LINES))
+        bottom = min(top + REPORT_PAGE_LINES, total)
+        report_text.config(state='normal')
+        report_text.delete("1.0", END)
+        report_text.insert("1.0", "\n".join(reader.lines(top, bottom - top)))
+        if found is not None and top <= found < bottom:
+            report_text.tag_add("found", f'{found - top + 1}.0',
+                                f'{found - top + 1}.end')
+        report_text.config(state='disabled')
+        report_scrollbar.set(top / max(total, 1), bottom / max(total, 1))
+        page_label.config(text=f'Lines {top + 1}-{bottom} of {total}')
+
+    def scroll(action, amount, unit=None):
+        """Moves the page as asked by the scrollbar.
+        """
+        if action == "moveto":
+            show(int(float(amount) * len(reader)))
+        else:
+            step = REPORT_PAGE_LINES if unit == "pages" else 1
+            show(top + int(amount) * step)
 
-    # Attach scrollbar to textbox
-    report_text.config(yscrollcommand=report_scrollbar.set)
-    report_scrollbar.config(command=report_text.yview)
+    def scroll_wheel(event):
+        """Moves the page three lines up or down with the mouse wheel.
+        """
+        show(top - 3 if event.num == 4 or event.delta > 0 else top + 3)
+        return "break"
 
+    def go_to_employee():
+        """Shows the block of the employee with the ID in the ID box.
+        """
+        nonlocal found
+        try:
+            id_num = int(id_entry.get())
+        except ValueError:
+            showinfo("Employee ID", "Please enter an employee ID number.",
+                     icon=WARNING)
+            return
+        line = reader.find_employee(id_num)
+        if line is None:
+            showinfo("Not Found", f'Employee {id_num} is not in the report.')
+            return
+        found = line
+        show(line)
+
+    def find_next():
+        """Shows the next line containing the text in the search box,
+        starting again from the top after the last one.
+        """
+        nonlocal found
+        text = search_entry.get()
+        start = top if found is None else found + 1
+        line = reader.search(text, start)
+        if line is None and start:
+            line = reader.search(text)
+        if line is None:
+            showinfo("Not Found", f'"{text}" is not in the report.')
+            return
+        found = line
+        show(line)
+
+    def close():
+        """Closes the report window and the report file mapped into memory.
+        """
+        report_window.destroy()
+        reader.close()
+
+    Button(bar_frame, bg='DarkSeaGreen', text="Go to ID",
+           command=go_to_employee).pack(side=LEFT, padx=5, pady=5)
+    Button(bar_frame, bg='DarkSeaGreen', text="Find Next",
+           command=find_next).pack(side=LEFT, padx=5, pady=5)
+    page_label.pack(side=RIGHT, padx=5, pady=5)
+    id_entry.bind("<Return>", lambda event: go_to_employee())
+    search_entry.bind("<Return>", lambda event: find_next())
+
+    # Attach scrollbar, mouse wheel and page keys to the pages
+    report_scrollbar.config(command=scroll)
+    for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+        report_text.bind(sequence, scroll_wheel)
+    report_window.bind("<Prior>", lambda event: show(top - REPORT_PAGE_LINES))
+    report_window.bind("<Next>", lambda event: show(top + REPORT_PAGE_LINES))
+    report_window.bind("<Up>", lambda event: show(top - 1))
+    report_window.bind("<Down>", lambda event: show(top + 1))
+    report_window.protocol("WM_DELETE_WINDOW", close)
+
+    show(0)
     report_window.mainloop()
 
 
+def _input_totals(employee, timecards, receipts):
+    """Returns the total and count of the timecards or receipts read for an
+    employee, for the pay ledger. Archived employees don't have any read.
+    """
+    if uvuEmpDat.find_employee(employee.id) is None:
+        return 0.0, 0
+    totals = timecards if str(employee.classification) == "hourly" \
+        else receipts
+    return totals.totals.get(employee.id, 0.0), \
+        totals.counts.get(employee.id, 0)
+
+
 # Should this report be a payment report, just a general info report, or
 #   both?
-def generate_report_all_employees(include_archived):
+def generate_report_all_employees(include_archived, workers=None,
+                                  render_workers=None):
     """Generates a report of all employees in the database, in the form of
     a text document titled report.csv. The report will include the info of
     archived employees if include_archived is True, and will not if it is
-    False.
+    False. What each employee is paid is also recorded in the pay ledger
+    for the current pay period.
+
+    Pay comes from Employee.preview_report, so running the report again
+    reuses it for unchanged employees, and only the employees changed
+    since the last report are rendered again. The timecards and receipts
+    appended since the last report are read by read_timecards and
+    read_receipts.
+
+    If workers is more than 1 (PAYROLL_WORKERS by default), large reads
+    of the input files are parsed by that many worker processes. If
+    render_workers is more than 1 (REPORT_WORKERS by default), the report
+    is rendered by that many worker processes. The report is the same
+    either way.
     """
     # If include_archived, then emp_list will be all employees
     if include_archived:
         #   (from EmployeeDatabase.archived and EmployeeDatabase.database).
-        emp_list = uvuEmpDat.emp_list + uvuEmpDat.archived_list
+        emp_list = chain(uvuEmpDat.emp_list, uvuEmpDat.archived_list)
     else:  # Otherwise emp_list will be all non-archived employees (from
         #   EmployeeDatabase.database).
         emp_list = uvuEmpDat.emp_list
 
-    read_timecards()
-    read_receipts()
-    string = ""
-    msg = "A report has been saved to 'report.csv' as well.\n" \
-          "All Employee Report:\n\n"
-
-    with open("report.csv", "w", encoding="utf8") as report:
-        for employee in emp_list:
-            # Write a line to "report.csv" that reports on all data
-            #   members for the employee.
-            if str(employee.classification) == "hourly":
-                if str(employee.pay_method) == "direct deposit":
-                    string = f"Employee ID: {employee.id}       Name: " \
-                             f"{employee.name}         Address: " \
-                             f"{employee.full_address()}\n" \
-                             f"Classification: {employee.classification}    " \
-                             f"Hourly pay: " \
-                             f"${employee.classification.hourly_rate:.2f}    " \
-                             f"   Payment method: {employee.pay_method}\n" \
-                             f"Routing num: {employee.pay_method.route_num}  " \
-                             f" Account num: " \
-                             f"{employee.pay_method.account_num} Date of " \
-                             f"birth: {employee.birth_date}\n" \
-                             f"SSN: {employee.ssn}          Phone: " \
-                             f"{employee.phone}     Email: {employee.email}\n" \
-                             f"Start date: {employee.start_date}     " \
-                             f"End date: {employee.end_date}\n" \
-                             f"Title: {employee.title}           Dept: " \
-                             f"{employee.dept}\n" \
-                             f"Permission level: {employee.permission}\n\n"
-                    report.write(string)
-                elif str(employee.pay_method) == "mail":
-                    string = f"Employee ID: {employee.id}        Name: " \
-                             f"{employee.name}   Address: " \
-                             f"{employee.full_address()}\n" \
-                             f"Classification: {employee.classification}     " \
-                             f"Hourly pay: " \
-                             f"${employee.classification.hourly_rate:.2f}    " \
-                             f"   Payment method: {employee.pay_method}\n" \
-                             f"Date of birth: {employee.birth_date}  SSN: " \
-                             f"{employee.ssn}\n" \
-                             f"Phone: {employee.phone}       Email: " \
-                             f"{employee.email}\n" \
-                             f"Start date: {employee.start_date}       End " \
-                             f"date: {employee.end_date}\n" \
-                             f"Title: {employee.title}      Dept: " \
-                             f"{employee.dept}\n" \
-                             f"Permission level: " \
-                             f"{employee.permission}\n\n"
-                    report.write(string)
-            elif str(employee.classification) == "salary":
-                if str(employee.pay_method) == "direct deposit":
-                    string = f"Employee ID: {employee.id}        Name: " \
-                             f"{employee.name}      Address: " \
-                             f"{employee.full_address()}\n" \
-                             f"Classification: {employee.classification}     " \
-                             f"Salary: ${employee.classification.salary:.2f} " \
-                             f"   Payment method: {employee.pay_method}\n" \
-                             f"Routing number: " \
-                             f"{employee.pay_method.route_num} " \
-                             f"Account number: " \
-                             f"{employee.pay_method.account_num}    Date of " \
-                             f"birth: {employee.birth_date}\n" \
-                             f"SSN: {employee.ssn}           Phone: " \
-                             f"{employee.phone}    Email: {employee.email}\n" \
-                             f"Start date: {employee.start_date}       End " \
-                             f"date: {employee.end_date}\n" \
-                             f"Title: {employee.title}           Dept: " \
-                             f"{employee.dept}\n" \
-                             f"Permission level: {employee.permission}\n\n"
-                    report.write(string)
-                elif str(employee.pay_method) == "mail":
-                    string = f"Employee ID: {employee.id}      Name: " \
-                             f"{employee.name}    Address: " \
-                             f"{employee.full_address()}\n" \
-                             f"Classification: {employee.classification}   " \
-                             f"Salary: ${employee.classification.salary:.2f} " \
-                             f"      Payment method: {employee.pay_method}\n" \
-                             f"Date of birth: {employee.birth_date} SSN: " \
-                             f"{employee.ssn}\n" \
-                             f"Phone: {employee.phone}     Email: " \
-                             f"{employee.email}\n" \
-                             f"Start date: {employee.start_date}     End " \
-                             f"date: {employee.end_date}\n" \
-                             f"Title: {employee.title}           Dept: " \
-                             f"{employee.dept}\n" \
-                             f"Permission level: {employee.permission}\n\n"
-                    report.write(string)
-            elif str(employee.classification) == "commissioned":
-                if str(employee.pay_method) == "direct deposit":
-                    string = f"Employee ID: {employee.id}             " \
-                             f"Name: {employee.name}      Address: " \
-                             f"{employee.full_address()}\n" \
-                             f"Classification: {employee.classification}    " \
-                             f"Salary: ${employee.classification.salary:.2f} " \
-                             f"         Commission rate: " \
-                             f"${employee.classification.commission_rate:.2f}" \
-                             f"\n" \
-                             f"Payment method: {employee.pay_method}  Routing" \
-                             f" number: {employee.pay_method.route_num} " \
-                             f"Account number: " \
-                             f"{employee.pay_method.account_num}\n" \
-                             f"Date of birth: {employee.birth_date}        " \
-                             f"SSN: {employee.ssn}           Phone: " \
-                             f"{employee.phone}\n" \
-                             f"Email: {employee.email}    Start date: " \
-                             f"{employee.start_date}      End date: " \
-                             f"{employee.end_date}\n" \
-                             f"Title: {employee.title}         Dept: " \
-                             f"{employee.dept}\n" \
-                             f"Permission level: {employee.permission}\n\n"
-                    report.write(string)
-                elif str(employee.pay_method) == "mail":
-                    string = f"Employee ID: {employee.id}          Name:" \
-                             f" {employee.name}    Address: " \
-                             f"{employee.full_address()}\n" \
-                             f"Classification: {employee.classification} " \
-                             f"Salary: ${employee.classification.salary:.2f} " \
-                             f"       Commission rate: " \
-                             f"${employee.classification.commission_rate:.2f}" \
-                             f"\n" \
-                             f"Payment method: {employee.pay_method}         " \
-                             f"Date of birth: {employee.birth_date}\n" \
-                             f"SSN: {employee.ssn}             Phone: " \
-                             f"{employee.phone}     Email: {employee.email}\n" \
-                             f"Start date: {employee.start_date}        End " \
-                             f"date: {employee.end_date}\n" \
-                             f"Title: {employee.title}               Dept: " \
-                             f"{employee.dept}\n" \
-                             f"Permission level: {employee.permission}\n\n"
-                    report.write(string)
-
-            # Save message for report GUI.
-            msg += string
-
-            # Write a line to "report.csv" stating what the employee will
-            #   be paid.
-            pay_report = employee.payment_report()
-            report.write(f"\t{pay_report}\n\n\n")
+    if workers is None:
+        workers = PAYROLL_WORKERS
+    # More workers than CPUs only adds the cost of starting them.
+    workers = min(workers, os.cpu_count() or 1)
+    timecards = read_timecards(workers)
+    receipts = read_receipts(workers)
+    input_errors = timecards.error_message("timecards.csv") + \
+        receipts.error_message("receipts.csv")
+    if input_errors:
+        showinfo("Input Errors", input_errors, icon=WARNING)
+    REPORT_CACHE.invalidate(uvuEmpDat.take_changed())
+    write_report(emp_list,
+                 ledger_inputs=partial(_input_totals, timecards=timecards,
+                                       receipts=receipts),
+                 ledger=_pay_ledger(), period=pay_period(),
+                 csv_export=CSV_EXPORT, jsonl_export=JSONL_EXPORT,
+                 workers=REPORT_WORKERS if render_workers is None
+                 else render_workers, cache=REPORT_CACHE)
     # Opens the report in a GUI window
     open_report_window()
 
@@ -1523,51 +1597,37 @@ def generate_pay_stub(employee):
 
         pay_stub_window.mainloop()
 
-    with open("report.csv", 'r', encoding="utf8") as report:
-        line_count = 0
-        for line in report:
-            line_count += 1
-            # Check if the line is a line with an employee id
-            # (only certain lines have them). Skip iteration if not.
-            if (line_count - 1) % 11 != 0:
-                continue
-            info = line.strip().split(' ')
-            if int(info[2]) == employee.id:
-                for _ in range(7):
-                    report.readline()
-                pay_info = report.readline().split(' ')
-
-                # Get the payment amount without the dollar sign? Use [1:]
-                pay_amount = pay_info[2][1:]
-                if str(employee.pay_method) == "direct deposit":
-                    pay_message = f"Transferred ${pay_amount} for " \
-                                  f"{employee.name} to {employee.pay_method.route_num} at " \
-                                  f"{employee.pay_method.account_num}."
-                elif str(employee.pay_method) == "mail":
-                    pay_message = f"Mailed ${pay_amount} to " \
-                                  f"{employee.name} at {employee.full_address()}."
-                rate_message_1 = ""
-                rate_message_2 = ""
-                if str(employee.classification) == "hourly":
-                    rate_message_1 = f'Hourly pay: ${employee.classification.hourly_rate}'
-                elif str(employee.classification) == "salary":
-                    rate_message_1 = f'Salary: ${employee.classification.salary}'
-                elif str(employee.classification) == "commissioned":
-                    rate_message_1 = f'Salary: ${employee.classification.salary}'
-                    rate_message_2 = f'Commission rate: ${employee.classification.commission_rate}'
-                else:
-                    raise Exception(f'Error with employee "{employee.name}\'s" classification')
-
-                name_message = f'Employee Name: {employee.name}'
-
-                pay_stub_screen(name_message, pay_message, rate_message_1, rate_message_2)
-
-                break
-
-            # Else:
-            # Show an error pop-up message, that the employee was not payed in
-            #   the last pay period (may happen before any "report.csv" file
-            #   is generated).
+    last_pay = _pay_ledger().last_pay(employee.id)
+    if last_pay is None:
+        # The employee was not paid in any pay period yet (may happen
+        #   before any report is generated).
+        showinfo("No Pay Stub", f"{employee.name} has not been paid yet.",
+                 icon=WARNING)
+        return
+
+    pay_amount = f'{last_pay["Gross"]:.2f}'
+    if str(employee.pay_method) == "direct deposit":
+        pay_message = f"Transferred ${pay_amount} for " \
+                      f"{employee.name} to {employee.pay_method.route_num} at " \
+                      f"{employee.pay_method.account_num}."
+    elif str(employee.pay_method) == "mail":
+        pay_message = f"Mailed ${pay_amount} to " \
+                      f"{employee.name} at {employee.full_address()}."
+    rate_message_1 = ""
+    rate_message_2 = ""
+    if str(employee.classification) == "hourly":
+        rate_message_1 = f'Hourly pay: ${employee.classification.hourly_rate}'
+    elif str(employee.classification) == "salary":
+        rate_message_1 = f'Salary: ${employee.classification.salary}'
+    elif str(employee.classification) == "commissioned":
+        rate_message_1 = f'Salary: ${employee.classification.salary}'
+        rate_message_2 = f'Commission rate: ${employee.classification.commission_rate}'
+    else:
+        raise Exception(f'Error with employee "{employee.name}\'s" classification')
+
+    name_message = f'Employee Name: {employee.name}'
+
+    pay_stub_screen(name_message, pay_message, rate_message_1, rate_message_2)
 
 
 def validate_emp_data(data_type, data, extra_data=0):
@@ -0,0 +1,414 @@
+"""
+Benchmarks for the UVU Employee Database backend.
+
+generate_data writes a realistic set of data files (employees.csv,
+archived.csv, admins.csv, timecards.csv and receipts.csv) of any size, in
+the same layout as the shipped ones. run_benchmarks times the main
+operations of the app on generated data, without opening the GUI, and
+adds the results to a JSON file so they can be compared between releases.
+
+Run this file to benchmark 10k, 100k and 1M employees, or give the sizes,
+e.g.
+    python benchmark.py 10000 100000
+Run it with --memory to print the memory used per Employee object, and
+per employee kept in plain objects with a __dict__, for comparison.
+"""
+
+import io
+import os
+import csv
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import tracemalloc
+from array import array
+from datetime import datetime
+
+from employee_database import Employee, EmployeeDB
+from ingest import InputTracker
+from payroll import PayLedger, apply_new_receipts, apply_new_timecards, \
+    pay_period, run_payroll_from_files
+from report import ReportCache, write_report
+from storage import FIELDNAMES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SIZES = (10000, 100000, 1000000)
+RESULTS_FILE = "benchmark_results.json"
+
+_FIRST_NAMES = ("Karina", "TaShya", "Rooney", "Jin", "Matt", "Yeff",
+                "Geoffrey", "Maria", "Ahmed", "Olivia", "Noah", "Emma",
+                "Liam", "Ava", "Lucas", "Mia", "Ethan", "Sofia", "Mason",
+                "Isabella", "Logan", "Amelia", "Elijah", "Harper", "Aiden",
+                "Evelyn", "Caleb", "Abigail", "Ryan", "Ella")
+_LAST_NAMES = ("Gay", "Snow", "Alvarado", "Morrison", "Ackerman",
+               "Yefferson", "Southhampton", "Garcia", "Smith", "Johnson",
+               "Williams", "Brown", "Jones", "Miller", "Davis", "Wilson",
+               "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+               "Lee", "Perez", "Thompson", "White", "Harris", "Clark",
+               "Lewis", "Young")
+_STREETS = ("Vitae St.", "Hendrerit St.", "Nisl. St.", "Mulberry Street",
+            "Main St.", "Center St.", "Oak Ave.", "University Pkwy",
+            "State St.", "Canyon Rd.")
+_CITIES = (("Atlanta", "GA", "(404)"), ("College", "AK", "(907)"),
+           ("Gillette", "WY", "(307)"), ("Bellingham", "WA", "(360)"),
+           ("Orem", "UT", "(801)"), ("Provo", "UT", "(801)"),
+           ("Denver", "CO", "(303)"), ("Boise", "ID", "(208)"),
+           ("Phoenix", "AZ", "(602)"), ("Reno", "NV", "(775)"))
+_JOBS = (("Manager", "Marketing"), ("Manager", "Production"),
+         ("Researcher", "R&D"), ("Representative", "Sales"),
+         ("Personnel", "HR"), ("Analyst", "Marketing"),
+         ("Essential Worker", "Production"), ("Test Engineer", "QA"))
+_EMAIL_DOMAINS = ("gmail.com", "yahoo.com", "uvu.edu", "test.com")
+
+
+def _date(rng, first_year, last_year):
+    """Returns a random date formatted like the dates in employees.csv.
+    """
+    return f'{rng.randint(1, 12)}/{rng.randint(1, 28)}/' \
+           f'{rng.randint(first_year, last_year)}'
+
+
+def _employee_row(rng, id_num, archived=False):
+    """Returns a random employees.csv row, as a list in FIELDNAMES order.
+    Pay fields that don't apply are -1, as EmployeeDB writes them.
+    """
+    first_name = rng.choice(_FIRST_NAMES)
+    last_name = rng.choice(_LAST_NAMES)
+    city, state, area_code = rng.choice(_CITIES)
+    title, dept = rng.choice(_JOBS)
+    classification = rng.choices((1, 2, 3), (5, 3, 2))[0]
+    pay_method = rng.choice((1, 2))
+    salary = hourly = commission = route = account = -1
+    if classification == 1:
+        hourly = round(rng.uniform(12, 70), 2)
+    else:
+        salary = round(rng.uniform(30000, 120000), 2)
+        if classification == 3:
+            commission = rng.randint(10, 40)
+    if pay_method == 1:
+        route = f'{rng.randint(10000000, 99999999)}-{rng.randint(0, 9)}'
+        account = f'{rng.randint(100000, 999999)}-' \
+                  f'{rng.randint(0, 9999):04}'
+    return [id_num, f'{first_name} {last_name}',
+            f'{rng.randint(1, 9999)} {rng.choice(_STREETS)}', city, state,
+            rng.randint(10000, 99999), classification, pay_method, salary,
+            hourly, commission, route, account, _date(rng, 1950, 2004),
+            f'{rng.randint(100, 899)}-{rng.randint(10, 99)}-'
+            f'{rng.randint(1000, 9999)}',
+            f'{area_code}{rng.randint(200, 999)}-{rng.randint(0, 9999):04}',
+            f'{first_name[:3].lower()}{last_name.lower()}{id_num % 1000}@'
+            f'{rng.choice(_EMAIL_DOMAINS)}',
+            _date(rng, 2000, 2021), _date(rng, 2021, 2022) if archived else "",
+            title, dept, "admin" if rng.random() < 0.05 else "employee",
+            f'pw{rng.getrandbits(40):x}']
+
+
+def generate_data(num_employees, directory=".", seed=0, archived_share=0.05,
+                  days=10):
+    """Writes a realistic data set for num_employees active employees to
+    directory: employees.csv, archived.csv (archived_share as many again),
+    an empty admins.csv, and timecards.csv and receipts.csv with a line of
+    days timecards for every hourly employee and of about half as many
+    receipts for every commissioned one.
+    """
+    rng = random.Random(seed)
+    num_archived = int(num_employees * archived_share)
+    ids = rng.sample(range(100000, 100000 + 10 * (num_employees +
+                                                   num_archived)),
+                     num_employees + num_archived)
+    with open(os.path.join(directory, "employees.csv"), "w", newline='',
+              encoding="utf8") as employees, \
+            open(os.path.join(directory, "timecards.csv"), "w",
+                 encoding="utf8") as timecards, \
+            open(os.path.join(directory, "receipts.csv"), "w",
+                 encoding="utf8") as receipts:
+        writer = csv.writer(employees)
+        writer.writerow(FIELDNAMES)
+        for id_num in ids[:num_employees]:
+            row = _employee_row(rng, id_num)
+            writer.writerow(row)
+            if row[6] == 1:
+                timecards.write(f'{id_num},' + ",".join(
+                    f'{rng.uniform(4, 9):.1f}' for _ in range(days)) + "\n")
+            elif row[6] == 3:
+                receipts.write(f'{id_num},' + ",".join(
+                    f'{rng.uniform(50, 250):.2f}'
+                    for _ in range(rng.randint(1, days))) + "\n")
+    with open(os.path.join(directory, "archived.csv"), "w", newline='',
+              encoding="utf8") as archived:
+        writer = csv.writer(archived)
+        writer.writerow(FIELDNAMES)
+        for id_num in ids[num_employees:]:
+            writer.writerow(_employee_row(rng, id_num, archived=True))
+    with open(os.path.join(directory, "admins.csv"), "w",
+              encoding="utf8") as admins:
+        admins.write("ID,Name\n")
+
+
+def _timed(function, *args, **kwargs):
+    """Returns the seconds a call takes, and what it returns.
+    """
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def benchmark_size(num_employees, operations=100, seed=0, workers=4):
+    """Generates data for num_employees in a temporary directory, and times
+    the operations of the app on it. Edits, archives and searches are done
+    operations times each. Payroll from the input files is timed with one
+    process and with workers processes.
+
+    Output: a dict of operation name -> seconds. Per-operation timings are
+    averages.
+    """
+    directory = tempfile.mkdtemp(prefix="uvu_benchmark_")
+    cwd = os.getcwd()
+    results = {}
+    try:
+        results["generate_data"] = _timed(generate_data, num_employees,
+                                          directory, seed)[0]
+        os.chdir(directory)
+        rng = random.Random(seed)
+
+        results["load"], database = _timed(EmployeeDB)
+        results["load_from_snapshot"], database = _timed(EmployeeDB)
+        results["load_lazy"] = _timed(EmployeeDB, lazy=True,
+                                      snapshot=False)[0]
+
+        ids = [employee.id for employee in database.emp_list]
+        targets = rng.sample(ids, min(operations, len(ids) // 2))
+        elapsed = 0.0
+        for id_num in targets:
+            elapsed += _timed(database.edit_employee, id_num, ["Phone"],
+                              [f'(801)555-{rng.randint(0, 9999):04}'])[0]
+        results["edit_employee"] = elapsed / len(targets)
+
+        results["read_timecards"] = _timed(
+            _apply_tracked, database, "timecards.csv", apply_new_timecards)[0]
+        results["read_receipts"] = _timed(
+            _apply_tracked, database, "receipts.csv", apply_new_receipts)[0]
+        results["payroll_1_worker"] = _timed(
+            run_payroll_from_files, database.emp_list)[0]
+        results[f"payroll_{workers}_workers"] = _timed(
+            run_payroll_from_files, database.emp_list, workers=workers)[0]
+
+        ledger = PayLedger("pay_ledger.db")
+        cache = ReportCache()
+        cache.invalidate(database.take_changed())
+        results["generate_report"] = _timed(
+            write_report, database.emp_list, ledger=ledger,
+            period=pay_period(), cache=cache)[0]
+        database.edit_employee(targets[0], ["Phone"], ["(801)555-0000"])
+        cache.invalidate(database.take_changed())
+        results["refresh_report"] = _timed(
+            write_report, database.emp_list, ledger=ledger,
+            period=pay_period(), cache=cache)[0]
+        ledger.close()
+
+        results["search_names"] = sum(
+            _timed(database.search_names,
+                   rng.choice(_LAST_NAMES)[:rng.randint(2, 5)])[0]
+            for _ in range(operations)) / operations
+        results["query"] = sum(
+            _timed(database.query, dept=rng.choice(_JOBS)[1])[0]
+            for _ in range(operations)) / operations
+
+        elapsed = 0.0
+        for id_num in rng.sample(sorted(set(ids) - set(targets)),
+                                 len(targets)):
+            elapsed += _timed(database.archive_employee, id_num)[0]
+        results["archive_employee"] = elapsed / len(targets)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def _apply_tracked(database, file_name, apply):
+    """Reads an input file into the database the way
+    Main_UVU.read_timecards does the first time, with a new InputTracker.
+    """
+    tracker = InputTracker(file_name)
+    apply(database, tracker, tracker.update())
+
+
+def run_benchmarks(sizes=SIZES, results_file=RESULTS_FILE, operations=100):
+    """Benchmarks each number of employees in sizes, and adds the results,
+    with the date, Python version and platform, to the list of runs in
+    results_file.
+
+    Output: the results of this run.
+    """
+    run = {"date": datetime.now().isoformat(timespec="seconds"),
+           "python": platform.python_version(),
+           "platform": platform.platform(),
+           "numpy": np.__version__ if np is not None else None,
+           "cpus": os.cpu_count(),
+           "results": {}}
+    for size in sizes:
+        run["results"][str(size)] = benchmark_size(size, operations)
+
+    runs = []
+    if os.path.exists(results_file):
+        with open(results_file, encoding="utf8") as results:
+            runs = json.load(results)
+    runs.append(run)
+    with open(results_file, "w", encoding="utf8") as results:
+        json.dump(runs, results, indent=2)
+    return run
+
+
+def _sample_csv(num_rows, source="employees.csv"):
+    """Returns the text of an employees csv file with num_rows rows, made
+    by repeating the rows of the source file with new IDs.
+    """
+    with open(source, encoding="utf8") as database:
+        rows = list(csv.DictReader(database))
+    text = io.StringIO()
+    writer = csv.DictWriter(text, FIELDNAMES)
+    writer.writeheader()
+    for index in range(num_rows):
+        row = dict(rows[index % len(rows)])
+        row["ID"] = 100000 + index
+        writer.writerow(row)
+    return text.getvalue()
+
+
+def measure_employee_memory(num_rows=100000, source="employees.csv"):
+    """Measures how much memory the Employee objects for num_rows csv rows
+    take, including their classification and pay method objects and the
+    strings they keep. The same rows are also measured kept the way they
+    were before the employee classes had __slots__, see _DictEmployee.
+
+    Output: the average number of bytes per employee, and per employee of
+    the dict-based baseline.
+    """
+    text = _sample_csv(num_rows, source)
+    return _measure_rows(text, _employee), _measure_rows(text, _DictEmployee)
+
+
+def _measure_rows(text, build):
+    """Returns the average number of bytes kept by build(row) for the rows
+    of a csv text.
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    employees = [build(row) for row in reader]
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return used / len(employees)
+
+
+def _employee(row):
+    """Returns the Employee of a csv row.
+    """
+    employee = Employee(None, None, None, None, None, None, None, None, None)
+    employee.populate_from_row(row)
+    return employee
+
+
+class _DictHourly:
+    """Hourly, kept in a per-instance __dict__ instead of __slots__.
+    """
+
+    def __init__(self, hourly_rate):
+        self.hourly_rate = hourly_rate
+        self.timecards = array("d")
+        self._total_hours = 0.0
+        self._version = 0
+
+
+class _DictSalary:
+    """Salary, kept in a per-instance __dict__ instead of __slots__.
+    """
+
+    def __init__(self, salary):
+        self.salary = salary
+
+
+class _DictCommissioned(_DictSalary):
+    """Commissioned, kept in a per-instance __dict__ instead of __slots__.
+    """
+
+    def __init__(self, salary, commission_rate):
+        super().__init__(salary)
+        self.commission_rate = commission_rate
+        self.receipts = array("d")
+        self._total_receipts = 0.0
+        self._version = 0
+
+
+class _DictMethod:
+    """A pay method, kept in a per-instance __dict__ instead of __slots__.
+    """
+
+    def __init__(self, employee, route_num=None, account_num=None):
+        self.employee = employee
+        if route_num is not None:
+            self.route_num = route_num
+            self.account_num = account_num
+
+
+class _DictEmployee:
+    """The baseline for measure_employee_memory: the attributes
+    Employee.populate_from_row sets, kept in a per-instance __dict__, as
+    they were before the employee classes had __slots__, with no strings
+    interned.
+    """
+
+    def __init__(self, row):
+        self.id = int(row["ID"])
+        self.name = row["Name"]
+        split_name = self.name.split(" ")
+        self.first_name = split_name[0]
+        self.last_name = split_name[-1]
+        class_num = int(row["Classification"])
+        if class_num == 1:
+            self.classification = _DictHourly(float(row["Hourly"]))
+        elif class_num == 2:
+            self.classification = _DictSalary(float(row["Salary"]))
+        else:
+            self.classification = _DictCommissioned(
+                float(row["Salary"]), float(row["Commission"]))
+        self.ssn = row["SSN"]
+        self.phone = row["Phone"]
+        self.email = row["Email"]
+        self.address = row["Address"]
+        self.city = row["City"]
+        self.state = row["State"]
+        self.zip = row["Zip"]
+        if int(row["Pay_Method"]) == 1:
+            self.pay_method = _DictMethod(self, row["Route"], row["Account"])
+        else:
+            self.pay_method = _DictMethod(self)
+        self.birth_date = row["Birth_Date"]
+        self.start_date = row["Start_Date"]
+        self.end_date = row["End_Date"]
+        self.title = row["Title"]
+        self.dept = row["Dept"]
+        self.permission = row["Permission"]
+        self.password = row["Password"]
+        self._preview = None
+
+
+if __name__ == '__main__':
+    if "--memory" in sys.argv[1:]:
+        used, baseline = measure_employee_memory()
+        print(f'Bytes per employee: {used:.0f} '
+              f'(dict-based baseline: {baseline:.0f})')
+    else:
+        sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+        for size, timings in run_benchmarks(sizes)["results"].items():
+            print(f'{size} employees:')
+            for name, seconds in timings.items():
+                print(f'  {name:20} {seconds:10.4f} s')
@@ -4,6 +4,15 @@ This module contains all of the necessary code to run the backend of the employe
 
 import os
 import csv
+import gc
+import sys
+import weakref
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from storage import FIELDNAMES, CSVStorage, SQLiteStorage, read_snapshot, \
+    write_snapshot
 
 
 class Classification:
@@ -11,6 +20,8 @@ class Classification:
     calculating how much they will be paid. An abstract class.
     """
 
+    __slots__ = ()
+
     def __init__(self):
         """Initialize the abstract class.
         """
@@ -20,6 +31,18 @@ class Classification:
         classes based on payment type.
         """
 
+    def preview_pay(self):
+        """Returns the pay calculate_pay would return, without using up
+        any timecards or receipts.
+        """
+
+    def pay_key(self):
+        """Returns a small tuple of everything the employee's pay depends
+        on, which changes whenever their pay would. Timecards and receipts
+        are stood for by a version number, which goes up whenever they
+        change, so the key doesn't copy them.
+        """
+
     def __str__(self):
         """Returns the employee's payment type, i.e. the name of the
         class.
@@ -34,32 +57,82 @@ class Classification:
 class Hourly(Classification):
     """Used for tracking the payment rate of an hourly-paid employee, and
     to store the hours they've worked, and calculate their pay.
+
+    The timecards are kept in an array of floats, which takes much less
+    memory than a list, along with their running total. They should only
+    be changed through add_timecard and set_timecards, which keep the
+    total and the version pay_key uses up to date.
     """
 
+    __slots__ = ("hourly_rate", "timecards", "_total_hours", "_version")
+
     def __init__(self, hourly_rate):
         """Initialize the hourly employee's data members, with no
         timecards stored.
         """
         super().__init__()
         self.hourly_rate = float(hourly_rate)
-        self.timecards = []
+        self.timecards = array("d")
+        self._total_hours = 0.0
+        self._version = 0
 
     def add_timecard(self, hours):
         """Adds the hours worked in a day to the hourly employee's
         timecards record.
         """
         self.timecards.append(hours)
+        self._total_hours += hours
+        self._version += 1
 
-    def calculate_pay(self):
-        """Calculates the amount that will be paid to the hourly employee,
-        hours worked x hourly rate.
+    def set_timecards(self, timecards):
+        """Replaces the timecards record with the hours of the given
+        timecards, in order, e.g. those read by an ingest.InputTracker.
+        """
+        self.timecards = array("d", timecards)
+        total = 0.0
+        for hours in self.timecards:
+            total += hours
+        self._total_hours = total
+        self._version += 1
+
+    @property
+    def timecard_count(self):
+        """The number of timecards recorded.
+        """
+        return len(self.timecards)
+
+    def total_hours(self):
+        """Returns the total hours of the timecards recorded, added up in
+        the order they were recorded.
+        """
+        return self._total_hours
+
+    def preview_pay(self):
+        """Returns what calculate_pay would pay, without clearing the
+        timecards.
         """
         payment = 0
         for hours in self.timecards:
             payment += hours * self.hourly_rate
 
+        return payment
+
+    def pay_key(self):
+        """Returns the rate and the version of the timecards the pay
+        depends on.
+        """
+        return 1, self.hourly_rate, self._version
+
+    def calculate_pay(self):
+        """Calculates the amount that will be paid to the hourly employee,
+        hours worked x hourly rate.
+        """
+        payment = self.preview_pay()
+
         # Clear timecards so they are not reused.
-        self.timecards = []
+        self.timecards = array("d")
+        self._total_hours = 0.0
+        self._version += 1
 
         return payment
 
@@ -79,12 +152,24 @@ class Salary(Classification):
     their pay.
     """
 
+    __slots__ = ("salary",)
+
     def __init__(self, salary):
         """Initialize the salaried employee's data members.
         """
         super().__init__()
         self.salary = float(salary)
 
+    def preview_pay(self):
+        """Returns what calculate_pay would pay.
+        """
+        return self.salary / 24
+
+    def pay_key(self):
+        """Returns the salary the pay depends on.
+        """
+        return 2, self.salary
+
     def calculate_pay(self):
         """Calculates the amount that will be paid to the salaried
         employee, 1/24th of their salary.
@@ -106,35 +191,84 @@ class Salary(Classification):
 
 class Commissioned(Salary):
     """Used for tracking the salary of a commissioned employee and storing
-    their commission rate and the commissions they've made. Also used to
-    calculate their pay.
+    their commission rate and the commissions they've made, in an array
+    of floats, along with their running total. Also used to calculate
+    their pay. The receipts should only be changed through add_receipt
+    and set_receipts, which keep the total and the version pay_key uses
+    up to date.
     """
 
+    __slots__ = ("commission_rate", "receipts", "_total_receipts",
+                 "_version")
+
     def __init__(self, salary, commission_rate):
         """Initialize the commissioned employee's data members, with no
         commission receipts stored.
         """
         super().__init__(salary)
         self.commission_rate = float(commission_rate)
-        self.receipts = []
+        self.receipts = array("d")
+        self._total_receipts = 0.0
+        self._version = 0
 
     def add_receipt(self, receipt):
         """Adds the number of commissions made in a day to the employee's
         receipts record.
         """
         self.receipts.append(receipt)
+        self._total_receipts += receipt
+        self._version += 1
+
+    def set_receipts(self, receipts):
+        """Replaces the receipts record with the given receipts, in order,
+        e.g. those read by an ingest.InputTracker.
+        """
+        self.receipts = array("d", receipts)
+        total = 0.0
+        for receipt in self.receipts:
+            total += receipt
+        self._total_receipts = total
+        self._version += 1
+
+    @property
+    def receipt_count(self):
+        """The number of receipts recorded.
+        """
+        return len(self.receipts)
+
+    def total_receipts(self):
+        """Returns the total of the receipts recorded, added up in the
+        order they were recorded.
+        """
+        return self._total_receipts
+
+    def preview_pay(self):
+        """Returns what calculate_pay would pay, without clearing the
+        receipts.
+        """
+        payment = super().calculate_pay()
+        for receipt in self.receipts:
+            payment += self.commission_rate * receipt
+
+        return payment
+
+    def pay_key(self):
+        """Returns the rates and the version of the receipts the pay
+        depends on.
+        """
+        return 3, self.salary, self.commission_rate, self._version
 
     def calculate_pay(self):
         """Calculates the amount that will be paid to the commissioned
         employee, 1/24th of their salary, and their commissions x
         commission rate.
         """
-        payment = super().calculate_pay()
-        for receipt in self.receipts:
-            payment += self.commission_rate * receipt
+        payment = self.preview_pay()
 
         # Clear receipts so they are not reused.
-        self.receipts = []
+        self.receipts = array("d")
+        self._total_receipts = 0.0
+        self._version += 1
 
         return payment
 
@@ -176,6 +310,8 @@ class PayMethod():
     message about how and how much they will be paid. An abstract class.
     """
 
+    __slots__ = ("employee",)
+
     def __init__(self, employee):
         """Initialize data members.
 
@@ -188,6 +324,11 @@ class PayMethod():
         will be paid, and in what method.
         """
 
+    def message_key(self):
+        """Returns a tuple of everything payment_message depends on,
+        besides the amount.
+        """
+
     def num(self):
         """Returns an integer that represents the payment method in the
         data file.
@@ -200,6 +341,8 @@ class DirectMethod(PayMethod):
     how much they will be paid via direct deposit on their next payday.
     """
 
+    __slots__ = ("route_num", "account_num")
+
     def __init__(self, employee, route_num, account_num):
         """Initialize data members for direct deposit. Keeps track of
         associated employee, their bank's routing number, and their bank
@@ -216,6 +359,11 @@ class DirectMethod(PayMethod):
         return f'Will transfer ${amount:.2f} for {self.employee.name} to \
 {self.route_num} at {self.account_num}'
 
+    def message_key(self):
+        """Returns the name and account the message depends on.
+        """
+        return 1, self.employee.name, self.route_num, self.account_num
+
     def __str__(self):
         """Returns a string representing the desired pay method.
         """
@@ -234,6 +382,8 @@ class MailedMethod(PayMethod):
     payday.
     """
 
+    __slots__ = ()
+
     def __init__(self, employee):
         """Initialize data members for mail method. Keeps track of the
         employee, and can access employee's mailing address.
@@ -246,6 +396,13 @@ class MailedMethod(PayMethod):
         """
         return f'Will mail ${amount:.2f} to {self.employee.name} at {self.employee.full_address()}'
 
+    def message_key(self):
+        """Returns the name and address the message depends on.
+        """
+        employee = self.employee
+        return 2, employee.name, employee.address, employee.city, \
+            employee.state, employee.zip
+
     def __str__(self):
         """Returns a string representing the desired pay method.
         """
@@ -282,6 +439,15 @@ def create_pay_method(employee, pay_method_num, route_num=0,
     raise Exception(f'Invalid pay method number {pay_method_num}. Should be 1 or 2.')
 
 
+def _intern(value):
+    """Interns strings, so that equal values repeated across employees
+    share one string object. Other values are returned unchanged.
+    """
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
 class Employee():
     """
     Main employee class
@@ -293,8 +459,19 @@ class Employee():
     The reason it is split so weird is because you might not necessarily
     want to put in 100% of someones info at once so its split into three
     categories
+
+    Employees use __slots__ rather than a per-object __dict__, and the
+    values that repeat across many employees (state, city, title, dept
+    and permission) are interned, to keep large databases small in
+    memory.
     """
 
+    __slots__ = ("id", "name", "first_name", "last_name", "address", "city",
+                 "state", "zip", "classification", "pay_method",
+                 "birth_date", "ssn", "phone", "email", "start_date",
+                 "end_date", "title", "dept", "permission", "password",
+                 "_preview", "__weakref__")
+
     def __init__(self, id_num, name, classification, birth_date, ssn, phone,
                  email, permission, password):
         """Initializes the employee object with basic data members.
@@ -331,8 +508,9 @@ class Employee():
         self.end_date = None
         self.title = None
         self.dept = None
-        self.permission = permission
+        self.permission = _intern(permission)
         self.password = password
+        self._preview = None
 
     def set_classification(self, class_num, pay_val_1, pay_val_2=0):
         """Sets the self.classification member of the employee class
@@ -375,8 +553,8 @@ class Employee():
         Sets address city state and zipcode for the employee
         """
         self.address = address
-        self.city = city
-        self.state = state
+        self.city = _intern(city)
+        self.state = _intern(state)
         self.zip = zipcode
 
     def set_job(self, start_date, title, dept):
@@ -384,8 +562,8 @@ class Employee():
         Sets start date, title and department for the employee
         """
         self.start_date = start_date
-        self.title = title
-        self.dept = dept
+        self.title = _intern(title)
+        self.dept = _intern(dept)
 
     def terminate_employee(self, end_date):
         """
@@ -397,48 +575,61 @@ class Employee():
         """
         Sets all of an employees atributes from a dict of a row from a csv file
         """
-        self.id = int(row["ID"])
-        self.name = row["Name"]
-        name = self.name.split(" ")
-        self.first_name = name[0]
-        self.last_name = name[-1]
+        self.populate_from_fields(*[row[field] for field in FIELDNAMES])
+
+    def populate_from_fields(self, id_num, name, address, city, state,
+                             zip_code, class_num, pay_method_num, salary,
+                             hourly_rate, commission_rate, route_num,
+                             account_num, birth_date, ssn, phone, email,
+                             start_date, end_date, title, dept, permission,
+                             password):
+        """Sets all of an employees atributes from the values of a row, in
+        FIELDNAMES order. Loading from rows and from a snapshot both go
+        through here.
+        """
+        self.id = int(id_num)
+        self.name = name
+        split_name = name.split(" ")
+        self.first_name = split_name[0]
+        self.last_name = split_name[-1]
 
         # Set the appropriate classification type:
-        classification = int(row["Classification"])
-        if classification == 1:
-            self.classification = Hourly(float(row["Hourly"]))
-        elif classification == 2:
-            self.classification = Salary(float(row["Salary"]))
-        elif classification == 3:
-            self.classification = Commissioned(float(row["Salary"]),
-                                               float(row["Commission"]))
+        class_num = int(class_num)
+        if class_num == 1:
+            self.classification = Hourly(float(hourly_rate))
+        elif class_num == 2:
+            self.classification = Salary(float(salary))
+        elif class_num == 3:
+            self.classification = Commissioned(float(salary),
+                                               float(commission_rate))
         else:
             raise Exception(f'Classification for emp: "{self.name}" invalid.')
 
-        self.ssn = row["SSN"]
-        self.phone = row["Phone"]
-        self.email = row["Email"]
-        self.address = row["Address"]
-        self.city = row["City"]
-        self.state = row["State"]
-        self.zip = row["Zip"]
+        self.ssn = ssn
+        self.phone = phone
+        self.email = email
+        self.address = address
+        self.city = _intern(city)
+        self.state = _intern(state)
+        self.zip = zip_code
 
         # Set the desired pay method:
-        pay_method = int(row["Pay_Method"])
-        if pay_method == 1:
-            self.pay_method = DirectMethod(self, row["Route"], row["Account"])
-        elif pay_method == 2:
+        pay_method_num = int(pay_method_num)
+        if pay_method_num == 1:
+            self.pay_method = DirectMethod(self, route_num, account_num)
+        elif pay_method_num == 2:
             self.pay_method = MailedMethod(self)
         else:
             raise Exception(f'Pay method for emp: "{self.name}" invalid.')
 
-        self.birth_date = row["Birth_Date"]
-        self.start_date = row["Start_Date"]
-        self.end_date = row["End_Date"]
-        self.title = row["Title"]
-        self.dept = row["Dept"]
-        self.permission = row["Permission"]
-        self.password = row["Password"]
+        self.birth_date = birth_date
+        self.start_date = start_date
+        self.end_date = end_date
+        self.title = _intern(title)
+        self.dept = _intern(dept)
+        self.permission = _intern(permission)
+        self.password = password
+        self._preview = None
 
     def payment_report(self):
         """Returns a message that states how much the employee will be
@@ -448,6 +639,35 @@ class Employee():
 
         return self.pay_method.payment_message(payment)
 
+    def preview_pay(self):
+        """Returns how much the employee will be paid, without using up
+        their timecards or receipts. See preview_report.
+        """
+        return self._cached_preview()[1]
+
+    def preview_report(self):
+        """Returns the message payment_report would return, without using
+        up the employee's timecards or receipts. The pay and message are
+        remembered, and only worked out again once the employee's
+        classification, rates, timecards or receipts, pay method, name or
+        address change.
+        """
+        return self._cached_preview()[2]
+
+    def _cached_preview(self):
+        """Returns the remembered (key, pay, message) of preview_report,
+        working it out again if the key has changed.
+        """
+        key = (self.classification, self.classification.pay_key(),
+               self.pay_method, self.pay_method.message_key())
+        preview = self._preview
+        if preview is None or preview[0] != key:
+            payment = self.classification.preview_pay()
+            preview = (key, payment,
+                       self.pay_method.payment_message(payment))
+            self._preview = preview
+        return preview
+
     def full_address(self):
         """Returns the employee's full address.
         """
@@ -460,32 +680,233 @@ class Employee():
         return bool(self.id == other.id)
 
 
-class EmployeeDB:
+def _employee_from_row(row):
+    """Creates an Employee object from a dict of a row from the database.
     """
-    Database class:
+    employee = Employee(None, None, None, None, None, None, None, None, None)
+    employee.populate_from_row(row)
+    return employee
 
-    Creates a csv file with the correct format if one does not already
-    exist in the directory.
-    Keeps a list of employees within the class and pulls from the csv file
 
-    update_emp_list pulls data from the csv to the emp list and archived
-    emp list.
+class _LazyIndex:
+    """
+    ID index used by EmployeeDB in lazy mode, in place of a dict.
 
+    An employee's row is only parsed into an Employee object when it is
+    looked up. The cache_size most recently used employees are kept, and
+    so is any employee still referenced elsewhere, so a given ID always
+    maps to the same object while it is in use.
+    """
+
+    def __init__(self, storage, id_nums, archived_ids, cache_size):
+        self.storage = storage
+        self.id_nums = set(id_nums)
+        self.archived_ids = archived_ids
+        self.cache_size = cache_size
+        self._recent = OrderedDict()
+        self._live = weakref.WeakValueDictionary()
+
+    def get(self, id_num, default=None):
+        """Returns the employee with the given ID, parsing their row if
+        needed, or default if there is no such employee.
+        """
+        if id_num not in self.id_nums:
+            return default
+        employee = self._live.get(id_num)
+        if employee is None:
+            row = self.storage.read_row(id_num, id_num in self.archived_ids)
+            if row is None:
+                return default
+            employee = _employee_from_row(row)
+            self._live[id_num] = employee
+        self._remember(id_num, employee)
+        return employee
+
+    def __setitem__(self, id_num, employee):
+        self.id_nums.add(id_num)
+        self._live[id_num] = employee
+        self._remember(id_num, employee)
+
+    def __contains__(self, id_num):
+        return id_num in self.id_nums
+
+    def _remember(self, id_num, employee):
+        self._recent[id_num] = employee
+        self._recent.move_to_end(id_num)
+        if len(self._recent) > self.cache_size:
+            self._recent.popitem(last=False)
+
+
+class _NameIndex:
+    """
+    Substring index over the names of active employees, used by
+    EmployeeDB.search_names().
+
+    Names are split into lowercase words, and each word is indexed by
+    every 1, 2 and 3 letter piece of it. There are far fewer distinct
+    words than employees, so the index stays small, and finding the words
+    that contain some text only means intersecting the sets of words for
+    its 3 letter pieces. Any match of text without spaces lies inside a
+    single word of the name.
     """
 
     def __init__(self):
-        # Create employee csv file if it does not exist
-        if not os.path.exists("employees.csv"):
-            with open("employees.csv", 'x', encoding="utf8", ) as database:
-                writer = csv.writer(database)
-                writer.writerow(
-                    "ID,Name,Address,City,State,Zip,Classification," \
-                    "Pay_Method,Salary,Hourly,Commission,Route,Account," \
-                    "Birth_Date,SSN,Phone,Email,Start_Date,End_Date," \
-                    "Title,Dept,Permission,Password".split(','))
-                self.database = open("employees.csv", encoding="utf8", )
+        self._word_ids = {}
+        self._gram_words = {}
+        # The order employees were added in, so results can be returned in
+        #   the order of the emp list.
+        self.order = {}
+
+    def add(self, id_num, name):
+        """Adds an employee's name to the index.
+        """
+        if id_num not in self.order:
+            self.order[id_num] = len(self.order)
+        for word in _name_words(name):
+            id_nums = self._word_ids.get(word)
+            if id_nums is None:
+                id_nums = self._word_ids[word] = set()
+                for gram in _grams(word):
+                    self._gram_words.setdefault(gram, set()).add(word)
+            id_nums.add(id_num)
+
+    def remove(self, id_num, name):
+        """Removes an employee's name from the index.
+        """
+        for word in _name_words(name):
+            id_nums = self._word_ids.get(word)
+            if id_nums is None:
+                continue
+            id_nums.discard(id_num)
+            if not id_nums:
+                del self._word_ids[word]
+                for gram in _grams(word):
+                    words = self._gram_words[gram]
+                    words.discard(word)
+                    if not words:
+                        del self._gram_words[gram]
+
+    def candidates(self, text):
+        """Returns the IDs of the employees with a name word containing
+        text, which must not contain spaces.
+        """
+        if len(text) <= 3:
+            words = self._gram_words.get(text, ())
         else:
-            self.database = open("employees.csv", encoding="utf8")
+            word_sets = sorted((self._gram_words.get(text[index:index + 3],
+                                                     set())
+                                for index in range(len(text) - 2)), key=len)
+            words = [word for word in word_sets[0].intersection(*word_sets[1:])
+                     if text in word]
+        id_nums = set()
+        for word in words:
+            id_nums.update(self._word_ids[word])
+        return id_nums
+
+
+def _name_words(name):
+    """Returns the distinct lowercase words of a name.
+    """
+    if not isinstance(name, str):
+        return set()
+    return {word for word in name.lower().split(" ") if word}
+
+
+def _grams(word):
+    """Returns every 1, 2 and 3 letter piece of a word.
+    """
+    return {word[index:index + size] for size in (1, 2, 3)
+            for index in range(len(word) - size + 1)}
+
+
+class LazyEmployeeList:
+    """
+    Stand-in for EmployeeDB.emp_list and archived_list in lazy mode.
+
+    Holds only employee IDs, and looks each employee up in the lazy index
+    as the list is used, so it can be iterated, indexed and added to like
+    a list of Employee objects.
+    """
+
+    def __init__(self, id_nums, index):
+        self.id_nums = list(id_nums)
+        self.index = index
+
+    def __iter__(self):
+        for id_num in self.id_nums:
+            yield self.index.get(id_num)
+
+    def __len__(self):
+        return len(self.id_nums)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.index.get(id_num) for id_num in self.id_nums[item]]
+        return self.index.get(self.id_nums[item])
+
+    def __contains__(self, employee):
+        return employee.id in self.id_nums
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def append(self, employee):
+        """Adds the employee to the end of the list.
+        """
+        self.index[employee.id] = employee
+        self.id_nums.append(employee.id)
+
+    def remove(self, employee):
+        """Removes the employee from the list.
+        """
+        self.id_nums.remove(employee.id)
+
+
+class EmployeeDB:
+    """
+    Database class:
+
+    Keeps a list of employees within the class and pulls them from a
+    storage engine (see storage.py). By default that is the csv files,
+    which are created with the correct format if they do not already
+    exist in the directory. Pass storage=SQLiteStorage() to keep the
+    employees in an SQLite database instead.
+
+    update_emp_list pulls data from the storage engine to the emp list
+    and archived emp list.
+
+    With lazy=True, rows are only indexed by ID at startup and are parsed
+    into Employee objects when they are used, keeping at most cache_size
+    of them (plus any still in use). This suits sessions that look at a
+    few employees; timecards and receipts added to an employee are lost
+    if they drop out of the cache, so run payroll without lazy mode.
+
+    query() finds employees by dept, title, classification, permission
+    and state, using indexes of value -> set of IDs that are built on the
+    first query and kept up to date by add, edit and archive.
+
+    search_names() finds active employees by part of their name, using a
+    substring index that is likewise built on the first search.
+
+    take_changed() gives the IDs of the employees added, edited or
+    archived since it was last called, or given new timecards or receipts
+    (see mark_changed), so reports can render only those again.
+
+    Otherwise, the loaded employees are saved to a binary snapshot next
+    to the csv files, which is loaded instead of the csv files on the next
+    startup, as long as they have not changed since. Pass snapshot=False
+    to always load from the storage engine.
+
+    """
+
+    def __init__(self, storage=None, lazy=False, cache_size=1024,
+                 snapshot=True):
+        if storage is None:
+            storage = CSVStorage()
+        self.storage = storage
+        self.lazy = lazy
+        self.cache_size = cache_size
+        self.snapshot = snapshot
 
         # Make Admin csv file if it doesn't exist
         if not os.path.exists("admins.csv"):
@@ -496,54 +917,148 @@ class EmployeeDB:
         else:
             self.admins = open("admins.csv", encoding="utf8")
 
-        if not os.path.exists("archived.csv"):
-            with open("archived.csv", "x", encoding="utf8") as database:
-                writer = csv.writer(database)
-                writer.writerow(
-                    "ID,Name,Address,City,State,Zip,Classification," \
-                    "Pay_Method,Salary,Hourly,Commission,Route,Account," \
-                    "Birth_Date,SSN,Phone,Email,Start_Date,End_Date," \
-                    "Title,Dept,Permission,Password".split(','))
-                self.archived = open("archived.csv", encoding="utf8")
-        else:
-            self.archived = open("archived.csv", encoding="utf8")
         self.emp_list = []
         self.archived_list = []
+        # ID -> Employee for every known employee, active or archived, so
+        #   lookups do not have to scan the lists.
+        self._id_index = {}
+        self._archived_ids = set()
+        # Secondary indexes for query(): field -> value -> set of IDs.
+        #   None until the first query.
+        self._field_indexes = None
+        # Substring index for search_names(). None until the first search.
+        self._name_index = None
+        # Highest ID in use, for allocate_id(). None until first needed.
+        self._max_id = None
+        # IDs of the employees changed since take_changed() was last
+        #   called, or None if any of them may have, e.g. after a reload.
+        self._changed = None
         self.update_emp_list()
 
     def update_emp_list(self):
         """
-        Pulls data from the CSV to the emp list and archived emp list.
-        """
-        arch_dict = csv.DictReader(self.archived)
-        for row in arch_dict:
-            temp_emp = Employee(None, None, None, None, None, None, None, None,
-                                None)
-            temp_emp.populate_from_row(row)
-            self.archived_list.append(temp_emp)
-        emp_dict = csv.DictReader(self.database)
-        for row in emp_dict:
-            temp_emp = Employee(None, None, None, None, None, None, None, None,
-                                None)
-            temp_emp.populate_from_row(row)
-            if temp_emp not in self.archived_list:
-                self.emp_list.append(temp_emp)
+        Pulls data from the storage engine to the emp list and archived
+        emp list.
+        """
+        self._field_indexes = None
+        self._name_index = None
+        self._max_id = None
+        self._changed = None
+        if self.lazy:
+            archived_ids, employee_ids = self.storage.index_rows()
+            self._archived_ids = set(archived_ids)
+            self._id_index = _LazyIndex(self.storage,
+                                        archived_ids + employee_ids,
+                                        self._archived_ids, self.cache_size)
+            self.archived_list = LazyEmployeeList(archived_ids,
+                                                  self._id_index)
+            self.emp_list = LazyEmployeeList(
+                [id_num for id_num in employee_ids
+                 if id_num not in self._archived_ids], self._id_index)
+            return
+
+        # Nothing made while loading is garbage, so the garbage collector
+        #   is held off rather than letting it scan the new objects over
+        #   and over.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._load_lists()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _load_lists(self):
+        """Loads the emp list and archived emp list from the snapshot if
+        it is up to date, and from the storage engine otherwise, saving a
+        new snapshot.
+        """
+        source_files = self.storage.source_files() if self.snapshot else []
+        if source_files:
+            saved = read_snapshot(self.storage.snapshot_file, source_files)
+            if saved is not None:
+                self._set_lists(_employees_from_columns(saved[0]),
+                                _employees_from_columns(saved[1]))
+                return
+
+        archived_rows, employee_rows = self.storage.load()
+        archived_ids = {int(row["ID"]) for row in archived_rows}
+        columns = (_row_columns(row for row in employee_rows
+                                if int(row["ID"]) not in archived_ids),
+                   _row_columns(archived_rows))
+        self._set_lists(_employees_from_columns(columns[0]),
+                        _employees_from_columns(columns[1]))
+        if source_files:
+            write_snapshot(self.storage.snapshot_file, source_files, columns)
+
+    def _set_lists(self, emp_list, archived_list):
+        """Sets the emp list and archived emp list, and rebuilds the ID
+        index over them.
+        """
+        self.emp_list = emp_list
+        self.archived_list = archived_list
+        self._archived_ids = {emp.id for emp in archived_list}
+        self._id_index = {emp.id: emp for emp in emp_list}
+        self._id_index.update((emp.id, emp) for emp in archived_list)
+
+    def allocate_id(self, count=1):
+        """Reserves new employee IDs from the storage engine's saved ID
+        sequence, so no two callers get the same ID, even from separate
+        processes sharing the same data files. Pass count to reserve a
+        block of IDs at once, e.g. for a bulk import.
+
+        Output: the first reserved ID. The block is that ID through
+                that ID + count - 1.
+        """
+        if self._max_id is None:
+            id_nums = self._id_index.id_nums if self.lazy else self._id_index
+            self._max_id = max(id_nums, default=0)
+        first_id = self.storage.allocate_ids(count, self._max_id)
+        self._max_id = max(self._max_id, first_id + count - 1)
+        return first_id
+
+    def find_employee(self, id_num, include_archived=False):
+        """Finds the employee with the given ID using the ID index.
+        Archived employees are only returned if include_archived is True.
+
+        Input: int, bool
+        Output: Employee object with matching id, or None.
+        """
+        employee = self._id_index.get(id_num)
+        if employee is not None and not include_archived \
+                and id_num in self._archived_ids:
+            return None
+        return employee
 
     def archive_employee(self, id_num):
         """Removes from emp list and adds them to the archived file.
         """
-        employee = find_employee_by_id(id_num, self.emp_list)
+        employee = self.find_employee(id_num)
+        if employee is None:
+            raise Exception(f'No active employee with ID {id_num}.')
         self.emp_list.remove(employee)
         self.archived_list.append(employee)
-        _add_row(employee, "archived.csv")
+        self._archived_ids.add(employee.id)
+        if self._name_index is not None:
+            self._name_index.remove(employee.id, employee.name)
+        self.mark_changed(employee.id)
+        self.storage.archive_row(_employee_row(employee))
 
 
     def add_employee(self, employee: Employee):
         """
-        Adds an employee to the employee list and adds a row to the csv file
+        Adds an employee to the employee list and adds a row to the
+        storage engine
         """
         self.emp_list.append(employee)
-        _add_row(employee, "employees.csv")
+        self._id_index[employee.id] = employee
+        if self._max_id is not None and employee.id > self._max_id:
+            self._max_id = employee.id
+        self._index_fields(employee)
+        if self._name_index is not None:
+            self._name_index.add(employee.id, employee.name)
+        self.mark_changed(employee.id)
+        self.storage.add_row(_employee_row(employee))
 
     def edit_employee(self, id_num, fields: list, data: list):
         """
@@ -552,123 +1067,310 @@ class EmployeeDB:
 
         Be careful if you edit things it really edits them in the DB
         while you're testing I would
-        open("temp/employees.csv", "w",newline='') in on line 616
-        of open("employees.csv", "w",newline='')
-
-        """
-        with open("employees.csv", encoding="utf8") as database:
-            emp_dict = csv.DictReader(database)
-            temp = []
-            for row in emp_dict:
-                temp_row = row
-                if temp_row["ID"] == str(id_num):
-                    for index in range(len(fields)):
-                        # Try passing on IndexErrors, to see what is happening with the data when that error is thrown. Exit loop?
-                        # Print out fields and data lists.
-                        temp_row[fields[index]] = data[index]
-                temp.append(temp_row)
-        with open("employees.csv", "w", newline='', encoding="utf8") as temp_db:
-            fieldnames = "ID,Name,Address,City,State,Zip,Classification," \
-                         "Pay_Method,Salary,Hourly,Commission,Route,Account," \
-                         "Birth_Date,SSN,Phone,Email,Start_Date,End_Date," \
-                         "Title,Dept,Permission,Password".split(',')
-            writer = csv.DictWriter(temp_db, fieldnames, )
-            writer.writeheader()
-            writer.writerows(temp)
-            self.database = temp_db
+        pass EmployeeDB(CSVStorage("temp/employees.csv")) instead of
+        using the default storage.
 
+        """
+        self.storage.update_row(id_num, fields, data)
+
+        employee = self.find_employee(id_num)
+        if employee is not None:
+            self._edit_in_memory(employee, fields, data)
+
+    def edit_employees(self, changes: list):
+        """
+        Edits many employees at once. changes is a list of
+        (ID, fields, data) tuples, each like the arguments of
+        edit_employee. The storage engine saves all of the changes in one
+        write, so either all of them are saved or none are, and the
+        employees in memory are only changed once they have been saved.
+        """
+        employees = []
+        for id_num, fields, data in changes:
+            employee = self.find_employee(id_num)
+            if employee is None:
+                raise Exception(f'No active employee with ID {id_num}.')
+            if len(fields) != len(data):
+                raise Exception(f'Edit for employee {id_num} has '
+                                f'{len(fields)} fields but {len(data)} '
+                                f'values.')
+            employees.append(employee)
+
+        self.storage.update_rows(changes)
+
+        for employee, (_, fields, data) in zip(employees, changes):
+            self._edit_in_memory(employee, fields, data)
+
+    def _edit_in_memory(self, employee, fields: list, data: list):
+        """Applies an edit to the Employee object, keeping the indexes up
+        to date.
+        """
+        self._unindex_fields(employee)
+        if self._name_index is not None:
+            self._name_index.remove(employee.id, employee.name)
+        _apply_edit(employee, fields, data)
+        self._index_fields(employee)
+        if self._name_index is not None:
+            self._name_index.add(employee.id, employee.name)
+        self.mark_changed(employee.id)
+
+    def mark_changed(self, id_num):
+        """Records that an employee has changed, for take_changed. Add,
+        edit and archive do this themselves; call it for other changes,
+        e.g. new timecards.
+        """
+        if self._changed is not None:
+            self._changed.add(id_num)
+
+    def take_changed(self):
+        """Returns the set of IDs of the employees changed since the last
+        call, or None if any of them may have, as on the first call and
+        after update_emp_list, and starts tracking changes again.
+        """
+        changed = self._changed
+        self._changed = set()
+        return changed
+
+    def peek_changed(self):
+        """Returns the set of IDs take_changed would return, or None,
+        without taking them.
+        """
+        return None if self._changed is None else set(self._changed)
+
+    def search_names(self, text):
+        """Finds the active employees whose name contains the given text,
+        ignoring case. This gives the same employees, in the same order,
+        as checking text.lower() in str(emp).lower() for every employee in
+        the emp list, but uses the name index instead of a full scan.
+
+        Output: list of matching Employee objects.
+        """
+        text = text.lower()
+        if not text:
+            return list(self.emp_list)
+        if self._name_index is None:
+            self._name_index = _NameIndex()
+            for employee in self.emp_list:
+                self._name_index.add(employee.id, employee.name)
+
+        # A match for text with spaces in it must contain a match for its
+        #   longest word, so look that up and check the full text after.
+        longest_word = max(text.split(" "), key=len)
+        if not longest_word:
+            id_nums = set(self._name_index.order)
+        else:
+            id_nums = self._name_index.candidates(longest_word)
+        id_nums = id_nums - self._archived_ids
+        order = self._name_index.order
+        employees = (self._id_index.get(id_num)
+                     for id_num in sorted(id_nums, key=order.__getitem__))
+        if " " not in text:
+            return list(employees)
+        return [employee for employee in employees
+                if text in str(employee).lower()]
+
+    def query(self, include_archived=False, **criteria):
+        """Finds the employees matching all of the given criteria, by
+        intersecting the secondary indexes, e.g.
+
+            emp_db.query(dept="Production", classification="hourly")
+            emp_db.query(permission="admin")
+
+        Criteria can be dept, title, classification ("hourly", "salary"
+        or "commissioned"), permission and state. Archived employees are
+        only included if include_archived is True.
+
+        Output: list of matching Employee objects, in ID order.
+        """
+        for field in criteria:
+            if field not in INDEXED_FIELDS:
+                raise Exception(f'Cannot query by "{field}". Use one of: '
+                                f'{", ".join(INDEXED_FIELDS)}.')
+        if self._field_indexes is None:
+            self._field_indexes = {field: {} for field in INDEXED_FIELDS}
             for employee in self.emp_list:
-                if employee.id == id_num:
-                    if fields[0] == "Pay_Method" and data[0] == 1:
-                        employee.pay_method = DirectMethod(employee, data[1], data[2])
-                    elif fields[0] == "Pay_Method" and data[0] == 2:
-                        employee.pay_method = MailedMethod(employee)
-                    elif fields[0] == "Classification" and data[0] == 1:
-                        employee.classification = Hourly(data[1])
-                    elif fields[0] == "Classification" and data[0] == 2:
-                        employee.classification = Salary(data[1])
-                    elif fields[0] == "Classification" and data[0] == 3:
-                        employee.classification = Commissioned(data[1], data[2])
-                    elif fields[0] == "Name":
-                        full_name = data[0].split(' ')
-                        first_name = full_name[0]
-                        last_name = full_name[1]
-                        setattr(employee, "first_name", first_name)
-                        setattr(employee, "last_name", last_name)
-                        setattr(employee, "name", data[0])
-                    else:
-                        for index in range(len(fields)):
-                            setattr(employee, fields[index].lower(), data[index])
-
-
-def _add_row(employee: Employee, file):
-    with open(file, "a", encoding="utf8") as database:
-        writer = csv.writer(database, delimiter=',')
-        if str(employee.classification) == "hourly":
-            if str(employee.pay_method) == "direct deposit":
-                writer.writerow([employee.id, employee.name, employee.address,
-                                 employee.city, employee.state, employee.zip,
-                                 employee.classification.num(),
-                                 employee.pay_method.num(), -1,
-                                 employee.classification.hourly_rate, -1,
-                                 employee.pay_method.route_num,
-                                 employee.pay_method.account_num, employee.birth_date,
-                                 employee.ssn, employee.phone, employee.email, employee.start_date,
-                                 employee.end_date, employee.title, employee.dept,
-                                 employee.permission, employee.password])
-            elif str(employee.pay_method) == "mail":
-                writer.writerow([employee.id, employee.name, employee.address,
-                                 employee.city, employee.state, employee.zip,
-                                 employee.classification.num(),
-                                 employee.pay_method.num(), -1,
-                                 employee.classification.hourly_rate, -1, -1, -1,
-                                 employee.birth_date, employee.ssn, employee.phone, employee.email,
-                                 employee.start_date, employee.end_date, employee.title,
-                                 employee.dept, employee.permission, employee.password])
-        elif str(employee.classification) == "salary":
-            if str(employee.pay_method) == "direct deposit":
-                writer.writerow([employee.id, employee.name, employee.address,
-                                 employee.city, employee.state, employee.zip,
-                                 employee.classification.num(),
-                                 employee.pay_method.num(),
-                                 employee.classification.salary, -1, -1,
-                                 employee.pay_method.route_num,
-                                 employee.pay_method.account_num, employee.birth_date,
-                                 employee.ssn, employee.phone, employee.email, employee.start_date,
-                                 employee.end_date, employee.title, employee.dept,
-                                 employee.permission, employee.password])
-            elif str(employee.pay_method) == "mail":
-                writer.writerow([employee.id, employee.name, employee.address,
-                                 employee.city, employee.state, employee.zip,
-                                 employee.classification.num(),
-                                 employee.pay_method.num(),
-                                 employee.classification.salary, -1, -1, -1, -1,
-                                 employee.birth_date, employee.ssn, employee.phone, employee.email,
-                                 employee.start_date, employee.end_date, employee.title,
-                                 employee.dept, employee.permission, employee.password])
-        elif str(employee.classification) == "commissioned":
-            if str(employee.pay_method) == "direct deposit":
-                writer.writerow([employee.id, employee.name, employee.address,
-                                 employee.city, employee.state, employee.zip,
-                                 employee.classification.num(),
-                                 employee.pay_method.num(),
-                                 employee.classification.salary, -1,
-                                 employee.classification.commission_rate,
-                                 employee.pay_method.route_num,
-                                 employee.pay_method.account_num, employee.birth_date,
-                                 employee.ssn, employee.phone, employee.email, employee.start_date,
-                                 employee.end_date, employee.title, employee.dept,
-                                 employee.permission, employee.password])
-            elif str(employee.pay_method) == "mail":
-                writer.writerow([employee.id, employee.name, employee.address,
-                                 employee.city, employee.state, employee.zip,
-                                 employee.classification.num(),
-                                 employee.pay_method.num(),
-                                 employee.classification.salary, -1,
-                                 employee.classification.commission_rate, -1, -1,
-                                 employee.birth_date, employee.ssn, employee.phone, employee.email,
-                                 employee.start_date, employee.end_date, employee.title,
-                                 employee.dept, employee.permission, employee.password])
+                self._index_fields(employee)
+            for employee in self.archived_list:
+                self._index_fields(employee)
+
+        # Intersect starting from the smallest set, so the work done is
+        #   proportional to the size of the result.
+        id_sets = sorted((self._field_indexes[field].get(value, set())
+                          for field, value in criteria.items()), key=len)
+        if id_sets:
+            id_nums = id_sets[0].intersection(*id_sets[1:])
+        else:
+            id_nums = set(self._id_index.id_nums) if self.lazy \
+                else set(self._id_index)
+        if not include_archived:
+            id_nums = id_nums - self._archived_ids
+        return [self._id_index.get(id_num) for id_num in sorted(id_nums)]
+
+    def _index_fields(self, employee):
+        """Adds the employee to the secondary indexes, if they are built.
+        """
+        if self._field_indexes is None:
+            return
+        for field, value in _indexed_values(employee):
+            self._field_indexes[field].setdefault(value, set()).add(
+                employee.id)
+
+    def _unindex_fields(self, employee):
+        """Removes the employee from the secondary indexes, if they are
+        built.
+        """
+        if self._field_indexes is None:
+            return
+        for field, value in _indexed_values(employee):
+            id_nums = self._field_indexes[field].get(value)
+            if id_nums is not None:
+                id_nums.discard(employee.id)
+                if not id_nums:
+                    del self._field_indexes[field][value]
+
+    @contextmanager
+    def transaction(self):
+        """
+        Collects edits to apply together with edit_employees, e.g.
+
+            with emp_db.transaction() as edits:
+                for emp in emp_db.emp_list:
+                    if emp.dept == "Production":
+                        edits.edit(emp.id, ["Dept"], ["Manufacturing"])
+
+        The edits are saved when the with block ends. If the block raises
+        an exception, none of them are.
+        """
+        edits = EditTransaction()
+        yield edits
+        if edits.changes:
+            self.edit_employees(edits.changes)
+
+    def compact(self):
+        """Folds any journaled edits into the storage engine's base files.
+        """
+        self.storage.compact()
+
+
+# Employee attributes with secondary indexes, for EmployeeDB.query().
+INDEXED_FIELDS = ("dept", "title", "classification", "permission", "state")
+
+
+def _indexed_values(employee):
+    """Returns (field, value) pairs for each of the employee's
+    INDEXED_FIELDS, with the classification as its name.
+    """
+    return (("dept", employee.dept), ("title", employee.title),
+            ("classification", str(employee.classification)),
+            ("permission", employee.permission), ("state", employee.state))
+
+
+class EditTransaction:
+    """
+    The edits collected by EmployeeDB.transaction().
+    """
+
+    def __init__(self):
+        self.changes = []
+
+    def edit(self, id_num, fields: list, data: list):
+        """Adds an edit to the transaction, with the same arguments as
+        EmployeeDB.edit_employee.
+        """
+        self.changes.append((id_num, list(fields), list(data)))
+
+
+def _apply_edit(employee, fields: list, data: list):
+    """Applies an edit made through EmployeeDB to the Employee object in
+    memory.
+    """
+    if fields[0] == "Pay_Method" and data[0] == 1:
+        employee.pay_method = DirectMethod(employee, data[1], data[2])
+    elif fields[0] == "Pay_Method" and data[0] == 2:
+        employee.pay_method = MailedMethod(employee)
+    elif fields[0] == "Classification" and data[0] == 1:
+        employee.classification = Hourly(data[1])
+    elif fields[0] == "Classification" and data[0] == 2:
+        employee.classification = Salary(data[1])
+    elif fields[0] == "Classification" and data[0] == 3:
+        employee.classification = Commissioned(data[1], data[2])
+    elif fields[0] == "Name":
+        full_name = data[0].split(' ')
+        first_name = full_name[0]
+        last_name = full_name[1]
+        setattr(employee, "first_name", first_name)
+        setattr(employee, "last_name", last_name)
+        setattr(employee, "name", data[0])
+    else:
+        for index in range(len(fields)):
+            setattr(employee, fields[index].lower(), _intern(data[index]))
+
+
+def _employee_row(employee: Employee):
+    """Returns the employee's data as a row dict, in the same layout as
+    the rows of employees.csv. Pay fields that do not apply to the
+    employee's classification or pay method are set to -1.
+    """
+    salary = -1
+    hourly = -1
+    commission = -1
+    route = -1
+    account = -1
+    if str(employee.classification) == "hourly":
+        hourly = employee.classification.hourly_rate
+    elif str(employee.classification) == "salary":
+        salary = employee.classification.salary
+    elif str(employee.classification) == "commissioned":
+        salary = employee.classification.salary
+        commission = employee.classification.commission_rate
+    if str(employee.pay_method) == "direct deposit":
+        route = employee.pay_method.route_num
+        account = employee.pay_method.account_num
+
+    return {"ID": employee.id, "Name": employee.name,
+            "Address": employee.address, "City": employee.city,
+            "State": employee.state, "Zip": employee.zip,
+            "Classification": employee.classification.num(),
+            "Pay_Method": employee.pay_method.num(), "Salary": salary,
+            "Hourly": hourly, "Commission": commission, "Route": route,
+            "Account": account, "Birth_Date": employee.birth_date,
+            "SSN": employee.ssn, "Phone": employee.phone,
+            "Email": employee.email, "Start_Date": employee.start_date,
+            "End_Date": employee.end_date, "Title": employee.title,
+            "Dept": employee.dept, "Permission": employee.permission,
+            "Password": employee.password}
+
+
+# Fields whose values repeat across many employees, and are interned.
+_INTERNED_FIELDS = ("City", "State", "Title", "Dept", "Permission")
+
+
+def _row_columns(rows):
+    """Returns the given rows as one list per database field, in
+    FIELDNAMES order, with the repeating values interned. This is the
+    form employees are saved in a snapshot.
+    """
+    rows = list(rows)
+    columns = []
+    for field in FIELDNAMES:
+        column = [row[field] for row in rows]
+        if field in _INTERNED_FIELDS:
+            column = list(map(_intern, column))
+        columns.append(column)
+    return columns
+
+
+def _employees_from_columns(columns):
+    """Rebuilds Employee objects from the row columns made by
+    _row_columns, with populate_from_fields, but without making a dict per
+    row.
+    """
+    emp_list = []
+    for values in zip(*columns):
+        employee = Employee.__new__(Employee)
+        employee.populate_from_fields(*values)
+        emp_list.append(employee)
+    return emp_list
 
 
 def add_new_employee(emp_db: EmployeeDB, id_num, first_name, last_name,
@@ -0,0 +1,936 @@
+"""
+This module contains the streaming reader for the timecard and receipt files
+of the employee management app. The files are read in large binary chunks,
+and only a running total and count are kept per employee, so memory use
+depends on the number of employees rather than the size of the file.
+Readers that need every value, e.g. to pay each timecard on its own,
+ask for them with keep_values.
+
+Each line of an input file is an employee ID followed by comma separated
+values, e.g.
+    688997,5.0,6.8,8.0
+
+The same data can also be kept in a compact binary file, made by
+csv_to_binary, with a column of employee IDs and a column of values, one
+entry per timecard or receipt. It is memory-mapped and summed in place
+instead of being parsed. Running this file converts "timecards.csv" and
+"receipts.csv" to "timecards.bin" and "receipts.bin", or back with
+--to-csv.
+
+PeriodPartitions splits the input files up by pay period instead, so
+payroll for one period doesn't read the history of the others.
+"""
+
+import os
+import sys
+import gzip
+import json
+import mmap
+import math
+import shutil
+import struct
+import hashlib
+import marshal
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+CHUNK_SIZE = 1 << 22
+MAX_ERRORS = 100
+# Bytes of new lines InputTracker.update needs before it parses them with
+#   more than one worker process.
+PARALLEL_BYTES = 1 << 25
+SEARCH_BLOCK = 1 << 16
+TRACKER_VERSION = 3
+_TRACKER_MAGIC = b"UVUOFFS"
+BINARY_VERSION = 1
+_BINARY_MAGIC = b"UVUCOLS"
+# Magic, version and number of entries. The ID column (little-endian
+#   int64) follows, then the value column (little-endian float64).
+_BINARY_HEADER = struct.Struct("<7sxIQ")
+
+
+class InputTotals:
+    """The per-employee totals read from a timecard or receipt file.
+    totals maps ID number to the sum of the values, added in file order,
+    and counts maps ID number to the number of values. Malformed lines are
+    skipped; the first max_errors of them are kept in errors as
+    (line number, line text) pairs, and bad_lines counts all of them.
+
+    With keep_values, values maps ID number to an array of the employee's
+    values too, in file order, which takes 8 bytes per value; otherwise it
+    is None, and memory use only grows with the number of employees.
+    """
+
+    __slots__ = ("values", "totals", "counts", "errors", "bad_lines", "lines",
+                 "max_errors")
+
+    def __init__(self, max_errors=MAX_ERRORS, keep_values=False):
+        """Initialize empty totals.
+        """
+        self.values = {} if keep_values else None
+        self.totals = {}
+        self.counts = {}
+        self.errors = []
+        self.bad_lines = 0
+        self.lines = 0
+        self.max_errors = max_errors
+
+    def add_line(self, line):
+        """Adds the values of one line of an input file, as bytes, to the
+        totals. Blank lines are ignored, malformed lines are recorded in
+        errors.
+
+        Output: the ID number and values of the line, or None if it was
+        blank or malformed.
+        """
+        self.lines += 1
+        try:
+            id_num, values = _parse_line(line)
+        except ValueError:
+            if line.strip():
+                self._bad_line(line)
+            return None
+
+        total = self.totals.get(id_num, 0.0)
+        for value in values:
+            total += value
+        self.totals[id_num] = total
+        self.counts[id_num] = self.counts.get(id_num, 0) + len(values)
+        if self.values is not None:
+            id_values = self.values.get(id_num)
+            if id_values is None:
+                self.values[id_num] = array("d", values)
+            else:
+                id_values.extend(values)
+        return id_num, values
+
+    def _bad_line(self, line):
+        """Records a malformed line.
+        """
+        self.bad_lines += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(
+                (self.lines, line.decode("utf8", "replace").rstrip()))
+
+    def error_message(self, file_name):
+        """Returns a message describing the malformed lines that were
+        skipped, or an empty string if there were none.
+        """
+        if not self.bad_lines:
+            return ""
+        msg = f'{self.bad_lines} malformed line(s) skipped in ' \
+              f'"{file_name}":\n'
+        for line_num, text in self.errors[:10]:
+            msg += f'  line {line_num}: {text[:60]}\n'
+        if self.bad_lines > 10:
+            msg += f'  ...and {self.bad_lines - 10} more\n'
+        return msg
+
+    def copy(self):
+        """Returns a copy of the totals that can be added to separately.
+        """
+        result = InputTotals(self.max_errors)
+        if self.values is not None:
+            result.values = {id_num: array("d", values)
+                             for id_num, values in self.values.items()}
+        result.totals = dict(self.totals)
+        result.counts = dict(self.counts)
+        result.errors = list(self.errors)
+        result.bad_lines = self.bad_lines
+        result.lines = self.lines
+        return result
+
+    def __getstate__(self):
+        """Packs the values, if kept, into three flat arrays for pickling,
+        e.g. to send them back from the worker processes of read_totals. An
+        array per employee pickles several times slower.
+        """
+        packed = None
+        if self.values is not None:
+            values = array("d")
+            for id_values in self.values.values():
+                values.extend(id_values)
+            packed = (array("q", self.values),
+                      array("q", map(len, self.values.values())), values)
+        return (packed, self.totals, self.counts, self.errors,
+                self.bad_lines, self.lines, self.max_errors)
+
+    def __setstate__(self, state):
+        """Unpacks the state made by __getstate__.
+        """
+        (packed, self.totals, self.counts, self.errors, self.bad_lines,
+         self.lines, self.max_errors) = state
+        self.values = None
+        if packed is not None:
+            ids, counts, values = packed
+            self.values = {}
+            start = 0
+            for id_num, count in zip(ids, counts):
+                self.values[id_num] = values[start:start + count]
+                start += count
+
+    def items(self):
+        """Returns (ID number, total) pairs.
+        """
+        return self.totals.items()
+
+    def extend(self, other):
+        """Adds the values and errors of another InputTotals, read from the
+        lines of the same file that follow this one's, to this one. The
+        result is the same as reading all the lines in one pass. other
+        must have kept its values, so they can be added to the totals one
+        at a time.
+        """
+        for id_num, values in other.values.items():
+            if id_num not in self.totals:
+                if self.values is not None:
+                    self.values[id_num] = values[:]
+                self.totals[id_num] = other.totals[id_num]
+                self.counts[id_num] = other.counts[id_num]
+                continue
+            if self.values is not None:
+                self.values[id_num].extend(values)
+            total = self.totals[id_num]
+            for value in values:
+                total += value
+            self.totals[id_num] = total
+            self.counts[id_num] += len(values)
+        for line_num, text in other.errors:
+            if len(self.errors) >= self.max_errors:
+                break
+            self.errors.append((self.lines + line_num, text))
+        self.bad_lines += other.bad_lines
+        self.lines += other.lines
+
+
+def _parse_line(line):
+    """Splits a line of an input file, as bytes, into its ID number and
+    list of values. Raises ValueError if the line is malformed.
+    """
+    fields = line.split(b",")
+    id_num = int(fields[0])
+    values = [float(value) for value in fields[1:] if value.strip()]
+    for value in values:
+        if not math.isfinite(value):
+            raise ValueError(f'Value out of range: {value}')
+    return id_num, values
+
+
+def iter_lines(file_name, chunk_size=CHUNK_SIZE, byte_range=None):
+    """Yields the lines of a file as bytes, without line endings, reading
+    the file in chunks of chunk_size bytes. Files ending in ".gz" are
+    decompressed as they are read. If byte_range is given as (start, end),
+    e.g. one of byte_ranges, only the bytes from start up to end are read.
+    """
+    opener = gzip.open if file_name.endswith(".gz") else open
+    with opener(file_name, "rb") as in_file:
+        remaining = None
+        if byte_range is not None:
+            start, end = byte_range
+            in_file.seek(start)
+            remaining = end - start
+        tail = b""
+        while True:
+            if remaining is None:
+                chunk = in_file.read(chunk_size)
+            else:
+                chunk = in_file.read(min(chunk_size, remaining))
+                remaining -= len(chunk)
+            if not chunk:
+                break
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            yield from lines
+        if tail:
+            yield tail
+
+
+def byte_ranges(file_name, parts, byte_range=None):
+    """Splits a file into up to parts byte ranges of about the same size,
+    so it can be read in parallel with read_totals. Each range starts at
+    the beginning of a line and ends after a line ending, or at the end of
+    the file. If byte_range is given as (start, end), with start at the
+    beginning of a line, only that part of the file is split.
+
+    Output: a list of (start, end) byte offsets, in file order.
+    Compressed files can't be split, and give [byte_range], which is None
+    for the whole file.
+    """
+    if file_name.endswith(".gz"):
+        return [byte_range]
+    start, size = byte_range or (0, os.path.getsize(file_name))
+    bounds = [start]
+    with open(file_name, "rb") as in_file:
+        for part in range(1, parts):
+            in_file.seek(max(start + (size - start) * part // parts,
+                             bounds[-1], 1) - 1)
+            in_file.readline()
+            bound = in_file.tell()
+            if bound >= size:
+                break
+            if bound > bounds[-1]:
+                bounds.append(bound)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def read_totals(file_name, totals=None, chunk_size=CHUNK_SIZE,
+                id_range=None, report_bad_ids=True, byte_range=None,
+                keep_values=False, workers=1):
+    """Reads a timecard or receipt file into per-employee totals.
+
+    Input: the name of the file, and optionally an InputTotals object to
+    add to. If id_range is given as (low, high), only the lines of
+    employees with low <= ID number < high are parsed; either bound may be
+    None. Lines whose ID can't be read are only recorded if
+    report_bad_ids is True. If byte_range is given, only the lines in
+    that range of the file are read, see iter_lines; the line numbers of
+    malformed lines are then counted from the start of the range. With
+    keep_values, a new InputTotals keeps every value, see InputTotals.
+    With more than one worker, the file, or byte_range of it, is split
+    into byte_ranges that are parsed in that many processes and joined in
+    file order, which gives the same result. Starting the processes
+    takes a good fraction of a second, so this only pays off for files
+    of tens of megabytes, on a machine with as many CPUs as workers.
+    Output: the InputTotals object.
+    """
+    if totals is None:
+        totals = InputTotals(keep_values=keep_values)
+    if workers > 1:
+        return _read_in_parallel(file_name, totals, chunk_size, id_range,
+                                 report_bad_ids, workers, byte_range)
+    add_line = totals.add_line
+    if id_range is None:
+        for line in iter_lines(file_name, chunk_size, byte_range):
+            add_line(line)
+        return totals
+
+    low, high = id_range
+    for line in iter_lines(file_name, chunk_size, byte_range):
+        try:
+            id_num = int(line.split(b",", 1)[0])
+        except ValueError:
+            if report_bad_ids:
+                add_line(line)
+            else:
+                totals.lines += 1
+            continue
+        if (low is None or id_num >= low) and \
+                (high is None or id_num < high):
+            add_line(line)
+        else:
+            totals.lines += 1
+    return totals
+
+
+def _read_in_parallel(file_name, totals, chunk_size, id_range,
+                      report_bad_ids, workers, byte_range):
+    """read_totals with more than one worker. The workers keep the values
+    of their ranges, so they can be added to totals in order.
+    """
+    ranges = byte_ranges(file_name, workers, byte_range)
+    if len(ranges) == 1:
+        return read_totals(file_name, totals, chunk_size, id_range,
+                           report_bad_ids, ranges[0])
+    with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [executor.submit(read_totals, file_name, None, chunk_size,
+                                   id_range, report_bad_ids, byte_range,
+                                   True)
+                   for byte_range in ranges]
+        for future in futures:
+            totals.extend(future.result())
+    return totals
+
+
+class InputTracker:
+    """Keeps the per-employee totals of a timecard or receipt file that is
+    only ever appended to, along with the byte offset they have been read
+    up to, so each update only reads the lines added since the last one.
+    The totals and offset are saved to state_file, so this carries over
+    between runs of the app. If the file is replaced or cut short, it is
+    read again from the start.
+
+    totals is an InputTotals of the whole file, the same as read_totals
+    would return, so neither it nor the saved state grows with the size
+    of the file. new_values maps ID number to an array of the values in
+    the lines read by the last update, and retracted maps ID number to
+    how many values at the end of the previous update's new_values came
+    from an unfinished last line, which was read again.
+    """
+
+    def __init__(self, file_name, state_file=None):
+        """Initialize the tracker, loading the saved state if there is
+        any. Nothing is read from file_name until update is called.
+        """
+        self.file_name = file_name
+        self.state_file = state_file or file_name + ".offset"
+        self.offset = 0
+        self._fingerprint = None
+        self._complete = InputTotals()
+        self._load()
+        self._end = self.offset
+        self._tail_counts = {}
+        self._new = None
+        self.totals = self._complete
+        self.new_values = {}
+        self.retracted = {}
+
+    def update(self, chunk_size=CHUNK_SIZE, workers=1):
+        """Reads the lines appended to the file since the last update.
+        With more than one worker, at least PARALLEL_BYTES of new lines,
+        e.g. the whole file the first time, are parsed by that many
+        processes, see read_totals; fewer are read in this process.
+
+        Output: the set of ID numbers whose totals changed, or None if the
+        file was read again from the start, so every total may have
+        changed.
+        """
+        self.retracted = self._tail_counts
+        self._tail_counts = {}
+        if not os.path.exists(self.file_name):
+            self._reset()
+            self.totals = self._complete
+            self._new = None
+            self.new_values = {}
+            return None
+
+        changed = set()
+        new = InputTotals(self._complete.max_errors, keep_values=True)
+        with open(self.file_name, "rb") as in_file:
+            size = os.fstat(in_file.fileno()).st_size
+            if size < self.offset or \
+                    self._fingerprint != _fingerprint(in_file, self.offset):
+                self._reset()
+                self.retracted = {}
+                changed = None
+            from_start = not self.offset
+            if workers > 1 and size - self.offset >= PARALLEL_BYTES:
+                end = size
+                complete = _last_line_end(in_file, self.offset, size)
+                in_file.seek(complete)
+                tail = in_file.read(size - complete)
+                read_totals(self.file_name, new, chunk_size,
+                            byte_range=(self.offset, complete),
+                            workers=workers)
+            else:
+                end, tail = self._read_lines(in_file, new, chunk_size)
+            self.offset = end - len(tail)
+            self._fingerprint = _fingerprint(in_file, self.offset)
+        self._complete.extend(new)
+        self._end = end
+        if changed is not None:
+            changed.update(new.values)
+            # The values of an unfinished line read again may be gone.
+            changed.update(self.retracted)
+
+        # A last line without a line ending may still be being written, so
+        #   it is counted in totals but read again by the next update.
+        self.totals = self._complete
+        if tail:
+            self.totals = self._complete.copy()
+            self.totals.add_line(tail)
+            parsed = new.add_line(tail)
+            if parsed is not None:
+                self._tail_counts = {parsed[0]: len(parsed[1])}
+                if changed is not None:
+                    changed.add(parsed[0])
+        self._new = new if from_start else None
+        self.new_values = new.values
+        self.save()
+        return changed
+
+    def _read_lines(self, in_file, new, chunk_size):
+        """Adds the lines of in_file from the offset on to new, an
+        InputTotals.
+
+        Output: the offset of the end of the file, and the last line if it
+        has no line ending, which isn't added.
+        """
+        in_file.seek(self.offset)
+        end = self.offset
+        tail = b""
+        add_line = new.add_line
+        while True:
+            chunk = in_file.read(chunk_size)
+            if not chunk:
+                break
+            end += len(chunk)
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                add_line(line)
+        return end, tail
+
+    def read_values(self):
+        """Reads the file again up to where the last update stopped, to
+        get every value totals was made from, e.g. to give each employee
+        all their timecards when they are loaded.
+
+        Output: an InputTotals with its values kept, equal to totals.
+        """
+        if self._new is not None:
+            # The last update read the whole file already.
+            return self._new
+        if not self._end:
+            return InputTotals(self._complete.max_errors, keep_values=True)
+        return read_totals(self.file_name, byte_range=(0, self._end),
+                           keep_values=True)
+
+    def save(self):
+        """Saves the offset and the totals of the lines before it, which
+        take space in proportion to the number of employees, not the size
+        of the file.
+        """
+        totals = self._complete
+        state = (self.offset, self._fingerprint, totals.totals,
+                 totals.counts, totals.errors, totals.bad_lines,
+                 totals.lines)
+        temp_file = self.state_file + ".tmp"
+        with open(temp_file, "wb") as output:
+            output.write(_TRACKER_MAGIC)
+            marshal.dump(TRACKER_VERSION, output)
+            output.write(marshal.dumps(state))
+        os.replace(temp_file, self.state_file)
+
+    def _load(self):
+        """Loads the saved state, if there is a readable one.
+        """
+        try:
+            with open(self.state_file, "rb") as state_file:
+                if state_file.read(len(_TRACKER_MAGIC)) != _TRACKER_MAGIC or \
+                        marshal.load(state_file) != TRACKER_VERSION:
+                    return
+                (offset, fingerprint, totals, counts, errors, bad_lines,
+                 lines) = marshal.loads(state_file.read())
+        except (OSError, EOFError, ValueError, TypeError):
+            return
+        self.offset = offset
+        self._fingerprint = fingerprint
+        self._complete.totals = totals
+        self._complete.counts = counts
+        self._complete.errors = [tuple(error) for error in errors]
+        self._complete.bad_lines = bad_lines
+        self._complete.lines = lines
+
+    def _reset(self):
+        """Forgets everything read so far.
+        """
+        self.offset = 0
+        self._fingerprint = None
+        self._complete = InputTotals(self._complete.max_errors)
+
+
+def _fingerprint(in_file, offset):
+    """Returns a hash of the start of the file and of the bytes just before
+    offset, which changes if the part of the file before offset is
+    replaced. None if offset is 0.
+    """
+    if not offset:
+        return None
+    digest = hashlib.blake2b(str(offset).encode())
+    in_file.seek(0)
+    digest.update(in_file.read(min(offset, 4096)))
+    in_file.seek(max(0, offset - 256))
+    digest.update(in_file.read(min(offset, 256)))
+    return digest.hexdigest()
+
+
+def _last_line_end(in_file, start, size):
+    """Returns the offset just after the last line ending in in_file
+    between start and size, or start if there is none.
+    """
+    position = size
+    while position > start:
+        block_start = max(start, position - SEARCH_BLOCK)
+        in_file.seek(block_start)
+        index = in_file.read(position - block_start).rfind(b"\n")
+        if index >= 0:
+            return block_start + index + 1
+        position = block_start
+    return start
+
+
+class PeriodPartitions:
+    """
+    Timecards and receipts kept in one file per pay period, in a
+    directory, so a payroll run only reads its own period.
+
+    ingest copies the lines appended to "timecards.csv" or "receipts.csv"
+    since the last ingest into the partition of the given period. The
+    manifest, "manifest.json" in the directory, lists each kind's
+    partitions by period, with their file, line count and lowest and
+    highest employee ID, and the offset each source file has been copied
+    up to.
+
+    Once a later period is ingested, earlier ones are closed: their
+    partitions are gzipped and only read again for history.
+    """
+
+    KINDS = ("timecards", "receipts")
+
+    def __init__(self, directory="input_periods", compress=True):
+        self.directory = directory
+        self.compress = compress
+        self.manifest_file = os.path.join(directory, "manifest.json")
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = {"sources": {}}
+        for kind in self.KINDS:
+            self.manifest[kind] = {}
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file, encoding="utf8") as manifest:
+                self.manifest.update(json.load(manifest))
+        self._trackers = {}
+
+    def ingest(self, kind, source_file, period):
+        """Copies the lines appended to source_file since the last ingest
+        into the partition of period, and closes any earlier open period.
+        If the source file was replaced or cut short, all of it is copied.
+
+        Output: the number of lines copied.
+        """
+        self._check_kind(kind)
+        for old_period, partition in self.manifest[kind].items():
+            if old_period < period and not partition["closed"]:
+                self.close_period(old_period)
+
+        source = self.manifest["sources"].get(kind)
+        if source is None or source["file"] != source_file:
+            source = {"file": source_file, "offset": 0, "fingerprint": None}
+        if not os.path.exists(source_file):
+            return 0
+
+        partition = self.manifest[kind].get(period)
+        if partition is None:
+            partition = {"file": f"{kind}-{period}.csv", "lines": 0,
+                         "min_id": None, "max_id": None, "closed": False}
+        elif partition["closed"]:
+            raise Exception(f'Pay period {period} is already closed.')
+
+        copied = 0
+        with open(source_file, "rb") as in_file, \
+                open(os.path.join(self.directory, partition["file"]),
+                     "ab") as output:
+            size = os.fstat(in_file.fileno()).st_size
+            if size < source["offset"] or source["fingerprint"] != \
+                    _fingerprint(in_file, source["offset"]):
+                source["offset"] = 0
+            in_file.seek(source["offset"])
+            end = source["offset"]
+            tail = b""
+            while True:
+                chunk = in_file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                end += len(chunk)
+                lines = (tail + chunk).split(b"\n")
+                tail = lines.pop()
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    output.write(line + b"\n")
+                    copied += 1
+                    _widen_range(partition, line)
+            # A last line without a line ending may still be being
+            #   written, so it is left for the next ingest.
+            source["offset"] = end - len(tail)
+            source["fingerprint"] = _fingerprint(in_file, source["offset"])
+            output.flush()
+            os.fsync(output.fileno())
+
+        partition["lines"] += copied
+        self.manifest[kind][period] = partition
+        self.manifest["sources"][kind] = source
+        self._save_manifest()
+        return copied
+
+    def totals(self, kind, period, id_range=None, keep_values=False):
+        """Returns the InputTotals of a period's partition. The open
+        period's totals are kept up to date incrementally, by an
+        InputTracker. If id_range is given as (low, high), only those
+        employees are read, and partitions whose ID range doesn't overlap
+        it aren't opened. With keep_values, the partition is read in full
+        so every value is kept, see InputTotals.
+        """
+        self._check_kind(kind)
+        partition = self.manifest[kind].get(period)
+        if partition is None or not _overlaps(partition, id_range):
+            return InputTotals(keep_values=keep_values)
+        file_name = os.path.join(self.directory, partition["file"])
+        if id_range is not None or partition["closed"] or keep_values:
+            return read_totals(file_name, id_range=id_range,
+                               keep_values=keep_values)
+        tracker = self._trackers.get(file_name)
+        if tracker is None:
+            tracker = InputTracker(file_name)
+            self._trackers[file_name] = tracker
+        tracker.update()
+        return tracker.totals
+
+    def history(self, kind, id_num):
+        """Returns a dict of period -> (total, count) for one employee,
+        only reading the partitions whose ID range includes them.
+        """
+        result = {}
+        for period in self.periods(kind):
+            totals = self.totals(kind, period, (id_num, id_num + 1))
+            if id_num in totals.totals:
+                result[period] = (totals.totals[id_num],
+                                  totals.counts[id_num])
+        return result
+
+    def periods(self, kind):
+        """Returns the periods that have a partition, oldest first.
+        """
+        self._check_kind(kind)
+        return sorted(self.manifest[kind])
+
+    def close_period(self, period):
+        """Closes a period's partitions, gzipping them if compress is set.
+        Closed periods can't be ingested into.
+        """
+        for kind in self.KINDS:
+            partition = self.manifest[kind].get(period)
+            if partition is None or partition["closed"]:
+                continue
+            file_name = os.path.join(self.directory, partition["file"])
+            if self.compress:
+                with open(file_name, "rb") as source, \
+                        gzip.open(file_name + ".gz", "wb") as output:
+                    shutil.copyfileobj(source, output, CHUNK_SIZE)
+                partition["file"] += ".gz"
+            partition["closed"] = True
+            self._save_manifest()
+            if self.compress:
+                os.remove(file_name)
+            tracker = self._trackers.pop(file_name, None)
+            if tracker is not None and os.path.exists(tracker.state_file):
+                os.remove(tracker.state_file)
+
+    def _save_manifest(self):
+        """Writes the manifest, replacing the old one in one step.
+        """
+        temp_file = self.manifest_file + ".tmp"
+        with open(temp_file, "w", encoding="utf8") as manifest:
+            json.dump(self.manifest, manifest, indent=2, sort_keys=True)
+            manifest.flush()
+            os.fsync(manifest.fileno())
+        os.replace(temp_file, self.manifest_file)
+
+    def _check_kind(self, kind):
+        if kind not in self.KINDS:
+            raise Exception(f'Invalid input kind "{kind}". Should be one '
+                            f'of {", ".join(self.KINDS)}.')
+
+
+def _widen_range(partition, line):
+    """Widens a partition's employee ID range to include a line's ID.
+    """
+    try:
+        id_num = int(line.split(b",", 1)[0])
+    except ValueError:
+        return
+    if partition["min_id"] is None or id_num < partition["min_id"]:
+        partition["min_id"] = id_num
+    if partition["max_id"] is None or id_num > partition["max_id"]:
+        partition["max_id"] = id_num
+
+
+def _overlaps(partition, id_range):
+    """Returns whether a partition's ID range overlaps id_range, a
+    (low, high) pair with either bound possibly None.
+    """
+    if id_range is None:
+        return True
+    if partition["min_id"] is None:
+        return False
+    low, high = id_range
+    return (low is None or partition["max_id"] >= low) and \
+        (high is None or partition["min_id"] < high)
+
+
+def csv_to_binary(csv_file, binary_file, chunk_size=CHUNK_SIZE):
+    """Converts a timecard or receipt file to the binary format, one
+    entry per value, in file order. Malformed lines are left out.
+
+    Output: the InputTotals of the csv file, with the lines left out.
+    """
+    totals = InputTotals()
+    ids = array("q")
+    values = array("d")
+    count = 0
+    temp_file = binary_file + ".tmp"
+    with open(temp_file, "w+b") as output, \
+            open(binary_file + ".values.tmp", "w+b") as value_file:
+        output.write(_BINARY_HEADER.pack(_BINARY_MAGIC, BINARY_VERSION, 0))
+        for line in iter_lines(csv_file, chunk_size):
+            parsed = totals.add_line(line)
+            if parsed is None or not parsed[1]:
+                continue
+            id_num, line_values = parsed
+            ids.extend([id_num] * len(line_values))
+            values.extend(line_values)
+            count += len(line_values)
+            if len(values) >= chunk_size // 8:
+                _write_column(output, ids)
+                _write_column(value_file, values)
+                ids = array("q")
+                values = array("d")
+        _write_column(output, ids)
+        _write_column(value_file, values)
+
+        value_file.seek(0)
+        for block in iter(lambda: value_file.read(chunk_size), b""):
+            output.write(block)
+        output.seek(0)
+        output.write(_BINARY_HEADER.pack(_BINARY_MAGIC, BINARY_VERSION,
+                                         count))
+    os.remove(binary_file + ".values.tmp")
+    os.replace(temp_file, binary_file)
+    return totals
+
+
+def binary_to_csv(binary_file, csv_file):
+    """Converts a binary timecard or receipt file back to the csv layout,
+    with one line per run of entries for the same employee.
+    """
+    with open(csv_file, "w", encoding="utf8") as output, \
+            _BinaryColumns(binary_file) as (ids, values):
+        line = []
+        current = None
+        for id_num, value in zip(ids, values):
+            if id_num != current:
+                if line:
+                    output.write(",".join(line) + "\n")
+                current = id_num
+                line = [str(id_num)]
+            line.append(repr(value))
+        if line:
+            output.write(",".join(line) + "\n")
+
+
+def read_binary_totals(binary_file, keep_values=False):
+    """Reads a binary timecard or receipt file into per-employee totals,
+    the same as read_totals gives for the csv file it was made from (less
+    lines with no values, and malformed lines, which aren't kept). The
+    columns are summed straight out of the memory-mapped file, with NumPy
+    if it is installed. keep_values is as for read_totals.
+
+    Output: an InputTotals object.
+    """
+    totals = InputTotals(keep_values=keep_values)
+    with _BinaryColumns(binary_file) as (ids, values):
+        if np is not None and len(ids):
+            id_array = np.frombuffer(ids, dtype="<i8")
+            value_array = np.frombuffer(values, dtype="<f8")
+            unique_ids, inverse = np.unique(id_array, return_inverse=True)
+            # bincount adds each bin's weights in order, starting from 0,
+            #   so the sums match adding the values one at a time.
+            sums = np.bincount(inverse, weights=value_array,
+                               minlength=len(unique_ids))
+            counts = np.bincount(inverse, minlength=len(unique_ids))
+            unique_ids = unique_ids.tolist()
+            if keep_values:
+                _group_values(totals.values, unique_ids, inverse, counts,
+                              value_array)
+            totals.totals = dict(zip(unique_ids, sums.tolist()))
+            totals.counts = dict(zip(unique_ids, counts.tolist()))
+            del id_array, value_array
+        else:
+            sums = totals.totals
+            counts = totals.counts
+            for id_num, value in zip(ids, values):
+                sums[id_num] = sums.get(id_num, 0.0) + value
+                counts[id_num] = counts.get(id_num, 0) + 1
+                if keep_values:
+                    if id_num not in totals.values:
+                        totals.values[id_num] = array("d")
+                    totals.values[id_num].append(value)
+    return totals
+
+
+def _group_values(values, unique_ids, inverse, counts, value_array):
+    """Fills values with an array of each employee's values, in file
+    order, for read_binary_totals with NumPy.
+    """
+    # A stable sort keeps each employee's values in file order.
+    grouped = value_array[np.argsort(inverse, kind="stable")]
+    grouped = grouped.astype(np.float64).tobytes()
+    start = 0
+    for id_num, end in zip(unique_ids, (np.cumsum(counts) * 8).tolist()):
+        values[id_num] = array("d")
+        values[id_num].frombytes(grouped[start:end])
+        start = end
+
+
+class _BinaryColumns:
+    """Context manager that memory-maps a binary timecard or receipt file
+    and gives its ID and value columns as memoryviews, without copying.
+    """
+
+    def __init__(self, binary_file):
+        self.binary_file = binary_file
+        self._file = None
+        self._map = None
+        self._views = []
+
+    def __enter__(self):
+        self._file = open(self.binary_file, "rb")
+        header = self._file.read(_BINARY_HEADER.size)
+        if len(header) != _BINARY_HEADER.size:
+            self._file.close()
+            raise Exception(f'"{self.binary_file}" is not a binary input file')
+        magic, version, count = _BINARY_HEADER.unpack(header)
+        size = _BINARY_HEADER.size + 16 * count
+        if magic != _BINARY_MAGIC or version != BINARY_VERSION or \
+                os.fstat(self._file.fileno()).st_size != size:
+            self._file.close()
+            raise Exception(f'"{self.binary_file}" is not a binary input file')
+        if not count:
+            return array("q"), array("d")
+
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        start = _BINARY_HEADER.size
+        middle = start + 8 * count
+        ids = memoryview(self._map)[start:middle]
+        values = memoryview(self._map)[middle:size]
+        self._views = [ids, values]
+        if sys.byteorder == "little":
+            ids = ids.cast("q")
+            values = values.cast("d")
+            self._views += [ids, values]
+        else:
+            ids = array("q", ids)
+            values = array("d", values)
+            ids.byteswap()
+            values.byteswap()
+        return ids, values
+
+    def __exit__(self, *args):
+        for view in reversed(self._views):
+            view.release()
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
+def _write_column(output, column):
+    """Writes an array to a binary file as little-endian.
+    """
+    if sys.byteorder != "little":
+        column = array(column.typecode, column)
+        column.byteswap()
+    column.tofile(output)
+
+
+if __name__ == '__main__':
+    for name in ("timecards", "receipts"):
+        if "--to-csv" in sys.argv[1:]:
+            binary_to_csv(f"{name}.bin", f"{name}.csv")
+        else:
+            print(csv_to_binary(f"{name}.csv", f"{name}.bin")
+                  .error_message(f"{name}.csv"), end="")
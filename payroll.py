@@ -0,0 +1,694 @@
+"""
+This module contains the batch payroll engine for the employee management
+app. It computes every employee's pay in one pass over columns of rates and
+totals, instead of calling calculate_pay on each employee.
+
+NumPy is used when it is installed, otherwise the engine falls back to
+plain Python arrays. Both give the same results as the per-object
+calculate_pay methods in employee_database.py.
+
+It also contains the pay ledger, the record of what each employee was
+paid in each pay period, and simulate, which works out the cost of what-if
+changes to pay rates.
+"""
+
+import os
+import sqlite3
+from array import array
+from datetime import date, datetime
+
+from ingest import read_totals
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HOURLY = 1
+SALARY = 2
+COMMISSIONED = 3
+
+# The inputs of an employee with no timecards or receipts.
+_NO_INPUTS = array("d")
+
+
+class PayrollColumns:
+    """The columns the payroll engine computes pay from, one entry per
+    employee. Rates that don't apply to an employee's classification are 0.
+    The inputs, the hours of each hourly employee's timecards and the
+    receipts of each commissioned employee, follow one another in inputs,
+    in employee order, with the number of each employee's inputs in
+    input_counts.
+    """
+
+    __slots__ = ("ids", "codes", "hourly_rates", "salaries",
+                 "commission_rates", "input_counts", "inputs")
+
+    # The columns with one entry per employee.
+    ROW_COLUMNS = ("ids", "codes", "hourly_rates", "salaries",
+                   "commission_rates", "input_counts")
+
+    def __init__(self):
+        """Initialize empty columns.
+        """
+        self.ids = array("q")
+        self.codes = array("b")
+        self.hourly_rates = array("d")
+        self.salaries = array("d")
+        self.commission_rates = array("d")
+        self.input_counts = array("q")
+        self.inputs = array("d")
+
+    def append(self, employee, hours=None, receipts=None):
+        """Adds an employee's row to the columns. The hours of their
+        timecards and their receipts are taken from the employee's
+        classification unless they are given.
+        """
+        classification = employee.classification
+        code = classification.num()
+        inputs = ()
+        if code == HOURLY:
+            inputs = classification.timecards if hours is None else hours
+            self.append_row(employee.id, code, classification.hourly_rate,
+                            0.0, 0.0, inputs)
+        elif code == COMMISSIONED:
+            inputs = classification.receipts if receipts is None \
+                else receipts
+            self.append_row(employee.id, code, 0.0, classification.salary,
+                            classification.commission_rate, inputs)
+        else:
+            self.append_row(employee.id, code, 0.0, classification.salary,
+                            0.0, ())
+
+    def append_row(self, id_num, code, hourly_rate, salary, commission_rate,
+                   inputs):
+        """Adds a row to the columns from its values.
+        """
+        self.ids.append(int(id_num))
+        self.codes.append(code)
+        self.hourly_rates.append(hourly_rate)
+        self.salaries.append(salary)
+        self.commission_rates.append(commission_rate)
+        self.input_counts.append(len(inputs))
+        self.inputs.extend(inputs)
+
+    def input_starts(self):
+        """Returns where each employee's inputs start in inputs.
+        """
+        starts = array("q")
+        start = 0
+        for count in self.input_counts:
+            starts.append(start)
+            start += count
+        return starts
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def build_columns(employees, hours=None, receipts=None):
+    """Builds the payroll columns for a list of employees, e.g.
+    EmployeeDB.emp_list.
+
+    Input: an iterable of Employee objects, and optional dicts of ID number
+    to the hours of each timecard / each receipt, e.g. the values of an
+    ingest.InputTotals, that replace the timecards and receipts stored on
+    the employees.
+    Output: a PayrollColumns object.
+    """
+    columns = PayrollColumns()
+    for employee in employees:
+        id_num = int(employee.id)
+        columns.append(
+            employee,
+            None if hours is None else hours.get(id_num, ()),
+            None if receipts is None else receipts.get(id_num, ()))
+    return columns
+
+
+class PayrollResult:
+    """The pay of every employee in a payroll run, sorted by ID number.
+    ids and pay are NumPy arrays when NumPy is installed, otherwise Python
+    arrays.
+    """
+
+    __slots__ = ("ids", "pay", "_positions")
+
+    def __init__(self, ids, pay):
+        """Initialize the result from ID and pay arrays sorted by ID.
+        """
+        self.ids = ids
+        self.pay = pay
+        self._positions = None
+
+    def get(self, id_num, default=None):
+        """Returns the pay of the employee with the given ID number, or
+        default if they weren't in the payroll run.
+        """
+        if self._positions is None:
+            self._positions = {int(id_num): index
+                               for index, id_num in enumerate(self.ids)}
+        index = self._positions.get(int(id_num))
+        if index is None:
+            return default
+        return float(self.pay[index])
+
+    def as_dict(self):
+        """Returns a dict of ID number to pay.
+        """
+        return {int(id_num): float(pay)
+                for id_num, pay in zip(self.ids, self.pay)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        """Iterates over (ID number, pay) pairs in ID order.
+        """
+        for id_num, pay in zip(self.ids, self.pay):
+            yield int(id_num), float(pay)
+
+
+def compute_payroll(columns):
+    """Computes every employee's pay in one pass over the payroll columns,
+    with the same formulas as calculate_pay, adding up one timecard or
+    receipt at a time in the order they were recorded, so the results
+    are identical to it:
+        hourly:       each timecard's hours x hourly rate
+        salary:       salary / 24
+        commissioned: salary / 24 + commission rate x each receipt
+
+    Input: a PayrollColumns object.
+    Output: a PayrollResult sorted by ID number.
+    """
+    if np is not None:
+        return _compute_numpy(columns)
+    return _compute_python(columns)
+
+
+def run_payroll(employees, hours=None, receipts=None):
+    """Builds the payroll columns for the employees and computes their pay.
+    See build_columns and compute_payroll.
+    """
+    return compute_payroll(build_columns(employees, hours, receipts))
+
+
+def run_payroll_from_files(employees, timecards_file="timecards.csv",
+                           receipts_file="receipts.csv", workers=1):
+    """Reads the timecard and receipt files and computes the pay of the
+    employees from them. With more than one worker, each file is split
+    into byte ranges that start and end on line boundaries, one per
+    worker, and each range is parsed in its own process (see read_totals).
+    The ranges are joined in file order, so the totals and pay are
+    identical to a single process run. Every value of both files is held
+    in memory while pay is computed.
+
+    Input: an iterable of Employee objects, the names of the input files,
+    and the number of worker processes (None for one per CPU).
+    Output: the PayrollResult, and the InputTotals read from the timecard
+    and receipt files, with their values kept.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    timecards = read_totals(timecards_file, keep_values=True,
+                            workers=workers)
+    receipts = read_totals(receipts_file, keep_values=True, workers=workers)
+    return run_payroll(employees, timecards.values, receipts.values), \
+        timecards, receipts
+
+
+def apply_timecards(employee_db, timecards):
+    """Sets each active hourly employee's timecards to theirs in
+    timecards, an ingest.InputTotals with its values kept, marking the
+    employees whose timecards changed as changed in employee_db. Employees
+    with no timecards in timecards have theirs cleared, e.g. when a new
+    pay period starts or the timecard file is replaced.
+    """
+    _apply_inputs(employee_db, timecards.values, HOURLY)
+
+
+def apply_receipts(employee_db, receipts):
+    """Sets each active commissioned employee's receipts to theirs in
+    receipts, an ingest.InputTotals with its values kept, marking the
+    employees whose receipts changed as changed in employee_db. Employees
+    with no receipts in receipts have theirs cleared.
+    """
+    _apply_inputs(employee_db, receipts.values, COMMISSIONED)
+
+
+def apply_new_timecards(employee_db, tracker, changed):
+    """Brings the active hourly employees' timecards up to date with
+    tracker, the ingest.InputTracker of the timecard file, after its
+    update returned changed. Only the employees in changed and the ones
+    changed in employee_db since its take_changed was last called, e.g.
+    by an edit, are looked at: the timecards read by the update are added
+    to theirs. Any of them whose timecards then don't add up to the
+    tracker's totals, e.g. one just made hourly, has theirs set from the
+    whole file, read again with read_values. So is every employee if
+    changed is None, or employee_db doesn't know what changed.
+    """
+    _apply_new_inputs(employee_db, tracker, changed, HOURLY)
+
+
+def apply_new_receipts(employee_db, tracker, changed):
+    """Brings the active commissioned employees' receipts up to date with
+    tracker, the ingest.InputTracker of the receipt file, after its
+    update returned changed. See apply_new_timecards.
+    """
+    _apply_new_inputs(employee_db, tracker, changed, COMMISSIONED)
+
+
+def _apply_inputs(employee_db, values, code):
+    """Sets the timecards or receipts of every active employee with the
+    classification code to theirs in values.
+    """
+    for employee in employee_db.emp_list:
+        classification = employee.classification
+        if classification.num() == code:
+            employee_values = values.get(employee.id, _NO_INPUTS)
+            if _inputs_of(classification)[0] != employee_values:
+                _set_inputs(classification, employee_values)
+                employee_db.mark_changed(employee.id)
+
+
+def _apply_new_inputs(employee_db, tracker, changed, code):
+    """apply_new_timecards or apply_new_receipts, for the classification
+    code.
+    """
+    pending = None if changed is None else employee_db.peek_changed()
+    if pending is None:
+        _apply_inputs(employee_db, tracker.read_values().values, code)
+        return
+    totals = tracker.totals
+    stale = []
+    for id_num in changed | pending:
+        employee = employee_db.find_employee(id_num)
+        if employee is None or employee.classification.num() != code:
+            continue
+        classification = employee.classification
+        inputs = _inputs_of(classification)[0]
+        new_values = tracker.new_values.get(id_num, _NO_INPUTS)
+        retracted = tracker.retracted.get(id_num, 0)
+        if retracted > len(inputs):
+            stale.append(employee)
+            continue
+        if new_values or retracted:
+            if retracted:
+                _set_inputs(classification, inputs[:len(inputs) - retracted])
+            _add_values(classification, new_values)
+            employee_db.mark_changed(id_num)
+        inputs, total = _inputs_of(classification)
+        if len(inputs) != totals.counts.get(id_num, 0) or \
+                total != totals.totals.get(id_num, 0.0):
+            stale.append(employee)
+    if stale:
+        values = tracker.read_values().values
+        for employee in stale:
+            _set_inputs(employee.classification,
+                        values.get(employee.id, _NO_INPUTS))
+            employee_db.mark_changed(employee.id)
+
+
+def _inputs_of(classification):
+    """Returns the timecards or receipts of an hourly or commissioned
+    classification, and their total.
+    """
+    if classification.num() == HOURLY:
+        return classification.timecards, classification.total_hours()
+    return classification.receipts, classification.total_receipts()
+
+
+def _set_inputs(classification, values):
+    """Replaces the timecards or receipts of an hourly or commissioned
+    classification.
+    """
+    if classification.num() == HOURLY:
+        classification.set_timecards(values)
+    else:
+        classification.set_receipts(values)
+
+
+def _add_values(classification, values):
+    """Adds values to the timecards or receipts of an hourly or
+    commissioned classification, in order.
+    """
+    if classification.num() == HOURLY:
+        add = classification.add_timecard
+    else:
+        add = classification.add_receipt
+    for value in values:
+        add(value)
+
+
+def pay_period(day=None):
+    """Returns the name of the semi-monthly pay period a date falls in,
+    "YYYY-MM-1" for the 1st to the 15th and "YYYY-MM-2" for the rest of
+    the month. Names sort in date order.
+    """
+    day = day or date.today()
+    return f'{day.year:04}-{day.month:02}-{1 if day.day <= 15 else 2}'
+
+
+class PayLedger:
+    """
+    The record of what every employee was paid in each pay period, kept in
+    an SQLite table keyed by (ID, period), so an employee's last pay or
+    pay history is one index lookup. Running payroll again in the same
+    period replaces that period's entries.
+
+    Each entry has the gross pay, the classification and rates it was
+    calculated from, the inputs (total hours for hourly employees, total
+    receipts for commissioned ones, and how many timecards or receipts
+    they came from), and the pay method and account it was paid by.
+
+    Recorded is when the entry was last written. A report with a
+    report.ReportCache only writes the entries that changed since the
+    last report of the same period, so for the others it is when the
+    employee's pay for the period was last worked out differently, not
+    when the report was last run.
+    """
+
+    FIELDS = ("ID", "Period", "Gross", "Classification", "Hourly_Rate",
+              "Salary", "Commission_Rate", "Inputs", "Input_Count",
+              "Pay_Method", "Route", "Account", "Name", "Recorded")
+
+    def __init__(self, path="pay_ledger.db"):
+        """Opens the ledger database at path, creating it if needed.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS pay_ledger ('
+                '"ID" INTEGER NOT NULL, "Period" TEXT NOT NULL, '
+                '"Gross" REAL NOT NULL, "Classification" TEXT, '
+                '"Hourly_Rate" REAL, "Salary" REAL, "Commission_Rate" REAL, '
+                '"Inputs" REAL, "Input_Count" INTEGER, "Pay_Method" TEXT, '
+                '"Route" TEXT, "Account" TEXT, "Name" TEXT, '
+                '"Recorded" TEXT, PRIMARY KEY ("ID", "Period")) '
+                'WITHOUT ROWID')
+
+    def record(self, period, entries):
+        """Saves the entries, made by ledger_entry, for a pay period in one
+        transaction.
+        """
+        recorded = datetime.now().isoformat(timespec="seconds")
+        columns = ", ".join(f'"{field}"' for field in self.FIELDS)
+        marks = ", ".join("?" for _ in self.FIELDS)
+        with self.connection:
+            self.connection.executemany(
+                f'INSERT OR REPLACE INTO pay_ledger ({columns}) '
+                f'VALUES ({marks})',
+                ((entry[0], period) + entry[1:] + (recorded,)
+                 for entry in entries))
+
+    def last_pay(self, id_num):
+        """Returns the entry of the employee's most recent pay period as a
+        dict keyed by FIELDS, or None if they've never been paid.
+        """
+        history = self.history(id_num, limit=1)
+        return history[0] if history else None
+
+    def history(self, id_num, limit=None):
+        """Returns the employee's entries as dicts keyed by FIELDS, newest
+        pay period first.
+        """
+        columns = ", ".join(f'"{field}"' for field in self.FIELDS)
+        cursor = self.connection.execute(
+            f'SELECT {columns} FROM pay_ledger WHERE "ID" = ? '
+            f'ORDER BY "Period" DESC LIMIT ?',
+            (int(id_num), -1 if limit is None else limit))
+        return [dict(zip(self.FIELDS, values)) for values in cursor]
+
+    def period(self, period):
+        """Returns every entry of a pay period as dicts keyed by FIELDS, in
+        ID order.
+        """
+        columns = ", ".join(f'"{field}"' for field in self.FIELDS)
+        cursor = self.connection.execute(
+            f'SELECT {columns} FROM pay_ledger WHERE "Period" = ? '
+            f'ORDER BY "ID"', (period,))
+        return [dict(zip(self.FIELDS, values)) for values in cursor]
+
+    def close(self):
+        """Closes the ledger database. The ledger can't be used after.
+        """
+        self.connection.close()
+
+
+def ledger_entry(employee, gross, inputs=None, input_count=None):
+    """Returns the PayLedger entry for paying an employee gross. The
+    inputs, total hours or receipts, and their count are taken from the
+    employee's classification unless they are given, so this must be
+    called before calculate_pay clears them.
+    """
+    classification = employee.classification
+    code = classification.num()
+    hourly_rate = salary = commission_rate = None
+    if code == HOURLY:
+        hourly_rate = classification.hourly_rate
+        if inputs is None:
+            inputs = classification.total_hours()
+            input_count = classification.timecard_count
+    else:
+        salary = classification.salary
+        if code == COMMISSIONED:
+            commission_rate = classification.commission_rate
+            if inputs is None:
+                inputs = classification.total_receipts()
+                input_count = classification.receipt_count
+        else:
+            inputs = input_count = None
+    pay_method = employee.pay_method
+    route = getattr(pay_method, "route_num", None)
+    account = getattr(pay_method, "account_num", None)
+    return (int(employee.id), float(gross), str(classification),
+            hourly_rate, salary, commission_rate, inputs, input_count,
+            str(pay_method), None if route is None else str(route),
+            None if account is None else str(account), employee.name)
+
+
+class Scenario:
+    """
+    A what-if change to pay rates, for simulate. It is made of
+    adjustments, each raising (or, with a negative percent, cutting) the
+    rates of the employees matching some criteria, e.g.
+
+        Scenario("Production raise").adjust(5, dept="Production",
+                                            classification="hourly")
+
+    Adjustments that match the same employee compound.
+    """
+
+    __slots__ = ("name", "adjustments")
+
+    RATES = ("hourly_rate", "salary", "commission_rate")
+
+    def __init__(self, name):
+        """Initialize a scenario with no adjustments.
+        """
+        self.name = name
+        self.adjustments = []
+
+    def adjust(self, percent, rate=None, **criteria):
+        """Adds an adjustment of percent to rate, one of RATES, or to all
+        of them if rate is None, for the employees matching criteria, which
+        are the same as for EmployeeDB.query. Returns the scenario, so
+        adjustments can be chained.
+        """
+        if rate is not None and rate not in self.RATES:
+            raise Exception(f'Cannot adjust "{rate}". Use one of: '
+                            f'{", ".join(self.RATES)}.')
+        rates = self.RATES if rate is None else (rate,)
+        self.adjustments.append((criteria, rates, 1 + percent / 100))
+        return self
+
+
+def simulate(employee_db, scenarios, hours=None, receipts=None,
+             batch_size=4000000):
+    """Works out what one pay period's payroll would cost under each
+    scenario, without changing any employee. Employees are matched with
+    EmployeeDB.query, and every scenario is evaluated over columns of the
+    active employees' rates at once, in batches of scenarios of up to
+    batch_size employee rates. A scenario with no adjustments costs the
+    same as compute_payroll.
+
+    Input: the EmployeeDB, a list of Scenario objects, and optional dicts
+    of ID number to timecard hours / receipts (see build_columns).
+    Output: a list with a dict for each scenario, in order, with its
+    "name", "total" cost and "by_dept", a dict of dept -> cost.
+    """
+    employees = sorted(employee_db.emp_list, key=lambda emp: emp.id)
+    columns = build_columns(employees, hours, receipts)
+    depts = sorted({employee.dept for employee in employees})
+    dept_nums = {dept: index for index, dept in enumerate(depts)}
+    dept_column = array("l", (dept_nums[employee.dept]
+                              for employee in employees))
+
+    positions = {}
+    matches = {}
+    for scenario in scenarios:
+        for criteria, _, _ in scenario.adjustments:
+            key = tuple(sorted(criteria.items()))
+            if key not in matches:
+                if not positions:
+                    positions = {id_num: index for index, id_num
+                                 in enumerate(columns.ids)}
+                matches[key] = array("l", sorted(
+                    positions[employee.id]
+                    for employee in employee_db.query(**criteria)))
+
+    if np is not None:
+        costs = _simulate_numpy(columns, dept_column, len(depts), scenarios,
+                                matches, batch_size)
+    else:
+        costs = _simulate_python(columns, dept_column, len(depts),
+                                 scenarios, matches)
+    return [{"name": scenario.name, "total": total,
+             "by_dept": dict(zip(depts, by_dept))}
+            for scenario, (total, by_dept) in zip(scenarios, costs)]
+
+
+def _rate_multipliers(scenario, matches):
+    """Yields (rate, positions, factor) for each adjustment of a scenario.
+    """
+    for criteria, rates, factor in scenario.adjustments:
+        for rate in rates:
+            yield rate, matches[tuple(sorted(criteria.items()))], factor
+
+
+def _simulate_numpy(columns, dept_column, num_depts, scenarios, matches,
+                    batch_size):
+    """simulate using NumPy. Returns a (total, by_dept list) pair per
+    scenario.
+    """
+    codes = np.frombuffer(columns.codes, dtype=np.int8)
+    hourly = codes == HOURLY
+    rates = {"hourly_rate": np.frombuffer(columns.hourly_rates,
+                                          dtype=np.float64),
+             "salary": np.frombuffer(columns.salaries, dtype=np.float64),
+             "commission_rate": np.frombuffer(columns.commission_rates,
+                                              dtype=np.float64)}
+    counts = np.frombuffer(columns.input_counts, dtype=np.int64)
+    inputs = np.frombuffer(columns.inputs, dtype=np.float64)
+    depts = np.frombuffer(dept_column, dtype=np.dtype(dept_column.typecode))
+    dept_masks = [depts == dept for dept in range(num_depts)]
+    match_arrays = {key: np.frombuffer(value, dtype=depts.dtype)
+                    for key, value in matches.items()}
+
+    costs = []
+    size = len(codes)
+    per_batch = max(1, batch_size // max(size, 1))
+    for start in range(0, len(scenarios), per_batch):
+        batch = scenarios[start:start + per_batch]
+        factors = {rate: np.ones((len(batch), size)) for rate in rates}
+        for row, scenario in enumerate(batch):
+            for rate, matched, factor in _rate_multipliers(scenario,
+                                                           match_arrays):
+                factors[rate][row, matched] *= factor
+        pay = np.where(hourly, 0.0,
+                       rates["salary"] * factors["salary"] / 24)
+        _add_inputs(pay, np.where(
+            hourly, rates["hourly_rate"] * factors["hourly_rate"],
+            rates["commission_rate"] * factors["commission_rate"]),
+            counts, inputs)
+        totals = pay.sum(axis=1)
+        by_dept = [pay[:, mask].sum(axis=1) for mask in dept_masks]
+        for row in range(len(batch)):
+            costs.append((float(totals[row]),
+                          [float(dept[row]) for dept in by_dept]))
+    return costs
+
+
+def _simulate_python(columns, dept_column, num_depts, scenarios, matches):
+    """simulate without NumPy. Returns a (total, by_dept list) pair per
+    scenario.
+    """
+    costs = []
+    starts = columns.input_starts()
+    for scenario in scenarios:
+        factors = {rate: {} for rate in Scenario.RATES}
+        for rate, matched, factor in _rate_multipliers(scenario, matches):
+            rate_factors = factors[rate]
+            for index in matched:
+                rate_factors[index] = rate_factors.get(index, 1.0) * factor
+        total = 0.0
+        by_dept = [0.0] * num_depts
+        for index, start in enumerate(starts):
+            if columns.codes[index] == HOURLY:
+                amount = 0.0
+                rate = columns.hourly_rates[index] * \
+                    factors["hourly_rate"].get(index, 1.0)
+            else:
+                amount = columns.salaries[index] * \
+                    factors["salary"].get(index, 1.0) / 24
+                rate = columns.commission_rates[index] * \
+                    factors["commission_rate"].get(index, 1.0)
+            for value in columns.inputs[start:start +
+                                        columns.input_counts[index]]:
+                amount += value * rate
+            total += amount
+            by_dept[dept_column[index]] += amount
+        costs.append((total, by_dept))
+    return costs
+
+
+def _compute_numpy(columns):
+    """compute_payroll using NumPy.
+    """
+    ids = np.frombuffer(columns.ids, dtype=np.int64)
+    codes = np.frombuffer(columns.codes, dtype=np.int8)
+    rates = np.frombuffer(columns.hourly_rates, dtype=np.float64)
+    salaries = np.frombuffer(columns.salaries, dtype=np.float64)
+    commission_rates = np.frombuffer(columns.commission_rates,
+                                     dtype=np.float64)
+    counts = np.frombuffer(columns.input_counts, dtype=np.int64)
+    inputs = np.frombuffer(columns.inputs, dtype=np.float64)
+
+    hourly = codes == HOURLY
+    pay = np.where(hourly, 0.0, salaries / 24)
+    _add_inputs(pay, np.where(hourly, rates, commission_rates), counts,
+                inputs)
+
+    order = np.argsort(ids, kind="stable")
+    return PayrollResult(ids[order], pay[order])
+
+
+def _add_inputs(pay, rates, counts, inputs):
+    """Adds each employee's inputs x their rate to their pay, in place.
+    Like calculate_pay, the inputs are added one at a time in order, so the
+    sums are rounded the same way: each step adds the next input of every
+    employee that still has one. pay and rates may have a leading axis of
+    scenarios.
+    """
+    starts = np.cumsum(counts) - counts
+    rows = np.flatnonzero(counts)
+    step = 0
+    while len(rows):
+        pay[..., rows] += inputs[starts[rows] + step] * rates[..., rows]
+        step += 1
+        rows = rows[counts[rows] > step]
+
+
+def _compute_python(columns):
+    """compute_payroll without NumPy.
+    """
+    order = sorted(range(len(columns.ids)), key=columns.ids.__getitem__)
+    starts = columns.input_starts()
+    ids = array("q")
+    pay = array("d")
+    for index in order:
+        code = columns.codes[index]
+        if code == HOURLY:
+            amount = 0
+            rate = columns.hourly_rates[index]
+        else:
+            amount = columns.salaries[index] / 24
+            rate = columns.commission_rates[index]
+        start = starts[index]
+        for value in columns.inputs[start:start +
+                                    columns.input_counts[index]]:
+            amount += value * rate
+        ids.append(columns.ids[index])
+        pay.append(amount)
+    return PayrollResult(ids, pay)
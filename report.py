@@ -0,0 +1,622 @@
+"""
+This module contains the all employee report of the employee management
+app, written to "report.csv". It has no GUI code, so reports can also be
+made without opening the app, e.g. by benchmark.py.
+
+Each employee's block is laid out by one of six renderers, one per
+classification and pay method, picked by the types of the employee's
+classification and pay method objects. The report is written block by
+block through a large buffer, so memory use doesn't grow with headcount.
+
+With more than one worker, contiguous chunks of employees are rendered
+in a pool of processes and written in the order of the employee list, so
+the report is identical to one rendered in this process.
+
+A ReportCache keeps each employee's block between reports, so after a few
+changes only the changed employees' blocks are rendered again.
+
+The same pass can also write machine-readable exports of the pay, as a
+csv file and as JSON Lines, with one typed row per employee.
+
+ReportReader reads pages of a written report, finds employees and
+searches it without reading the whole file into memory.
+"""
+
+import io
+import os
+import re
+import csv
+import json
+import mmap
+from array import array
+from bisect import bisect_right
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+from employee_database import Commissioned, DirectMethod, Hourly, \
+    MailedMethod, Salary
+from payroll import ledger_entry
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BUFFER_SIZE = 1 << 20
+# Number of bytes of the report ReportReader.search decodes at a time.
+SEARCH_BLOCK = 1 << 20
+# Number of employees in each chunk rendered by a worker process, when
+#   rendering in parallel.
+CHUNK_EMPLOYEES = 1000
+# Number of chunks queued up for each worker process. More chunks than
+#   workers keeps them busy when chunks take different times, while only
+#   that many chunks are held in memory at once.
+CHUNKS_PER_WORKER = 4
+
+# The columns of the csv and JSON Lines exports. Rates that don't apply to
+#   an employee's classification, and Route and Account for employees paid
+#   by mail, are empty in the csv file and null in JSON.
+EXPORT_FIELDS = ("ID", "Name", "Classification", "Hourly_Rate", "Salary",
+                 "Commission_Rate", "Inputs", "Input_Count", "Gross_Pay",
+                 "Pay_Method", "Route", "Account")
+
+
+def _hourly_direct(employee):
+    """Returns the report block of an hourly employee paid by direct deposit.
+    """
+    return f"Employee ID: {employee.id}       Name: " \
+           f"{employee.name}         Address: " \
+           f"{employee.full_address()}\n" \
+           f"Classification: hourly    " \
+           f"Hourly pay: " \
+           f"${employee.classification.hourly_rate:.2f}    " \
+           f"   Payment method: direct deposit\n" \
+           f"Routing num: {employee.pay_method.route_num}  " \
+           f" Account num: " \
+           f"{employee.pay_method.account_num} Date of " \
+           f"birth: {employee.birth_date}\n" \
+           f"SSN: {employee.ssn}          Phone: " \
+           f"{employee.phone}     Email: {employee.email}\n" \
+           f"Start date: {employee.start_date}     " \
+           f"End date: {employee.end_date}\n" \
+           f"Title: {employee.title}           Dept: " \
+           f"{employee.dept}\n" \
+           f"Permission level: {employee.permission}\n\n"
+
+
+def _hourly_mail(employee):
+    """Returns the report block of an hourly employee paid by mail.
+    """
+    return f"Employee ID: {employee.id}        Name: " \
+           f"{employee.name}   Address: " \
+           f"{employee.full_address()}\n" \
+           f"Classification: hourly     " \
+           f"Hourly pay: " \
+           f"${employee.classification.hourly_rate:.2f}    " \
+           f"   Payment method: mail\n" \
+           f"Date of birth: {employee.birth_date}  SSN: " \
+           f"{employee.ssn}\n" \
+           f"Phone: {employee.phone}       Email: " \
+           f"{employee.email}\n" \
+           f"Start date: {employee.start_date}       End " \
+           f"date: {employee.end_date}\n" \
+           f"Title: {employee.title}      Dept: " \
+           f"{employee.dept}\n" \
+           f"Permission level: " \
+           f"{employee.permission}\n\n"
+
+
+def _salary_direct(employee):
+    """Returns the report block of a salary employee paid by direct deposit.
+    """
+    return f"Employee ID: {employee.id}        Name: " \
+           f"{employee.name}      Address: " \
+           f"{employee.full_address()}\n" \
+           f"Classification: salary     " \
+           f"Salary: ${employee.classification.salary:.2f} " \
+           f"   Payment method: direct deposit\n" \
+           f"Routing number: " \
+           f"{employee.pay_method.route_num} " \
+           f"Account number: " \
+           f"{employee.pay_method.account_num}    Date of " \
+           f"birth: {employee.birth_date}\n" \
+           f"SSN: {employee.ssn}           Phone: " \
+           f"{employee.phone}    Email: {employee.email}\n" \
+           f"Start date: {employee.start_date}       End " \
+           f"date: {employee.end_date}\n" \
+           f"Title: {employee.title}           Dept: " \
+           f"{employee.dept}\n" \
+           f"Permission level: {employee.permission}\n\n"
+
+
+def _salary_mail(employee):
+    """Returns the report block of a salary employee paid by mail.
+    """
+    return f"Employee ID: {employee.id}      Name: " \
+           f"{employee.name}    Address: " \
+           f"{employee.full_address()}\n" \
+           f"Classification: salary   " \
+           f"Salary: ${employee.classification.salary:.2f} " \
+           f"      Payment method: mail\n" \
+           f"Date of birth: {employee.birth_date} SSN: " \
+           f"{employee.ssn}\n" \
+           f"Phone: {employee.phone}     Email: " \
+           f"{employee.email}\n" \
+           f"Start date: {employee.start_date}     End " \
+           f"date: {employee.end_date}\n" \
+           f"Title: {employee.title}           Dept: " \
+           f"{employee.dept}\n" \
+           f"Permission level: {employee.permission}\n\n"
+
+
+def _commissioned_direct(employee):
+    """Returns the report block of a commissioned employee paid by direct deposit.
+    """
+    return f"Employee ID: {employee.id}             " \
+           f"Name: {employee.name}      Address: " \
+           f"{employee.full_address()}\n" \
+           f"Classification: commissioned    " \
+           f"Salary: ${employee.classification.salary:.2f} " \
+           f"         Commission rate: " \
+           f"${employee.classification.commission_rate:.2f}" \
+           f"\n" \
+           f"Payment method: direct deposit  Routing" \
+           f" number: {employee.pay_method.route_num} " \
+           f"Account number: " \
+           f"{employee.pay_method.account_num}\n" \
+           f"Date of birth: {employee.birth_date}        " \
+           f"SSN: {employee.ssn}           Phone: " \
+           f"{employee.phone}\n" \
+           f"Email: {employee.email}    Start date: " \
+           f"{employee.start_date}      End date: " \
+           f"{employee.end_date}\n" \
+           f"Title: {employee.title}         Dept: " \
+           f"{employee.dept}\n" \
+           f"Permission level: {employee.permission}\n\n"
+
+
+def _commissioned_mail(employee):
+    """Returns the report block of a commissioned employee paid by mail.
+    """
+    return f"Employee ID: {employee.id}          Name:" \
+           f" {employee.name}    Address: " \
+           f"{employee.full_address()}\n" \
+           f"Classification: commissioned " \
+           f"Salary: ${employee.classification.salary:.2f} " \
+           f"       Commission rate: " \
+           f"${employee.classification.commission_rate:.2f}" \
+           f"\n" \
+           f"Payment method: mail         " \
+           f"Date of birth: {employee.birth_date}\n" \
+           f"SSN: {employee.ssn}             Phone: " \
+           f"{employee.phone}     Email: {employee.email}\n" \
+           f"Start date: {employee.start_date}        End " \
+           f"date: {employee.end_date}\n" \
+           f"Title: {employee.title}               Dept: " \
+           f"{employee.dept}\n" \
+           f"Permission level: {employee.permission}\n\n"
+
+
+# The renderer for each (classification, pay method) type.
+_RENDERERS = {
+    (Hourly, DirectMethod): _hourly_direct,
+    (Hourly, MailedMethod): _hourly_mail,
+    (Salary, DirectMethod): _salary_direct,
+    (Salary, MailedMethod): _salary_mail,
+    (Commissioned, DirectMethod): _commissioned_direct,
+    (Commissioned, MailedMethod): _commissioned_mail,
+}
+
+
+def employee_report(employee):
+    """Returns the block of the report that lists all of the employee's
+    data members, laid out for their classification and pay method.
+    """
+    renderer = _RENDERERS.get((type(employee.classification),
+                               type(employee.pay_method)))
+    if renderer is None:
+        return ""
+    return renderer(employee)
+
+
+def report_blocks(emp_list, pay=None, ledger_inputs=None):
+    """Yields, for each employee in emp_list, their report block followed
+    by the line stating what they will be paid, along with their pay ledger
+    entry.
+
+    Input: the employees; optionally pay, a dict of ID number to the
+    amount each employee is paid, used instead of
+    Employee.preview_report, and ledger_inputs, a function returning the
+    (inputs, input count) of an employee for the pay ledger when pay is
+    given.
+    Output: (text, ledger entry) pairs.
+    """
+    for employee in emp_list:
+        block = employee_report(employee)
+        if pay is None:
+            entry = ledger_entry(employee, employee.preview_pay())
+            pay_report = employee.preview_report()
+        else:
+            inputs = ledger_inputs(employee) if ledger_inputs else ()
+            entry = ledger_entry(employee, pay[int(employee.id)], *inputs)
+            pay_report = employee.pay_method.payment_message(entry[1])
+        yield f"{block}\t{pay_report}\n\n\n", entry
+
+
+def parallel_report_blocks(emp_list, pay=None, ledger_inputs=None,
+                           workers=None):
+    """Yields the same (text, ledger entry) pairs as report_blocks, in the
+    same order, but renders contiguous chunks of CHUNK_EMPLOYEES employees
+    in workers processes (None for one per CPU). The employees are taken
+    from emp_list a chunk at a time, as the workers need them, so it can
+    be any iterable and isn't copied. ledger_inputs is called in this
+    process, so it doesn't have to be picklable.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        yield from report_blocks(emp_list, pay, ledger_inputs)
+        return
+
+    employees = iter(emp_list)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while len(pending) < workers * CHUNKS_PER_WORKER:
+                chunk = list(islice(employees, CHUNK_EMPLOYEES))
+                if not chunk:
+                    break
+                chunk_pay = chunk_inputs = None
+                if pay is not None:
+                    chunk_pay = {int(employee.id): pay[int(employee.id)]
+                                 for employee in chunk}
+                    if ledger_inputs:
+                        chunk_inputs = [ledger_inputs(employee)
+                                        for employee in chunk]
+                pending.append(executor.submit(_render_chunk, chunk,
+                                               chunk_pay, chunk_inputs))
+            if not pending:
+                break
+            yield from pending.popleft().result()
+
+
+def _render_chunk(employees, pay, inputs):
+    """Returns the (text, ledger entry) pairs of a chunk of employees. Run
+    in the worker processes of parallel_report_blocks, with the ledger
+    inputs of the employees, if any, in a list in the same order.
+    """
+    ledger_inputs = None
+    if inputs is not None:
+        inputs = iter(inputs)
+
+        def ledger_inputs(employee):
+            return next(inputs)
+    return list(report_blocks(employees, pay, ledger_inputs))
+
+
+class ReportCache:
+    """
+    The report block and pay ledger entry of each employee, kept between
+    reports so only the employees that changed are rendered again, e.g.
+
+        cache.invalidate(employee_db.take_changed())
+        write_report(employee_db.emp_list, cache=cache)
+
+    A cached block is used until the employee is invalidated, or, when
+    pay is given to write_report, until their ledger entry changes. The
+    cache also keeps each employee's export lines, and remembers which
+    entries have been recorded in which ledger and period. Entries that
+    haven't changed aren't recorded again, which keeps a report after a
+    few changes from rewriting the whole period in the ledger; their
+    Recorded time stays that of when they last changed.
+    """
+
+    __slots__ = ("blocks", "exports", "with_pay", "ledger", "period",
+                 "recorded")
+
+    def __init__(self):
+        """Initialize an empty cache.
+        """
+        # ID -> (text, ledger entry)
+        self.blocks = {}
+        # ID -> (csv line, JSON line) of the export row
+        self.exports = {}
+        self.with_pay = False
+        self.ledger = None
+        self.period = None
+        # IDs whose cached entry is recorded in ledger for period.
+        self.recorded = set()
+
+    def invalidate(self, id_nums):
+        """Drops the blocks of the employees with the given IDs, or of all
+        employees if id_nums is None.
+        """
+        if id_nums is None:
+            self.blocks.clear()
+            self.exports.clear()
+            self.recorded.clear()
+            return
+        for id_num in id_nums:
+            self.blocks.pop(int(id_num), None)
+            self.exports.pop(int(id_num), None)
+            self.recorded.discard(int(id_num))
+
+    def refresh(self, emp_list, pay=None, ledger_inputs=None, workers=1):
+        """Renders the blocks of the employees in emp_list that aren't
+        cached or are out of date, as write_report would, and returns the
+        (text, ledger entry) pair of each employee in emp_list.
+        """
+        emp_list = list(emp_list)
+        if self.with_pay != (pay is not None):
+            self.invalidate(None)
+            self.with_pay = pay is not None
+        blocks = self.blocks
+        stale = []
+        for employee in emp_list:
+            cached = blocks.get(int(employee.id))
+            if cached is None:
+                stale.append(employee)
+            elif pay is not None:
+                inputs = ledger_inputs(employee) if ledger_inputs else ()
+                if ledger_entry(employee, pay[int(employee.id)],
+                                *inputs) != cached[1]:
+                    stale.append(employee)
+
+        if workers == 1:
+            rendered = report_blocks(stale, pay, ledger_inputs)
+        else:
+            rendered = parallel_report_blocks(stale, pay, ledger_inputs,
+                                              workers)
+        for employee, block in zip(stale, rendered):
+            blocks[int(employee.id)] = block
+            self.exports.pop(int(employee.id), None)
+            self.recorded.discard(int(employee.id))
+        return [blocks[int(employee.id)] for employee in emp_list]
+
+    def unrecorded(self, entries, ledger, period):
+        """Yields the entries that haven't been recorded in ledger for
+        period yet, taking them to be recorded from then on.
+        """
+        if ledger is not self.ledger or period != self.period:
+            self.ledger = ledger
+            self.period = period
+            self.recorded.clear()
+        recorded = self.recorded
+        for entry in entries:
+            if entry[0] not in recorded:
+                recorded.add(entry[0])
+                yield entry
+
+
+@contextmanager
+def _open_export(file_name, newline=None):
+    """Opens an export file for writing, or gives None if no file name is
+    given.
+    """
+    if file_name is None:
+        yield None
+        return
+    with open(file_name, "w", encoding="utf8", newline=newline,
+              buffering=BUFFER_SIZE) as export:
+        yield export
+
+
+def export_row(entry):
+    """Returns the export row, in EXPORT_FIELDS order, of a pay ledger
+    entry. Gross pay is rounded to the cent, as in the report.
+    """
+    (id_num, gross, classification, hourly_rate, salary, commission_rate,
+     inputs, input_count, pay_method, route, account, name) = entry
+    return (id_num, name, classification, hourly_rate, salary,
+            commission_rate, inputs, input_count, round(gross, 2),
+            pay_method, route, account)
+
+
+def _export_formatter():
+    """Returns a function giving the csv line and the JSON line of the
+    export row of a pay ledger entry.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+
+    def export_lines(entry):
+        row = export_row(entry)
+        writer.writerow(row)
+        csv_line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return csv_line, encode(dict(zip(EXPORT_FIELDS, row))) + "\n"
+    return export_lines
+
+
+def write_report(emp_list, report_file="report.csv", pay=None,
+                 ledger_inputs=None, ledger=None, period=None,
+                 csv_export=None, jsonl_export=None, workers=1,
+                 cache=None):
+    """Writes the report of the employees in emp_list to report_file, each
+    employee's block followed by a line stating what they will be paid.
+    See report_blocks for pay and ledger_inputs. If ledger, a
+    payroll.PayLedger, is given, what each employee is paid is recorded in
+    it for period. If csv_export or jsonl_export are given, an export row
+    for each employee is written to them too. All of this is done in the
+    same pass. With more than one worker (None for one per CPU), the
+    blocks are rendered by parallel_report_blocks. If cache, a
+    ReportCache, is given, only the blocks it doesn't have up to date are
+    rendered, and only the entries not yet recorded are recorded.
+
+    Output: the number of employees in the report.
+    """
+    count = 0
+
+    def entries(report, csv_file, jsonl_file):
+        nonlocal count
+        write = report.write
+        export_lines = _export_formatter()
+        exports = cache.exports if cache is not None else None
+        if cache is not None:
+            blocks = cache.refresh(emp_list, pay, ledger_inputs, workers)
+        elif workers == 1:
+            blocks = report_blocks(emp_list, pay, ledger_inputs)
+        else:
+            blocks = parallel_report_blocks(emp_list, pay, ledger_inputs,
+                                            workers)
+        for text, entry in blocks:
+            write(text)
+            if csv_file is not None or jsonl_file is not None:
+                lines = exports.get(entry[0]) if exports is not None \
+                    else None
+                if lines is None:
+                    lines = export_lines(entry)
+                    if exports is not None:
+                        exports[entry[0]] = lines
+                if csv_file is not None:
+                    csv_file.write(lines[0])
+                if jsonl_file is not None:
+                    jsonl_file.write(lines[1])
+            count += 1
+            yield entry
+
+    with open(report_file, "w", encoding="utf8",
+              buffering=BUFFER_SIZE) as report, \
+            _open_export(csv_export, newline='') as csv_file, \
+            _open_export(jsonl_export) as jsonl_file:
+        if csv_file is not None:
+            csv.writer(csv_file).writerow(EXPORT_FIELDS)
+        if ledger is not None and cache is not None:
+            try:
+                ledger.record(period, cache.unrecorded(
+                    entries(report, csv_file, jsonl_file), ledger, period))
+            except Exception:
+                # Nothing was recorded, so record everything next time.
+                cache.recorded.clear()
+                raise
+        elif ledger is not None:
+            ledger.record(period, entries(report, csv_file, jsonl_file))
+        else:
+            for _ in entries(report, csv_file, jsonl_file):
+                pass
+    return count
+
+
+class ReportReader:
+    """
+    A written report, mapped into memory with mmap rather than read, so
+    any page of it can be read, an employee's block found, or text
+    searched for, without loading the whole file. Lines are found through
+    an index of the byte offset each line starts at, built when the
+    report is opened. Use it as a context manager, or call close.
+    """
+
+    __slots__ = ("_file", "_data", "_line_starts", "_id_offsets")
+
+    _ID_PATTERN = re.compile(rb"^Employee ID: (\d+)", re.MULTILINE)
+
+    def __init__(self, report_file="report.csv"):
+        """Opens report_file and indexes its lines.
+        """
+        self._file = open(report_file, "rb")
+        self._data = b""
+        if os.fstat(self._file.fileno()).st_size:
+            self._data = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        self._line_starts = _line_starts(self._data)
+        # Employee ID -> byte offset of their block. None until the first
+        #   find_employee.
+        self._id_offsets = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Unmaps and closes the report file.
+        """
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = b""
+        self._file.close()
+
+    def __len__(self):
+        """Returns the number of lines in the report.
+        """
+        return len(self._line_starts)
+
+    def lines(self, start, count):
+        """Returns up to count lines of the report, without their line
+        breaks, starting at line number start (the first line is 0).
+        """
+        starts = self._line_starts
+        start = max(0, start)
+        end = min(len(starts), start + count)
+        if start >= end:
+            return []
+        stop = starts[end] if end < len(starts) else len(self._data)
+        text = self._data[starts[start]:stop].decode("utf8", "replace")
+        return text.split("\n")[:end - start]
+
+    def line_of(self, offset):
+        """Returns the number of the line holding the byte at offset.
+        """
+        return bisect_right(self._line_starts, offset) - 1
+
+    def find_employee(self, id_num):
+        """Returns the number of the first line of the employee's block,
+        or None if they aren't in the report.
+        """
+        if self._id_offsets is None:
+            self._id_offsets = {
+                int(match.group(1)): match.start()
+                for match in self._ID_PATTERN.finditer(self._data)}
+        offset = self._id_offsets.get(int(id_num))
+        return None if offset is None else self.line_of(offset)
+
+    def search(self, text, start=0):
+        """Returns the number of the first line at or after line number
+        start that contains text, ignoring case, or None if none do. Case
+        is ignored for any letter, not only ASCII ones, by case folding
+        both the text and the report, which is decoded SEARCH_BLOCK bytes
+        of whole lines at a time, so it is never all in memory.
+        """
+        starts = self._line_starts
+        if not text or start >= len(starts):
+            return None
+        text = text.casefold()
+        line = max(0, start)
+        while line < len(starts):
+            end = bisect_right(starts, starts[line] + SEARCH_BLOCK,
+                               line + 1)
+            stop = starts[end] if end < len(starts) else len(self._data)
+            block = self._data[starts[line]:stop].decode(
+                "utf8", "replace").casefold()
+            index = block.find(text)
+            if index != -1:
+                return line + block.count("\n", 0, index)
+            line = end
+        return None
+
+
+def _line_starts(data):
+    """Returns an array of the byte offset each line of data starts at.
+    """
+    if not len(data):
+        return array("q")
+    if np is not None:
+        breaks = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+        if len(breaks) and breaks[-1] == len(data) - 1:
+            breaks = breaks[:-1]
+        starts = array("q", [0])
+        starts.frombytes((breaks + 1).astype(np.int64).tobytes())
+        return starts
+    starts = array("q", [0])
+    find = data.find
+    end = len(data) - 1
+    position = find(b"\n")
+    while position != -1 and position != end:
+        starts.append(position + 1)
+        position = find(b"\n", position + 1)
+    return starts
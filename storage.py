@@ -0,0 +1,654 @@
+"""
+This module contains the storage engines that EmployeeDB uses to save and
+load employee rows. Every engine deals in rows: dicts keyed by the column
+names in FIELDNAMES, the same layout as the rows of employees.csv.
+
+Engines:
+    CSVStorage - the original employees.csv / archived.csv files.
+    SQLiteStorage - a single SQLite database file, with indexed columns.
+
+Running this file imports the existing CSV files into "employees.db".
+"""
+
+import os
+import re
+import csv
+import sys
+import time
+import mmap
+import marshal
+import hashlib
+import sqlite3
+from datetime import datetime
+from contextlib import contextmanager
+
+
+FIELDNAMES = "ID,Name,Address,City,State,Zip,Classification," \
+             "Pay_Method,Salary,Hourly,Commission,Route,Account," \
+             "Birth_Date,SSN,Phone,Email,Start_Date,End_Date," \
+             "Title,Dept,Permission,Password".split(',')
+
+JOURNAL_FIELDNAMES = ["ID", "Field", "Value", "Timestamp"]
+
+# Bump whenever the layout of what is saved in a snapshot changes, so old
+#   snapshots are ignored.
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_MAGIC = b"UVUSNAP"
+
+# Matches the ID at the start of each data row of a csv file.
+_ROW_ID = re.compile(rb'^(\d+),', re.MULTILINE)
+
+
+def _create_csv(file):
+    """Creates a csv file with just the employee header row, if it does
+    not already exist.
+    """
+    if not os.path.exists(file):
+        with open(file, "x", newline='', encoding="utf8") as database:
+            writer = csv.writer(database)
+            writer.writerow(FIELDNAMES)
+
+
+class CSVStorage:
+    """
+    Storage engine for the original csv layout.
+
+    Active employees are kept in employees.csv. Archiving an employee
+    appends their row to archived.csv, and their row stays in
+    employees.csv, so anyone in archived.csv is treated as archived.
+
+    Edits are not written to employees.csv straight away. Each edited
+    field is appended to a journal file (employees.journal) as a line of
+    ID, field, value and timestamp, and the journal is replayed over
+    employees.csv on load. compact() folds the journal into a fresh
+    employees.csv; it also happens on load once the journal holds
+    compact_after entries.
+
+    allocate_ids() hands out new employee IDs from a high-water mark
+    kept in id_sequence.txt, locked so that several processes using the
+    same files never get the same ID.
+
+    source_files() lists the files that EmployeeDB's startup snapshot
+    (snapshot_file) depends on.
+
+    For lazy loading, index_rows() scans the files once for the byte
+    offset of each row, and read_row() parses a single row from its
+    offset. This expects one row per line, which is how rows are written.
+    """
+
+    def __init__(self, employees_file="employees.csv",
+                 archived_file="archived.csv", journal_file=None,
+                 compact_after=1000):
+        self.employees_file = employees_file
+        self.archived_file = archived_file
+        if journal_file is None:
+            journal_file = os.path.splitext(employees_file)[0] + ".journal"
+        self.journal_file = journal_file
+        self.compact_after = compact_after
+        self.snapshot_file = os.path.splitext(employees_file)[0] + ".snapshot"
+        self.sequence_file = os.path.join(
+            os.path.dirname(employees_file), "id_sequence.txt")
+        self._finish_write_base()
+        _create_csv(self.employees_file)
+        _create_csv(self.archived_file)
+        # Filled in by index_rows(), for lazy loading.
+        self._offsets = None
+        self._archived_offsets = None
+        self._journal = None
+
+    def load(self):
+        """Returns two lists of rows, the archived rows and the employee
+        rows, with the journal replayed over the employee rows.
+        """
+        with open(self.archived_file, encoding="utf8") as archived:
+            archived_rows = list(csv.DictReader(archived))
+        employee_rows, entries = self._journaled_rows()
+        if entries >= self.compact_after:
+            self._write_base(employee_rows)
+        return archived_rows, employee_rows
+
+    def allocate_ids(self, count, floor):
+        """Reserves count new employee IDs, above both the saved
+        high-water mark and floor, the highest ID already in use.
+
+        Output: the first reserved ID. The block is that ID through
+                that ID + count - 1.
+        """
+        with _file_lock(self.sequence_file + ".lock"):
+            high_water = floor
+            if os.path.exists(self.sequence_file):
+                with open(self.sequence_file, encoding="utf8") as sequence:
+                    text = sequence.read().strip()
+                if text:
+                    high_water = max(high_water, int(text))
+            _write_text_atomic(self.sequence_file, f"{high_water + count}\n")
+        return high_water + 1
+
+    def source_files(self):
+        """Returns the files that the loaded rows come from.
+        """
+        return [self.employees_file, self.archived_file, self.journal_file]
+
+    def index_rows(self):
+        """Scans both files for the byte offset of every row, without
+        parsing the rows, and reads the journal into memory.
+
+        Output: two lists of IDs, the archived IDs and the employee IDs,
+                in file order.
+        """
+        self._archived_offsets = _index_file(self.archived_file)
+        self._offsets = _index_file(self.employees_file)
+        self._journal = {}
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, newline='',
+                      encoding="utf8") as journal:
+                for entry in csv.reader(journal):
+                    if len(entry) == len(JOURNAL_FIELDNAMES):
+                        self._journal.setdefault(int(entry[0]), []).append(
+                            (entry[1], entry[2]))
+        return list(self._archived_offsets), list(self._offsets)
+
+    def read_row(self, id_num, archived=False):
+        """Parses the row with the given ID from its offset found by
+        index_rows(), with any journaled edits applied.
+
+        Output: the row dict, or None if there is no row with the ID.
+        """
+        if archived:
+            file = self.archived_file
+            offset = self._archived_offsets.get(id_num)
+        else:
+            file = self.employees_file
+            offset = self._offsets.get(id_num)
+        if offset is None:
+            return None
+        with open(file, "rb") as database:
+            database.seek(offset)
+            line = database.readline().decode("utf8")
+        row = dict(zip(FIELDNAMES, next(csv.reader([line]))))
+        if not archived:
+            for field, value in self._journal.get(id_num, []):
+                if field in row:
+                    row[field] = value
+        return row
+
+    def add_row(self, row):
+        """Adds a new employee row to employees.csv.
+        """
+        if self._offsets is not None:
+            self._offsets[int(row["ID"])] = os.path.getsize(self.employees_file)
+        _append_row(row, self.employees_file)
+
+    def archive_row(self, row):
+        """Adds an employee row to archived.csv.
+        """
+        if self._archived_offsets is not None:
+            self._archived_offsets[int(row["ID"])] = \
+                os.path.getsize(self.archived_file)
+        _append_row(row, self.archived_file)
+
+    def update_row(self, id_num, fields: list, data: list):
+        """Sets the given fields of the row with the given ID to the given
+        data, by appending one journal line per field. Nothing is
+        written if any of the fields isn't an editable employee field.
+        """
+        _check_fields(fields)
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        with open(self.journal_file, "a", newline='',
+                  encoding="utf8") as journal:
+            writer = csv.writer(journal)
+            writer.writerows([id_num, fields[index], data[index], timestamp]
+                             for index in range(len(fields)))
+            journal.flush()
+            os.fsync(journal.fileno())
+        if self._journal is not None:
+            self._journal.setdefault(int(id_num), []).extend(
+                (fields[index], str(data[index]))
+                for index in range(len(fields)))
+
+    def update_rows(self, changes):
+        """Applies many edits at once. changes is a list of
+        (ID, fields, data) tuples, like the arguments of update_row. The
+        journal and the changes are folded into a fresh employees.csv,
+        written once, so either all of the changes are saved or none are.
+        """
+        for _, fields, _ in changes:
+            _check_fields(fields)
+        employee_rows, _ = self._journaled_rows()
+        rows_by_id = {row["ID"]: row for row in employee_rows}
+        for id_num, fields, data in changes:
+            row = rows_by_id.get(str(id_num))
+            if row is not None:
+                for index in range(len(fields)):
+                    row[fields[index]] = data[index]
+        self._write_base(employee_rows)
+
+    def compact(self):
+        """Folds the journal into a fresh employees.csv, and empties the
+        journal.
+        """
+        employee_rows, entries = self._journaled_rows()
+        if entries:
+            self._write_base(employee_rows)
+
+    def _journaled_rows(self):
+        """Reads employees.csv and replays the journal over it.
+
+        Output: the list of employee rows, and the number of journal
+                entries that were replayed.
+        """
+        with open(self.employees_file, encoding="utf8") as database:
+            employee_rows = list(csv.DictReader(database))
+        if not os.path.exists(self.journal_file):
+            return employee_rows, 0
+
+        rows_by_id = {row["ID"]: row for row in employee_rows}
+        entries = 0
+        with open(self.journal_file, newline='', encoding="utf8") as journal:
+            for entry in csv.reader(journal):
+                # A line cut short by a crash mid-append is skipped.
+                if len(entry) != len(JOURNAL_FIELDNAMES):
+                    continue
+                id_num, field, value, _ = entry
+                row = rows_by_id.get(id_num)
+                if row is not None and field in row:
+                    row[field] = value
+                entries += 1
+        return employee_rows, entries
+
+    def _write_base(self, employee_rows):
+        """Writes the given rows, which have the journal folded into them,
+        to a fresh employees.csv and empties the journal. The journal must
+        never be replayed over the new rows, or it would undo any of
+        update_rows' changes to the same fields, so this is done in steps
+        that can be finished after a crash: the rows are written in full
+        to employees.csv.new, then _finish_write_base removes the journal
+        and moves employees.csv.new over employees.csv. Row offsets found
+        by index_rows() point into the old file, so they are found again.
+        """
+        _write_csv_atomic(self.employees_file + ".new", employee_rows)
+        self._finish_write_base()
+        if self._offsets is not None:
+            self.index_rows()
+
+    def _finish_write_base(self):
+        """Finishes a _write_base that was cut short after employees.csv.new
+        was written, if there is one.
+        """
+        new_file = self.employees_file + ".new"
+        if not os.path.exists(new_file):
+            return
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+            _sync_directory(self.journal_file)
+        os.replace(new_file, self.employees_file)
+        _sync_directory(self.employees_file)
+
+    def close(self):
+        """Nothing is held open between calls for csv files.
+        """
+
+
+def _check_fields(fields):
+    """Raises an exception if any of the fields isn't an editable employee
+    field.
+    """
+    for field in fields:
+        if field not in FIELDNAMES[1:]:
+            raise Exception(f'Invalid employee field "{field}".')
+
+
+def _write_csv_atomic(file, rows):
+    """Writes the rows to a temp file next to the csv file, forces it to
+    disk, and moves it over the csv file. Anyone reading the file sees
+    either the old rows or the new rows, never a partly written file. If
+    writing fails, the temp file is removed and the csv file is untouched.
+    """
+    temp_file = file + ".tmp"
+    try:
+        with open(temp_file, "w", newline='', encoding="utf8") as database:
+            writer = csv.DictWriter(database, FIELDNAMES)
+            writer.writeheader()
+            writer.writerows(rows)
+            database.flush()
+            os.fsync(database.fileno())
+    except BaseException:
+        os.remove(temp_file)
+        raise
+    os.replace(temp_file, file)
+    _sync_directory(file)
+
+
+def _sync_directory(file):
+    """Makes a rename or removal of file durable, by forcing its directory
+    to disk. Directories can't be opened this way on Windows, where
+    os.replace is already durable enough.
+    """
+    if hasattr(os, "O_DIRECTORY"):
+        directory = os.open(os.path.dirname(os.path.abspath(file)),
+                            os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+def _write_text_atomic(file, text):
+    """Writes text to a file the same way as _write_csv_atomic.
+    """
+    temp_file = file + ".tmp"
+    with open(temp_file, "w", encoding="utf8") as output:
+        output.write(text)
+        output.flush()
+        os.fsync(output.fileno())
+    os.replace(temp_file, file)
+
+
+@contextmanager
+def _file_lock(lock_file, timeout=10.0):
+    """Holds a lock between processes for the length of a with block, by
+    creating lock_file, which fails while another process has it. A lock
+    older than timeout seconds is taken to be left over from a process
+    that died, and is broken.
+    """
+    while True:
+        try:
+            lock = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_file) > timeout:
+                    os.remove(lock_file)
+                    continue
+            except OSError:
+                continue
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(lock)
+        os.remove(lock_file)
+
+
+def _index_file(file):
+    """Finds the byte offset of every row in a csv file, using mmap so
+    the file is not read into memory.
+
+    Output: a dict of ID -> offset, in file order.
+    """
+    offsets = {}
+    with open(file, "rb") as database:
+        if os.fstat(database.fileno()).st_size == 0:
+            return offsets
+        with mmap.mmap(database.fileno(), 0,
+                       access=mmap.ACCESS_READ) as mapped:
+            for match in _ROW_ID.finditer(mapped):
+                offsets[int(match.group(1))] = match.start()
+    return offsets
+
+
+def _file_key(file):
+    """Returns the size, modification time and content hash of a file, or
+    None if it does not exist.
+    """
+    if not os.path.exists(file):
+        return None
+    stat = os.stat(file)
+    digest = hashlib.blake2b()
+    with open(file, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    return stat.st_size, stat.st_mtime_ns, digest.hexdigest()
+
+
+def _snapshot_version():
+    """Returns the version stamp of the snapshot format. marshal's format
+    can change between Python versions, so that is part of it.
+    """
+    return SNAPSHOT_VERSION, sys.version_info[:2]
+
+
+def read_snapshot(snapshot_file, source_files):
+    """Loads the data saved by write_snapshot, if the snapshot exists, has
+    the current version stamp and every source file still has the size,
+    modification time and content hash it had when the snapshot was
+    written.
+
+    Output: the saved data, or None if there is no usable snapshot.
+    """
+    if not os.path.exists(snapshot_file):
+        return None
+    try:
+        with open(snapshot_file, "rb") as snapshot:
+            if snapshot.read(len(_SNAPSHOT_MAGIC)) != _SNAPSHOT_MAGIC:
+                return None
+            version, keys = marshal.load(snapshot)
+            if version != _snapshot_version() or \
+                    keys != [_file_key(file) for file in source_files]:
+                return None
+            # marshal.loads on the whole payload is much faster than
+            #   marshal.load, which reads the file in small pieces.
+            return marshal.loads(snapshot.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def write_snapshot(snapshot_file, source_files, data):
+    """Saves data, made of lists, tuples, strings and numbers, to a binary
+    snapshot file keyed on the current state of the source files, so
+    read_snapshot can tell when it is stale.
+    """
+    keys = [_file_key(file) for file in source_files]
+    temp_file = snapshot_file + ".tmp"
+    with open(temp_file, "wb") as snapshot:
+        snapshot.write(_SNAPSHOT_MAGIC)
+        marshal.dump((_snapshot_version(), keys), snapshot)
+        marshal.dump(data, snapshot)
+    os.replace(temp_file, snapshot_file)
+
+
+def _append_row(row, file):
+    with open(file, "a", newline='', encoding="utf8") as database:
+        writer = csv.DictWriter(database, FIELDNAMES)
+        writer.writerow(row)
+
+
+class SQLiteStorage:
+    """
+    Storage engine that keeps all employees in one SQLite table.
+
+    Active and archived employees share the table, told apart by the
+    Archived column. ID is unique and indexed, as are Dept, Name and
+    Permission, so single-field edits are one-row updates. Rows load in
+    the order they were saved, like the csv files.
+    Values are stored as text, exactly as they would be in the csv files.
+    """
+
+    def __init__(self, path="employees.db"):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        columns = ", ".join(f'"{field}" TEXT' for field in FIELDNAMES[1:])
+        with self.connection:
+            self.connection.execute(
+                f'CREATE TABLE IF NOT EXISTS employees ('
+                f'"ID" INTEGER NOT NULL UNIQUE, {columns}, '
+                f'"Archived" INTEGER NOT NULL DEFAULT 0)')
+            for field in ("Dept", "Name", "Permission"):
+                self.connection.execute(
+                    f'CREATE INDEX IF NOT EXISTS idx_employees_{field.lower()} '
+                    f'ON employees ("{field}")')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS id_sequence ('
+                '"High_Water" INTEGER NOT NULL)')
+
+    def load(self):
+        """Returns two lists of rows, the archived rows and the active
+        employee rows.
+        """
+        archived_rows = []
+        employee_rows = []
+        columns = ", ".join(f'"{field}"' for field in FIELDNAMES)
+        cursor = self.connection.execute(
+            f'SELECT {columns}, "Archived" FROM employees ORDER BY rowid')
+        for values in cursor:
+            row = _text_row(values[:-1])
+            if values[-1]:
+                archived_rows.append(row)
+            else:
+                employee_rows.append(row)
+        return archived_rows, employee_rows
+
+    def allocate_ids(self, count, floor):
+        """Reserves count new employee IDs, above both the high-water mark
+        in the id_sequence table and floor, the highest ID already in use.
+        The write lock taken by BEGIN IMMEDIATE keeps other processes out
+        until the new mark is saved.
+
+        Output: the first reserved ID.
+        """
+        self.connection.commit()
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            saved = self.connection.execute(
+                'SELECT "High_Water" FROM id_sequence').fetchone()
+            in_table = self.connection.execute(
+                'SELECT MAX("ID") FROM employees').fetchone()[0] or 0
+            high_water = max(floor, in_table,
+                             saved[0] if saved is not None else 0)
+            self.connection.execute('DELETE FROM id_sequence')
+            self.connection.execute(
+                'INSERT INTO id_sequence ("High_Water") VALUES (?)',
+                (high_water + count,))
+            self.connection.commit()
+        except BaseException:
+            self.connection.rollback()
+            raise
+        return high_water + 1
+
+    def source_files(self):
+        """SQLite loads quickly by itself, so there is nothing to snapshot.
+        """
+        return []
+
+    def index_rows(self):
+        """Lists the IDs of all rows, for lazy loading.
+
+        Output: two lists of IDs, the archived IDs and the active employee
+                IDs, in the order they were saved.
+        """
+        archived_ids = []
+        employee_ids = []
+        cursor = self.connection.execute(
+            'SELECT "ID", "Archived" FROM employees ORDER BY rowid')
+        for id_num, archived in cursor:
+            if archived:
+                archived_ids.append(id_num)
+            else:
+                employee_ids.append(id_num)
+        return archived_ids, employee_ids
+
+    def read_row(self, id_num, archived=False):
+        """Reads the row with the given ID.
+
+        Output: the row dict, or None if there is no row with the ID.
+        """
+        columns = ", ".join(f'"{field}"' for field in FIELDNAMES)
+        values = self.connection.execute(
+            f'SELECT {columns} FROM employees WHERE "ID" = ?',
+            (int(id_num),)).fetchone()
+        if values is None:
+            return None
+        return _text_row(values)
+
+    def add_row(self, row):
+        """Adds a new active employee row to the table.
+        """
+        self._write_row(row, 0)
+
+    def archive_row(self, row):
+        """Saves the employee's row and marks it as archived.
+        """
+        self._write_row(row, 1)
+
+    def _write_row(self, row, archived):
+        columns = ", ".join(f'"{field}"' for field in FIELDNAMES)
+        marks = ", ".join("?" for _ in FIELDNAMES)
+        with self.connection:
+            self.connection.execute(
+                f'INSERT OR REPLACE INTO employees ({columns}, "Archived") '
+                f'VALUES ({marks}, ?)', _sql_values(row) + [archived])
+
+    def update_row(self, id_num, fields: list, data: list):
+        """Sets the given fields of the row with the given ID to the given
+        data, as a single-row update.
+        """
+        with self.connection:
+            self._update(id_num, fields, data)
+
+    def _update(self, id_num, fields, data):
+        _check_fields(fields)
+        assignments = ", ".join(f'"{field}" = ?' for field in fields)
+        self.connection.execute(
+            f'UPDATE employees SET {assignments} WHERE "ID" = ?',
+            [str(value) for value in data] + [int(id_num)])
+
+    def update_rows(self, changes):
+        """Applies many edits at once, in a single transaction. changes is
+        a list of (ID, fields, data) tuples, like the arguments of
+        update_row.
+        """
+        with self.connection:
+            for id_num, fields, data in changes:
+                self._update(id_num, fields, data)
+
+    def compact(self):
+        """Edits are already single-row updates, so there is no journal to
+        fold in.
+        """
+
+    def close(self):
+        """Closes the database connection.
+        """
+        self.connection.close()
+
+
+def _sql_values(row):
+    """Converts a row dict to a list of values in FIELDNAMES order, ready
+    to be inserted into the employees table.
+    """
+    return [int(row["ID"])] + [None if row[field] is None else str(row[field])
+                               for field in FIELDNAMES[1:]]
+
+
+def _text_row(values):
+    """Converts a list of values from the employees table into a row dict
+    of strings, the way csv.DictReader would have read it.
+    """
+    return {field: "" if value is None else str(value)
+            for field, value in zip(FIELDNAMES, values)}
+
+
+def import_csv(db_path="employees.db", employees_file="employees.csv",
+               archived_file="archived.csv"):
+    """Imports the employees in the csv files into an SQLite database, in
+    one transaction. Employees found in the archived file are marked as
+    archived. Running it again replaces the imported rows.
+
+    Output: the SQLiteStorage for the database.
+    """
+    csv_storage = CSVStorage(employees_file, archived_file)
+    archived_rows, employee_rows = csv_storage.load()
+    sqlite_storage = SQLiteStorage(db_path)
+    columns = ", ".join(f'"{field}"' for field in FIELDNAMES)
+    marks = ", ".join("?" for _ in FIELDNAMES)
+    with sqlite_storage.connection:
+        for rows, archived in ((employee_rows, 0), (archived_rows, 1)):
+            sqlite_storage.connection.executemany(
+                f'INSERT OR REPLACE INTO employees ({columns}, "Archived") '
+                f'VALUES ({marks}, ?)',
+                (_sql_values(row) + [archived] for row in rows))
+    return sqlite_storage
+
+
+if __name__ == '__main__':
+    import_csv().close()
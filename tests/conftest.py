@@ -0,0 +1,32 @@
+"""
+Shared fixtures for the tests. The app's modules read and write their
+files relative to the working directory, so each test runs in a fresh
+temporary directory.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import benchmark  # noqa: E402
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Runs the test in an empty temporary directory.
+    """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def data_dir(workdir):
+    """Runs the test in a temporary directory holding a small generated
+    data set: employees, archived employees, timecards and receipts.
+    """
+    benchmark.generate_data(200, str(workdir), seed=1)
+    return workdir
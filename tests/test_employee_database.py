@@ -0,0 +1,369 @@
+"""
+Tests for EmployeeDB and the Employee classes in employee_database.py.
+"""
+
+import csv
+import gc
+import weakref
+
+import pytest
+
+import benchmark
+from employee_database import EmployeeDB, Employee, Hourly, Commissioned
+from storage import CSVStorage, import_csv
+
+
+def _load_without_csv(monkeypatch):
+    """Returns an EmployeeDB that fails if it reads the csv files, so it
+    can only have come from the snapshot.
+    """
+    def fail(self):
+        raise AssertionError("loaded from the csv files")
+    monkeypatch.setattr(CSVStorage, "load", fail)
+    database = EmployeeDB()
+    monkeypatch.undo()
+    return database
+
+
+def _summary(database):
+    return [(employee.id, employee.name, employee.city, employee.dept,
+             str(employee.classification), str(employee.pay_method),
+             employee.preview_pay())
+            for employee in database.emp_list + database.archived_list]
+
+
+def test_snapshot_loads_same_employees_as_csv(data_dir, monkeypatch):
+    from_csv = EmployeeDB()
+
+    from_snapshot = _load_without_csv(monkeypatch)
+
+    assert _summary(from_snapshot) == _summary(from_csv)
+
+
+def test_snapshot_loads_same_employees_as_rows(data_dir):
+    database = EmployeeDB(snapshot=False)
+    with open("employees.csv", newline='', encoding="utf8") as employees:
+        rows = list(csv.DictReader(employees))
+    for row, loaded in zip(rows, database.emp_list):
+        employee = Employee(None, None, None, None, None, None, None, None,
+                            None)
+        employee.populate_from_row(row)
+        assert (employee.id, employee.name, employee.ssn, employee.dept,
+                employee.preview_report()) == \
+            (loaded.id, loaded.name, loaded.ssn, loaded.dept,
+             loaded.preview_report())
+
+
+def test_snapshot_ignored_after_edit(data_dir):
+    database = EmployeeDB()
+    id_num = database.emp_list[0].id
+    database.edit_employee(id_num, ["Dept"], ["Snapshot QA"])
+
+    reloaded = EmployeeDB()
+
+    assert reloaded.find_employee(id_num).dept == "Snapshot QA"
+
+
+def test_snapshot_ignored_after_csv_changes(data_dir):
+    EmployeeDB()
+    with open("employees.csv", encoding="utf8") as employees:
+        text = employees.read()
+    id_num = int(text.splitlines()[1].split(",")[0])
+    with open("employees.csv", "w", encoding="utf8") as employees:
+        employees.write(text.replace(f"\n{id_num},", "\n99999999,", 1))
+
+    reloaded = EmployeeDB()
+
+    assert reloaded.find_employee(id_num) is None
+    assert reloaded.find_employee(99999999) is not None
+
+
+def test_corrupt_snapshot_ignored(data_dir):
+    count = len(EmployeeDB().emp_list)
+    with open("employees.snapshot", "r+b") as snapshot:
+        snapshot.seek(40)
+        snapshot.write(b"\xff" * 64)
+
+    assert len(EmployeeDB().emp_list) == count
+
+
+@pytest.mark.parametrize("engine", ["csv", "sqlite"])
+def test_lazy_loads_same_employees_as_eager(data_dir, engine):
+    def storage():
+        return import_csv() if engine == "sqlite" else CSVStorage()
+    eager = EmployeeDB(storage(), snapshot=False)
+
+    lazy = EmployeeDB(storage(), lazy=True, cache_size=8)
+
+    assert _summary(lazy) == _summary(eager)
+    assert len(lazy.emp_list) == len(eager.emp_list)
+    assert len(lazy.archived_list) == len(eager.archived_list)
+
+
+def _look_up_all(database):
+    """Looks up every active employee, pushing earlier ones out of the
+    lazy cache.
+    """
+    for employee in database.emp_list:
+        assert employee is database.find_employee(employee.id)
+
+
+@pytest.mark.parametrize("engine", ["csv", "sqlite"])
+def test_lazy_cache_keeps_edits(data_dir, engine):
+    storage = import_csv() if engine == "sqlite" else CSVStorage()
+    database = EmployeeDB(storage, lazy=True, cache_size=2)
+    first, second, third = (employee.id for employee in database.emp_list[:3])
+
+    # While an employee is referenced, lookups give the same object, even
+    #   after other employees have pushed it out of the cache.
+    held = database.find_employee(first)
+    database.edit_employee(first, ["Dept"], ["Lazy QA"])
+    _look_up_all(database)
+    assert database.find_employee(first) is held
+    assert held.dept == "Lazy QA"
+
+    # Once it is dropped, it is parsed again from the saved row, edits
+    #   included.
+    database.edit_employee(second, ["Name", "City"], ["Ada Lazy", "Provo"])
+    dropped = weakref.ref(held)
+    del held
+    _look_up_all(database)
+    # The pay method refers back to the employee, so the cycle is only
+    #   freed by the garbage collector.
+    gc.collect()
+    assert dropped() is None
+    assert database.find_employee(first).dept == "Lazy QA"
+    assert (database.find_employee(second).name,
+            database.find_employee(second).city) == ("Ada Lazy", "Provo")
+
+    database.archive_employee(third)
+    _look_up_all(database)
+    assert database.find_employee(third) is None
+    assert database.find_employee(third, True).id == third
+    assert _summary(database) == _summary(EmployeeDB(storage,
+                                                     snapshot=False))
+
+
+def test_running_totals_follow_inputs():
+    hourly = Hourly(20.0)
+    commissioned = Commissioned(48000.0, 0.1)
+    values = [7.25, 0.1, 8.3, 0.2]
+
+    for value in values:
+        hourly.add_timecard(value)
+    commissioned.set_receipts(values)
+    expected = 0.0
+    for value in values:
+        expected += value
+
+    assert hourly.total_hours() == expected
+    assert commissioned.total_receipts() == expected
+    hourly.set_timecards(values[:1])
+    commissioned.add_receipt(1.5)
+    assert hourly.total_hours() == 7.25
+    assert commissioned.total_receipts() == expected + 1.5
+    hourly.calculate_pay()
+    commissioned.calculate_pay()
+    assert hourly.total_hours() == commissioned.total_receipts() == 0.0
+
+
+def _preview_employee(class_num, *pay):
+    employee = Employee(1, "Test Person", None, "1/1/1990", "123-45-6789",
+                        "801-555-0100", "test@example.com", "Employee",
+                        "password")
+    employee.set_classification(class_num, *pay)
+    employee.set_pay_method(2)
+    if class_num == 1:
+        employee.classification.set_timecards([8.0])
+    elif class_num == 3:
+        employee.classification.set_receipts([10.0])
+    return employee
+
+
+def _set_rate(classification, name, value):
+    setattr(classification, name, value)
+
+
+@pytest.mark.parametrize("class_num, pay, mutate, expected", [
+    (1, (20.0,), lambda e: e.classification.add_timecard(2.0), 200.0),
+    (1, (20.0,), lambda e: e.classification.set_timecards([1.0]), 20.0),
+    (1, (20.0,), lambda e: e.classification.calculate_pay(), 0.0),
+    (1, (20.0,), lambda e: _set_rate(e.classification, "hourly_rate", 10.0),
+     80.0),
+    (1, (20.0,), lambda e: e.set_classification(2, 2400.0), 100.0),
+    (3, (2400.0, 0.5), lambda e: e.classification.add_receipt(4.0), 107.0),
+    (3, (2400.0, 0.5), lambda e: e.classification.set_receipts([2.0]),
+     101.0),
+    (3, (2400.0, 0.5), lambda e: e.classification.calculate_pay(), 100.0),
+    (3, (2400.0, 0.5),
+     lambda e: _set_rate(e.classification, "commission_rate", 1.0), 110.0),
+    (3, (2400.0, 0.5), lambda e: _set_rate(e.classification, "salary",
+                                           4800.0), 205.0),
+])
+def test_preview_recomputed_after_each_change(class_num, pay, mutate,
+                                              expected):
+    employee = _preview_employee(class_num, *pay)
+    employee.preview_report()
+    remembered = employee._preview
+    employee.preview_report()
+    assert employee._preview is remembered
+
+    mutate(employee)
+
+    assert employee.preview_pay() == expected
+    assert employee._preview is not remembered
+    assert f"${expected:.2f}" in employee.preview_report()
+
+
+def test_preview_message_recomputed_after_pay_method_change():
+    employee = _preview_employee(2, 2400.0)
+    assert employee.preview_report().startswith("Will mail $100.00")
+
+    employee.set_pay_method(1, "123456789", "987654")
+
+    assert employee.preview_report() == \
+        "Will transfer $100.00 for Test Person to 123456789 at 987654"
+
+
+def test_employees_take_less_memory_than_dict_baseline(data_dir):
+    used, baseline = benchmark.measure_employee_memory(2000)
+
+    assert 0 < used < baseline
+
+
+def _indexed(employee):
+    return {"dept": employee.dept, "title": employee.title,
+            "classification": str(employee.classification),
+            "permission": employee.permission, "state": employee.state}
+
+
+def _check_queries(database):
+    """Checks query() against a linear filter of the employee lists, for
+    every value of each field and for pairs of fields.
+    """
+    employees = list(database.emp_list)
+    archived = list(database.archived_list)
+    criteria = [{field: value} for field in ("dept", "title",
+                                             "classification", "permission",
+                                             "state")
+                for value in {_indexed(employee)[field]
+                              for employee in employees + archived}]
+    criteria += [{"dept": dept, "classification": classification}
+                 for dept in {employee.dept for employee in employees}
+                 for classification in ("hourly", "salary", "commissioned")]
+    criteria.append({})
+    for include_archived in (False, True):
+        pool = employees + archived if include_archived else employees
+        for query in criteria:
+            expected = sorted(
+                (employee.id for employee in pool
+                 if all(_indexed(employee)[field] == value
+                        for field, value in query.items())))
+            assert [employee.id for employee in database.query(
+                include_archived, **query)] == expected, query
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_query_matches_linear_filter_after_changes(data_dir, lazy):
+    database = EmployeeDB(lazy=lazy)
+    _check_queries(database)
+    first, second, third = (employee.id for employee in database.emp_list[:3])
+
+    database.edit_employee(first, ["Dept"], ["Moved"])
+    if str(database.find_employee(second).classification) == "hourly":
+        database.edit_employee(second, ["Classification", "Salary"],
+                               [2, 52000.0])
+    else:
+        database.edit_employee(second, ["Classification", "Hourly"],
+                               [1, 25.0])
+    _check_queries(database)
+
+    database.archive_employee(third)
+    _check_queries(database)
+
+    database.update_emp_list()
+    _check_queries(database)
+    assert database.query(dept="Moved") == [database.find_employee(first)]
+
+
+def _add_named(database, name):
+    employee = Employee(None, None, None, None, None, None, None, None, None)
+    employee.populate_from_fields(
+        database.allocate_id(), name, "1 Main St", "Orem", "UT", "84058", 2,
+        2, 52000.0, 0.0, 0.0, "", "", "1/1/1990", "123-45-6789",
+        "801-555-0100", "test@example.com", "1/1/2020", "", "Worker",
+        "Production", "Employee", "password")
+    database.add_employee(employee)
+    return employee.id
+
+
+def _check_searches(database, queries):
+    for text in queries:
+        expected = [employee.id for employee in database.emp_list
+                    if text.lower() in str(employee).lower()]
+        assert [employee.id for employee
+                in database.search_names(text)] == expected, text
+
+
+def test_search_names_matches_substring_scan(data_dir):
+    database = EmployeeDB()
+    # Build the name index first, so the names below are added to it.
+    database.search_names("a")
+    names = ["Zoë Ångström", "ÉMILE Ørsted", "Ana  María López",
+             "ΟΔΥΣΣΕΑΣ Παπαδόπουλος", "İlker Çelik", "Renée O'Brien"]
+    added = [_add_named(database, name) for name in names]
+    queries = ["ö", "ÅNG", "ström", "émile ø", "ΣΣΕΑΣ", "ς", "σ πα",
+               "i̇lk", "ÇEL", "o'b", "ana  maría", "a  m", "  ", " ", "",
+               "e", "zz", "son", "an ", " an"]
+    queries += [employee.name[index:index + size]
+                for employee in list(database.emp_list)[:50:7]
+                for index, size in ((0, 3), (2, 5), (1, 9))]
+    _check_searches(database, queries)
+
+    database.edit_employee(added[0], ["Name"], ["Zoé Ångström-Berg"])
+    database.archive_employee(added[1])
+    database.archive_employee(database.emp_list[0].id)
+    _check_searches(database, queries + ["berg", "zoé å"])
+
+
+def _check_indexes(database):
+    """Checks the ID index and the name index against the employee lists.
+    """
+    active = list(database.emp_list)
+    archived = list(database.archived_list)
+    for employee in active:
+        assert database.find_employee(employee.id) is employee
+        assert employee in database.search_names(employee.name)
+    for employee in archived:
+        assert database.find_employee(employee.id) is None
+        assert database.find_employee(employee.id, True) is employee
+        assert employee not in database.search_names(employee.name)
+    assert database.find_employee(max(
+        employee.id for employee in active + archived) + 1, True) is None
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_indexes_follow_add_edit_archive_and_reload(data_dir, lazy):
+    database = EmployeeDB(lazy=lazy)
+    _check_indexes(database)
+    added = _add_named(database, "Quinn Indexed")
+    _check_indexes(database)
+
+    first, second = (employee.id for employee in database.emp_list[:2])
+    database.edit_employee(first, ["Name"], ["Renamed Indexed"])
+    database.edit_employees([(second, ["Name", "Dept"],
+                              ["Also Renamed", "Moved"])])
+    _check_indexes(database)
+    assert database.search_names("renamed indexed") == \
+        [database.find_employee(first)]
+
+    database.archive_employee(added)
+    database.archive_employee(second)
+    _check_indexes(database)
+    assert database.search_names("quinn indexed") == []
+
+    database.update_emp_list()
+    _check_indexes(database)
+    assert database.find_employee(added, True).name == "Quinn Indexed"
+    assert database.find_employee(second) is None
+    assert database.find_employee(first).name == "Renamed Indexed"
@@ -0,0 +1,187 @@
+"""
+Tests for the timecard and receipt readers in ingest.py.
+"""
+
+import os
+
+import pytest
+
+import ingest
+from ingest import MAX_ERRORS, InputTracker, binary_to_csv, byte_ranges, \
+    csv_to_binary, iter_lines, read_binary_totals, read_totals
+
+
+def _state(totals):
+    return (totals.totals, totals.counts, totals.errors, totals.bad_lines,
+            totals.lines)
+
+
+def _append(file_name, text):
+    with open(file_name, "ab") as in_file:
+        in_file.write(text)
+
+
+@pytest.mark.parametrize("parts", [1, 2, 3, 7, 50])
+def test_byte_ranges_read_every_line_once(workdir, parts):
+    lines = [b"1,2.5", b"22,3.0,4.0", b"", b"333,1.25", b"4444,8.0"] * 3
+    with open("timecards.csv", "wb") as timecards:
+        timecards.write(b"\n".join(lines))
+
+    ranges = byte_ranges("timecards.csv", parts)
+
+    assert len(ranges) <= parts
+    assert [line for byte_range in ranges
+            for line in iter_lines("timecards.csv", 4, byte_range)] == lines
+
+
+def test_tracker_resumes_from_saved_offset(workdir):
+    _append("timecards.csv", b"1,8.0\n2,4.0,x\n")
+    InputTracker("timecards.csv").update()
+    _append("timecards.csv", b"3,2.5\n1,1.5\n")
+
+    tracker = InputTracker("timecards.csv")
+    offset = tracker.offset
+    changed = tracker.update()
+
+    assert offset == len(b"1,8.0\n2,4.0,x\n")
+    assert changed == {1, 3}
+    assert _state(tracker.totals) == _state(read_totals("timecards.csv"))
+    assert {id_num: list(values) for id_num, values
+            in tracker.new_values.items()} == {1: [1.5], 3: [2.5]}
+
+
+def test_tracker_reads_unfinished_last_line_again(workdir):
+    _append("timecards.csv", b"1,8.0\n2,4")
+    tracker = InputTracker("timecards.csv")
+    tracker.update()
+    assert list(tracker.new_values[2]) == [4.0]
+
+    _append("timecards.csv", b".5\n")
+    changed = tracker.update()
+
+    assert changed == {2}
+    assert list(tracker.new_values[2]) == [4.5]
+    assert tracker.retracted == {2: 1}
+    assert _state(tracker.totals) == _state(read_totals("timecards.csv"))
+    assert tracker.read_values().values == \
+        read_totals("timecards.csv", keep_values=True).values
+
+
+def test_tracker_state_does_not_grow_with_file(workdir):
+    tracker = InputTracker("timecards.csv")
+    _append("timecards.csv", b"1,8.0\n2,4.0\n" * 10)
+    tracker.update()
+    size = os.path.getsize(tracker.state_file)
+
+    _append("timecards.csv", b"1,8.0\n2,4.0\n" * 1000)
+    tracker.update()
+
+    assert os.path.getsize(tracker.state_file) == size
+    assert tracker.totals.values is None
+
+
+@pytest.mark.parametrize("replacement", [b"7,1.0\n", b"9,9.0\n2,4.0,x\n"])
+def test_tracker_resets_when_file_is_replaced(workdir, replacement):
+    _append("timecards.csv", b"1,8.0\n2,4.0,x\n")
+    InputTracker("timecards.csv").update()
+    with open("timecards.csv", "wb") as timecards:
+        timecards.write(replacement)
+
+    tracker = InputTracker("timecards.csv")
+    changed = tracker.update()
+
+    assert changed is None
+    assert _state(tracker.totals) == _state(read_totals("timecards.csv"))
+
+
+def test_malformed_lines_are_skipped_and_reported(workdir):
+    _append("timecards.csv", b"1,8.0,7.5\n"
+                             b"x,4.0\n"
+                             b"\n"
+                             b"2,nan\n"
+                             b"3,inf,2.0\n"
+                             b"1,abc\n"
+                             b"2,4.5\r\n"
+                             b",1.0\n"
+                             b"4,\n")
+
+    totals = read_totals("timecards.csv", keep_values=True)
+
+    assert {id_num: list(values) for id_num, values
+            in totals.values.items()} == {1: [8.0, 7.5], 2: [4.5], 4: []}
+    assert totals.totals == {1: 15.5, 2: 4.5, 4: 0.0}
+    assert totals.counts == {1: 2, 2: 1, 4: 0}
+    assert totals.bad_lines == 5
+    assert totals.lines == 9
+    assert totals.errors == [(2, "x,4.0"), (4, "2,nan"), (5, "3,inf,2.0"),
+                             (6, "1,abc"), (8, ",1.0")]
+    message = totals.error_message("timecards.csv")
+    assert message.startswith(
+        '5 malformed line(s) skipped in "timecards.csv":\n')
+    assert "  line 6: 1,abc\n" in message
+
+
+def test_malformed_line_errors_are_capped(workdir):
+    _append("receipts.csv", b"bad\n" * 150 + b"1,2.0\n")
+
+    totals = read_totals("receipts.csv")
+
+    assert totals.values is None
+    assert totals.bad_lines == 150
+    assert len(totals.errors) == MAX_ERRORS
+    assert totals.errors[-1] == (MAX_ERRORS, "bad")
+    assert "...and 140 more" in totals.error_message("receipts.csv")
+    assert totals.totals == {1: 2.0}
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_binary_round_trip(data_dir, monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(ingest, "np", None)
+    elif ingest.np is None:
+        pytest.skip("NumPy is not installed")
+    _append("timecards.csv", b"bad line\n5,\n")
+    from_csv = read_totals("timecards.csv", keep_values=True)
+    kept = {id_num for id_num, count in from_csv.counts.items() if count}
+
+    converted = csv_to_binary("timecards.csv", "timecards.bin")
+    from_binary = read_binary_totals("timecards.bin", keep_values=True)
+    binary_to_csv("timecards.bin", "round_trip.csv")
+    round_trip = read_totals("round_trip.csv", keep_values=True)
+
+    assert _state(converted) == _state(from_csv)
+    for totals in (from_binary, round_trip):
+        assert set(totals.values) == kept
+        for id_num in kept:
+            assert totals.values[id_num] == from_csv.values[id_num]
+            assert totals.totals[id_num] == from_csv.totals[id_num]
+            assert totals.counts[id_num] == from_csv.counts[id_num]
+        assert totals.bad_lines == 0
+    assert read_binary_totals("timecards.bin").values is None
+
+
+@pytest.mark.parametrize("keep_values", [True, False])
+def test_read_totals_same_with_workers(data_dir, keep_values):
+    _append("receipts.csv", b"bad line\n")
+    serial = read_totals("receipts.csv", keep_values=keep_values)
+
+    parallel = read_totals("receipts.csv", keep_values=keep_values,
+                           workers=3)
+
+    assert _state(parallel) == _state(serial)
+    assert parallel.values == serial.values
+    assert (serial.values is None) is not keep_values
+
+
+def test_tracker_update_same_with_workers(data_dir, monkeypatch):
+    monkeypatch.setattr(ingest, "PARALLEL_BYTES", 0)
+    serial = InputTracker("timecards.csv", "serial.offset")
+    parallel = InputTracker("timecards.csv", "parallel.offset")
+
+    for text in (b"\nbad line\n5,1.5\n7,2", b".5,1.0\n" + b"8,3.0\n" * 50):
+        _append("timecards.csv", text)
+        assert parallel.update(workers=3) == serial.update()
+        assert _state(parallel.totals) == _state(serial.totals)
+        assert parallel.new_values == serial.new_values
+        assert parallel.retracted == serial.retracted
+        assert parallel.offset == serial.offset
@@ -0,0 +1,267 @@
+"""
+Tests for the batch payroll engine in payroll.py.
+"""
+
+from array import array
+
+import pytest
+
+import payroll
+from employee_database import EmployeeDB, Employee, Hourly, Salary, \
+    Commissioned
+from ingest import InputTracker, PeriodPartitions, read_totals
+from payroll import Scenario, apply_new_receipts, apply_new_timecards, \
+    apply_receipts, apply_timecards, run_payroll, run_payroll_from_files, \
+    simulate
+
+
+@pytest.fixture(params=["numpy", "python"])
+def engine(request, monkeypatch):
+    """Runs the test with and without NumPy.
+    """
+    if request.param == "numpy":
+        if payroll.np is None:
+            pytest.skip("NumPy is not installed")
+    else:
+        monkeypatch.setattr(payroll, "np", None)
+    return request.param
+
+
+def _employee(id_num, classification):
+    return Employee(id_num, "Test Person", classification, "1/1/1990",
+                    "123-45-6789", "801-555-0100", "test@example.com",
+                    "Employee", "password")
+
+
+def test_batch_pay_matches_calculate_pay(data_dir, engine):
+    database = EmployeeDB()
+    for file_name, apply in (("timecards.csv", apply_timecards),
+                             ("receipts.csv", apply_receipts)):
+        apply(database, read_totals(file_name, keep_values=True))
+    assert {str(employee.classification) for employee in database.emp_list} \
+        == {"hourly", "salary", "commissioned"}
+
+    batch = run_payroll(database.emp_list).as_dict()
+
+    for employee in database.emp_list:
+        assert batch[employee.id] == employee.classification.preview_pay()
+
+
+def test_batch_pay_rounds_each_input_like_calculate_pay(engine):
+    # Totalling these before multiplying, or adding them up in another
+    # order, changes the last digit of the pay.
+    values = [7.25, 0.1, 8.3, 0.2, 6.75, 0.3]
+    hourly = Hourly(19.99)
+    hourly.set_timecards(values)
+    commissioned = Commissioned(45000.01, 0.07)
+    commissioned.set_receipts(values[::-1])
+    employees = [_employee(3, hourly), _employee(1, commissioned),
+                 _employee(2, Salary(61234.56))]
+
+    batch = run_payroll(employees).as_dict()
+
+    for employee in employees:
+        assert batch[employee.id] == employee.classification.preview_pay()
+
+
+def test_payroll_from_files_same_with_workers(data_dir):
+    with open("timecards.csv", "a", encoding="utf8") as timecards:
+        timecards.write("not a line\n")
+    employees = EmployeeDB().emp_list
+
+    serial, serial_timecards, serial_receipts = run_payroll_from_files(
+        employees)
+    parallel, timecards, receipts = run_payroll_from_files(employees,
+                                                           workers=3)
+
+    assert parallel.as_dict() == serial.as_dict()
+    for totals, expected in ((timecards, serial_timecards),
+                             (receipts, serial_receipts)):
+        assert totals.values == expected.values
+        assert totals.totals == expected.totals
+        assert totals.counts == expected.counts
+        assert (totals.errors, totals.bad_lines, totals.lines) == \
+            (expected.errors, expected.bad_lines, expected.lines)
+    assert timecards.bad_lines == 1
+
+
+def test_apply_only_changed_ids(data_dir):
+    database = EmployeeDB()
+    tracker = InputTracker("timecards.csv")
+    apply_new_timecards(database, tracker, tracker.update())
+    database.take_changed()
+    hourly = [employee for employee in database.emp_list
+              if str(employee.classification) == "hourly"]
+    with open("timecards.csv", "a", encoding="utf8") as timecards:
+        timecards.write(f"\n{hourly[0].id},7.5\n")
+    # Timecards set outside apply_new_timecards are only overwritten when
+    #   the employee is in changed or was changed in the database.
+    hourly[1].classification.set_timecards([99.0])
+
+    changed = tracker.update()
+    apply_new_timecards(database, tracker, changed)
+
+    assert changed == {hourly[0].id}
+    assert hourly[0].classification.timecards[-1] == 7.5
+    assert list(hourly[1].classification.timecards) == [99.0]
+    assert database.take_changed() == {hourly[0].id}
+
+    database.mark_changed(hourly[1].id)
+    apply_new_timecards(database, tracker, tracker.update())
+    assert hourly[1].classification.timecards == \
+        read_totals("timecards.csv", keep_values=True).values[hourly[1].id]
+
+
+def test_apply_new_inputs_matches_whole_file(data_dir):
+    database = EmployeeDB()
+    timecards = InputTracker("timecards.csv")
+    receipts = InputTracker("receipts.csv")
+    apply_new_timecards(database, timecards, timecards.update())
+    apply_new_receipts(database, receipts, receipts.update())
+    database.take_changed()
+    hourly = [employee.id for employee in database.emp_list
+              if str(employee.classification) == "hourly"]
+    salaried = next(employee for employee in database.emp_list
+                    if str(employee.classification) == "salary")
+    with open("timecards.csv", "a", encoding="utf8") as in_file:
+        in_file.write(f"\n{hourly[0]},7.5\n{salaried.id},3.0\n"
+                      f"{hourly[1]},2")
+    apply_new_timecards(database, timecards, timecards.update())
+    with open("timecards.csv", "a", encoding="utf8") as in_file:
+        in_file.write(f".5,1.0\n{hourly[1]},4.0\n")
+    # An employee made hourly has all their timecards read again.
+    salaried.classification = Hourly(20.0)
+    database.mark_changed(salaried.id)
+
+    changed = timecards.update()
+    apply_new_timecards(database, timecards, changed)
+    apply_new_receipts(database, receipts, receipts.update())
+
+    assert changed == {hourly[1]}
+    expected = {"hourly": read_totals("timecards.csv", keep_values=True),
+                "commissioned": read_totals("receipts.csv",
+                                            keep_values=True)}
+    for employee in database.emp_list:
+        kind = str(employee.classification)
+        if kind == "hourly":
+            inputs = employee.classification.timecards
+            total = employee.classification.total_hours()
+        elif kind == "commissioned":
+            inputs = employee.classification.receipts
+            total = employee.classification.total_receipts()
+        else:
+            continue
+        assert inputs == expected[kind].values.get(employee.id, array("d"))
+        assert total == expected[kind].totals.get(employee.id, 0.0)
+    assert list(salaried.classification.timecards) == [3.0]
+    assert list(database.find_employee(hourly[1]).classification
+                .timecards[-3:]) == [2.5, 1.0, 4.0]
+
+
+def _with_inputs(database, kind):
+    return {employee.id for employee in database.emp_list
+            if str(employee.classification) == kind and
+            len(employee.classification.timecards if kind == "hourly"
+                else employee.classification.receipts)}
+
+
+def test_apply_clears_inputs_of_previous_period(data_dir):
+    database = EmployeeDB()
+    periods = PeriodPartitions()
+    periods.ingest("timecards", "timecards.csv", "2026-10-1")
+    periods.ingest("receipts", "receipts.csv", "2026-10-1")
+    apply_timecards(database, periods.totals("timecards", "2026-10-1",
+                                             keep_values=True))
+    apply_receipts(database, periods.totals("receipts", "2026-10-1",
+                                            keep_values=True))
+    hourly = _with_inputs(database, "hourly")
+    commissioned = _with_inputs(database, "commissioned")
+    assert hourly and commissioned
+    database.take_changed()
+    paid = min(hourly)
+    with open("timecards.csv", "a", encoding="utf8") as timecards:
+        timecards.write(f"\n{paid},6.0\n")
+
+    periods.ingest("timecards", "timecards.csv", "2026-10-2")
+    periods.ingest("receipts", "receipts.csv", "2026-10-2")
+    apply_timecards(database, periods.totals("timecards", "2026-10-2",
+                                             keep_values=True))
+    apply_receipts(database, periods.totals("receipts", "2026-10-2",
+                                            keep_values=True))
+
+    assert _with_inputs(database, "hourly") == {paid}
+    assert list(database.find_employee(paid).classification.timecards) == \
+        [6.0]
+    assert _with_inputs(database, "commissioned") == set()
+    assert database.take_changed() == hourly | commissioned
+    assert periods.manifest["timecards"]["2026-10-1"]["closed"]
+    assert set(periods.totals("timecards", "2026-10-1").counts) >= hourly
+
+
+def test_apply_clears_inputs_when_file_is_replaced(data_dir):
+    database = EmployeeDB()
+    tracker = InputTracker("timecards.csv")
+    apply_new_timecards(database, tracker, tracker.update())
+    hourly = _with_inputs(database, "hourly")
+    database.take_changed()
+    paid = min(hourly)
+    with open("timecards.csv", "w", encoding="utf8") as timecards:
+        timecards.write(f"{paid},6.0\n")
+
+    changed = tracker.update()
+    apply_new_timecards(database, tracker, changed)
+
+    assert changed is None
+    assert _with_inputs(database, "hourly") == {paid}
+    assert database.take_changed() == hourly
+
+
+def test_simulate_without_adjustments_costs_the_payroll(data_dir, engine):
+    database = EmployeeDB()
+    apply_timecards(database, read_totals("timecards.csv", keep_values=True))
+    apply_receipts(database, read_totals("receipts.csv", keep_values=True))
+    pay = run_payroll(database.emp_list).as_dict()
+    by_dept = {}
+    for employee in database.emp_list:
+        by_dept[employee.dept] = by_dept.get(employee.dept, 0.0) + \
+            pay[employee.id]
+
+    [cost] = simulate(database, [Scenario("As is")])
+
+    assert cost["name"] == "As is"
+    assert cost["total"] == pytest.approx(sum(pay.values()), rel=1e-12)
+    assert cost["by_dept"] == pytest.approx(by_dept, rel=1e-12)
+
+
+def _add(database, id_num, dept, class_num, salary=0.0, hourly=0.0,
+         commission=0.0):
+    employee = Employee(None, None, None, None, None, None, None, None, None)
+    employee.populate_from_fields(
+        id_num, f"Test Person{id_num}", "1 Main St", "Orem", "UT", "84058",
+        class_num, 2, salary, hourly, commission, "", "", "1/1/1990",
+        "123-45-6789", "801-555-0100", "test@example.com", "1/1/2020", "",
+        "Worker", dept, "Employee", "password")
+    database.add_employee(employee)
+    return employee.classification
+
+
+def test_simulate_compounds_adjustments_by_dept(workdir, engine):
+    database = EmployeeDB()
+    _add(database, 1, "Production", 1, hourly=20.0).set_timecards([8.0, 2.0])
+    _add(database, 2, "Production", 2, salary=2400.0)
+    _add(database, 3, "Sales", 3, salary=4800.0,
+         commission=0.1).set_receipts([100.0])
+    scenario = Scenario("Raise") \
+        .adjust(10, dept="Production") \
+        .adjust(50, rate="hourly_rate", classification="hourly") \
+        .adjust(-50, rate="commission_rate", dept="Sales")
+
+    as_is, raised = simulate(database, [Scenario("As is"), scenario])
+
+    # Hourly: 20 x 1.1 x 1.5 = 33 an hour for 10 hours. Salary: 2400 x 1.1
+    #   / 24. Commissioned: 4800 / 24 + 100 x 0.05.
+    assert raised["by_dept"] == pytest.approx({"Production": 330.0 + 110.0,
+                                               "Sales": 205.0})
+    assert raised["total"] == pytest.approx(645.0)
+    assert as_is["by_dept"] == pytest.approx({"Production": 300.0,
+                                              "Sales": 210.0})
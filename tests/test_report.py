@@ -0,0 +1,195 @@
+"""
+Tests for the all employee report in report.py.
+"""
+
+import csv
+import json
+import re
+from itertools import chain
+
+import pytest
+
+import report
+from employee_database import EmployeeDB
+from ingest import InputTracker
+from payroll import PayLedger, apply_new_receipts, apply_new_timecards, \
+    run_payroll
+from report import ReportCache, ReportReader, write_report
+
+
+def _read(file_name):
+    with open(file_name, "rb") as in_file:
+        return in_file.read()
+
+
+@pytest.mark.parametrize("with_pay", [False, True])
+def test_parallel_report_is_identical(data_dir, monkeypatch, with_pay):
+    monkeypatch.setattr(report, "CHUNK_EMPLOYEES", 7)
+    database = EmployeeDB()
+    pay = None
+    if with_pay:
+        pay = run_payroll(chain(database.emp_list,
+                                database.archived_list)).as_dict()
+
+    outputs = []
+    for workers in (1, 3):
+        names = [f"{name}-{workers}" for name in
+                 ("report.csv", "export.csv", "export.jsonl")]
+        write_report(chain(database.emp_list, database.archived_list),
+                     names[0], pay=pay, csv_export=names[1],
+                     jsonl_export=names[2], workers=workers)
+        outputs.append([_read(name) for name in names])
+
+    assert outputs[0] == outputs[1]
+    assert outputs[0][0].count(b"Employee ID:") == \
+        len(database.emp_list) + len(database.archived_list)
+
+
+def _fresh_report(database, file_name="fresh.csv"):
+    write_report(database.emp_list, file_name)
+    return _read(file_name)
+
+
+def test_cache_renders_only_changed_employees(data_dir, monkeypatch):
+    database = EmployeeDB()
+    cache = ReportCache()
+    cache.invalidate(database.take_changed())
+    write_report(database.emp_list, cache=cache)
+    id_num = database.emp_list[5].id
+    database.edit_employee(id_num, ["Name"], ["Renamed Person"])
+    rendered = []
+
+    def employee_report(employee):
+        rendered.append(employee.id)
+        return original(employee)
+    original = report.employee_report
+    monkeypatch.setattr(report, "employee_report", employee_report)
+    cache.invalidate(database.take_changed())
+    write_report(database.emp_list, cache=cache)
+
+    assert rendered == [id_num]
+    assert _read("report.csv") == _fresh_report(database)
+    assert b"Renamed Person" in _read("report.csv")
+
+
+def test_cache_renders_employees_whose_inputs_were_cleared(data_dir):
+    database = EmployeeDB()
+    tracker = InputTracker("timecards.csv")
+    apply_new_timecards(database, tracker, tracker.update())
+    cache = ReportCache()
+    cache.invalidate(database.take_changed())
+    write_report(database.emp_list, cache=cache)
+    with open("timecards.csv", "w", encoding="utf8"):
+        pass
+
+    apply_new_timecards(database, tracker, tracker.update())
+    cache.invalidate(database.take_changed())
+    write_report(database.emp_list, cache=cache)
+
+    assert _read("report.csv") == _fresh_report(database)
+
+
+def test_cache_records_only_changed_entries(data_dir):
+    database = EmployeeDB()
+    ledger = PayLedger()
+    recorded = []
+    original = ledger.record
+
+    def record(period, entries):
+        entries = list(entries)
+        recorded.append([entry[0] for entry in entries])
+        original(period, entries)
+    ledger.record = record
+    cache = ReportCache()
+    cache.invalidate(database.take_changed())
+    write_report(database.emp_list, ledger=ledger, period="2026-10-1",
+                 cache=cache)
+    id_num = database.emp_list[0].id
+    database.edit_employee(id_num, ["Name"], ["Renamed Person"])
+
+    cache.invalidate(database.take_changed())
+    write_report(database.emp_list, ledger=ledger, period="2026-10-1",
+                 cache=cache)
+    write_report(database.emp_list, ledger=ledger, period="2026-10-2",
+                 cache=cache)
+
+    assert recorded[0] == [employee.id for employee in database.emp_list]
+    assert recorded[1] == [id_num]
+    assert recorded[2] == recorded[0]
+    assert ledger.last_pay(id_num)["Name"] == "Renamed Person"
+    ledger.close()
+
+
+def _reported_pay(file_name="report.csv"):
+    """Returns the (ID, amount) of each employee in a written report.
+    """
+    text = _read(file_name).decode("utf8")
+    return [(int(id_num), float(amount)) for id_num, amount in zip(
+        re.findall(r"^Employee ID: (\d+)", text, re.MULTILINE),
+        re.findall(r"^\t.*?\$(\d+\.\d\d)", text, re.MULTILINE))]
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_exports_match_report(data_dir, cached):
+    database = EmployeeDB()
+    for file_name, apply in (("timecards.csv", apply_new_timecards),
+                             ("receipts.csv", apply_new_receipts)):
+        tracker = InputTracker(file_name)
+        apply(database, tracker, tracker.update())
+    cache = ReportCache() if cached else None
+    employees = list(chain(database.emp_list, database.archived_list))
+    write_report(employees, cache=cache)
+
+    # With a cache, the second report takes the export lines from it.
+    count = write_report(employees, csv_export="export.csv",
+                         jsonl_export="export.jsonl", cache=cache)
+
+    reported = _reported_pay()
+    assert count == len(reported) == len(employees)
+    with open("export.csv", newline='', encoding="utf8") as csv_file:
+        csv_rows = list(csv.reader(csv_file))
+    with open("export.jsonl", encoding="utf8") as jsonl_file:
+        json_rows = [json.loads(line) for line in jsonl_file]
+    assert tuple(csv_rows[0]) == report.EXPORT_FIELDS
+    assert len(csv_rows) - 1 == len(json_rows) == count
+    numbers = {"hourly": ("Hourly_Rate", "Inputs", "Input_Count"),
+               "salary": ("Salary",),
+               "commissioned": ("Salary", "Commission_Rate", "Inputs",
+                                "Input_Count")}
+    for (id_num, amount), csv_row, row in zip(reported, csv_rows[1:],
+                                              json_rows):
+        assert list(row) == list(report.EXPORT_FIELDS)
+        assert row["ID"] == id_num and isinstance(row["ID"], int)
+        assert type(row["Gross_Pay"]) is float
+        assert row["Gross_Pay"] == amount
+        typed = numbers[row["Classification"]]
+        for field in ("Hourly_Rate", "Salary", "Commission_Rate", "Inputs",
+                      "Input_Count"):
+            if field in typed:
+                assert type(row[field]) in (int, float), field
+            else:
+                assert row[field] is None, field
+        assert isinstance(row["Input_Count"] or 0, int)
+        if row["Pay_Method"] == "mail":
+            assert row["Route"] is None and row["Account"] is None
+        # The csv row holds the same values, with None as an empty cell.
+        assert csv_row == ["" if value is None else str(value)
+                           for value in row.values()]
+
+
+@pytest.mark.parametrize("block", [1 << 20, 8])
+def test_reader_search_ignores_non_ascii_case(workdir, monkeypatch, block):
+    monkeypatch.setattr(report, "SEARCH_BLOCK", block)
+    lines = ["Employee ID: 1  Name: Zoë Ångström", "Address: Hauptstraße 5",
+             "", "Employee ID: 2  Name: ÉMILE Ørsted", "Dept: R&D"]
+    with open("report.csv", "w", encoding="utf8") as report_file:
+        report_file.write("\n".join(lines) + "\n")
+
+    with ReportReader() as reader:
+        assert reader.search("ångström") == 0
+        assert reader.search("HAUPTSTRASSE") == 1
+        assert reader.search("émile") == 3
+        assert reader.search("zoË", 1) is None
+        assert reader.search("employee id", 1) == 3
+        assert reader.search("r&d") == 4
+        assert reader.lines(3, 1) == [lines[3]]
@@ -0,0 +1,273 @@
+"""
+Tests for the storage engines in storage.py.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import storage
+from employee_database import EmployeeDB
+from storage import CSVStorage, SQLiteStorage, _write_csv_atomic, \
+    import_csv
+
+
+def test_lazy_reads_after_compact(data_dir):
+    storage = CSVStorage()
+    storage.index_rows()
+    first, second = (int(row["ID"]) for row in storage.load()[1][:2])
+    storage.update_row(first, ["Name"], ["A Much Longer Renamed Person"])
+
+    storage.compact()
+
+    assert storage.read_row(first)["Name"] == "A Much Longer Renamed Person"
+    row = storage.read_row(second)
+    assert row["ID"] == str(second)
+
+
+def test_lazy_reads_after_load_compacts(data_dir):
+    storage = CSVStorage(compact_after=2)
+    storage.index_rows()
+    archived_rows, employee_rows = storage.load()
+    ids = [int(row["ID"]) for row in employee_rows[:3]]
+    for id_num in ids:
+        storage.update_row(id_num, ["Dept"], ["Moved"])
+
+    storage.load()
+
+    for id_num in ids:
+        row = storage.read_row(id_num)
+        assert row["ID"] == str(id_num)
+        assert row["Dept"] == "Moved"
+
+
+def test_journal_is_replayed_on_load(data_dir):
+    storage = CSVStorage()
+    id_num = int(storage.load()[1][0]["ID"])
+    with open("employees.csv", encoding="utf8") as database:
+        before = database.read()
+
+    storage.update_row(id_num, ["Phone", "Dept"], ["(801)555-0101", "QA"])
+
+    with open("employees.csv", encoding="utf8") as database:
+        assert database.read() == before
+    row = {int(row["ID"]): row for row in CSVStorage().load()[1]}[id_num]
+    assert row["Phone"] == "(801)555-0101"
+    assert row["Dept"] == "QA"
+
+
+def test_journal_line_cut_short_is_skipped(data_dir):
+    storage = CSVStorage()
+    id_num = int(storage.load()[1][0]["ID"])
+    storage.update_row(id_num, ["Dept"], ["QA"])
+    with open("employees.journal", "a", encoding="utf8") as journal:
+        journal.write(f"{id_num},Dept")
+
+    row = {int(row["ID"]): row for row in CSVStorage().load()[1]}[id_num]
+    assert row["Dept"] == "QA"
+
+
+def test_compact_folds_journal_into_employees_csv(data_dir):
+    storage = CSVStorage()
+    id_num = int(storage.load()[1][0]["ID"])
+    storage.update_row(id_num, ["Title"], ["Chief"])
+    journaled = storage.load()[1]
+
+    storage.compact()
+
+    assert not os.path.exists("employees.journal")
+    assert CSVStorage().load()[1] == journaled
+
+
+def test_update_rows_saves_all_changes_at_once(data_dir):
+    storage = CSVStorage()
+    first, second = (int(row["ID"]) for row in storage.load()[1][:2])
+    storage.update_row(first, ["Title"], ["Journaled"])
+
+    storage.update_rows([(first, ["Dept"], ["QA"]),
+                         (second, ["Phone", "Dept"], ["(801)555-0102", "HR"])])
+
+    assert not os.path.exists("employees.journal")
+    rows = {int(row["ID"]): row for row in CSVStorage().load()[1]}
+    assert (rows[first]["Title"], rows[first]["Dept"]) == ("Journaled", "QA")
+    assert (rows[second]["Phone"], rows[second]["Dept"]) == \
+        ("(801)555-0102", "HR")
+
+
+def _crash_before_journal_removed(monkeypatch):
+    monkeypatch.setattr(CSVStorage, "_finish_write_base", lambda self: None)
+
+
+def _crash_before_replace(monkeypatch):
+    def replace(source, destination):
+        if source.endswith(".new"):
+            raise OSError("crashed")
+        original(source, destination)
+    original = os.replace
+    monkeypatch.setattr(storage.os, "replace", replace)
+
+
+@pytest.mark.parametrize("crash", [_crash_before_journal_removed,
+                                   _crash_before_replace])
+def test_update_rows_survive_crash_with_journal_left(data_dir, monkeypatch,
+                                                     crash):
+    csv_storage = CSVStorage()
+    id_num = int(csv_storage.load()[1][0]["ID"])
+    csv_storage.update_row(id_num, ["Dept"], ["Journaled"])
+    with monkeypatch.context() as patch:
+        crash(patch)
+        try:
+            csv_storage.update_rows([(id_num, ["Dept"], ["Batch"])])
+        except OSError:
+            pass
+
+    assert os.path.exists("employees.csv.new")
+    rows = {int(row["ID"]): row for row in CSVStorage().load()[1]}
+    assert rows[id_num]["Dept"] == "Batch"
+    assert not os.path.exists("employees.journal")
+    assert not os.path.exists("employees.csv.new")
+
+
+def test_update_rows_rejects_unknown_field(data_dir):
+    storage = CSVStorage()
+    first, second = (int(row["ID"]) for row in storage.load()[1][:2])
+    with open("employees.csv", encoding="utf8") as database:
+        before = database.read()
+
+    with pytest.raises(Exception, match="Nickname"):
+        storage.update_rows([(first, ["Dept"], ["QA"]),
+                             (second, ["Nickname"], ["Bob"])])
+
+    with open("employees.csv", encoding="utf8") as database:
+        assert database.read() == before
+    assert not os.path.exists("employees.csv.tmp")
+
+
+def test_update_row_rejects_unknown_field(data_dir):
+    storage = CSVStorage()
+    id_num = int(storage.load()[1][0]["ID"])
+
+    with pytest.raises(Exception, match="Nickname"):
+        storage.update_row(id_num, ["Dept", "Nickname"], ["QA", "Bob"])
+
+    assert not os.path.exists("employees.journal")
+
+
+def test_failed_write_leaves_csv_and_no_temp_file(data_dir):
+    with open("employees.csv", encoding="utf8") as database:
+        before = database.read()
+
+    with pytest.raises(ValueError):
+        _write_csv_atomic("employees.csv", [{"Nickname": "Bob"}])
+
+    with open("employees.csv", encoding="utf8") as database:
+        assert database.read() == before
+    assert not os.path.exists("employees.csv.tmp")
+
+
+def test_edit_employees_changes_nothing_on_failure(data_dir):
+    database = EmployeeDB()
+    first, second = database.emp_list[0], database.emp_list[1]
+    dept = first.dept
+
+    with pytest.raises(Exception):
+        database.edit_employees([(first.id, ["Dept"], ["QA"]),
+                                 (second.id, ["Nickname"], ["Bob"])])
+
+    assert first.dept == dept
+    assert EmployeeDB().find_employee(first.id).dept == dept
+
+
+def _allocate(directory, engine, count):
+    """Allocates count IDs one at a time from the data in directory, in a
+    worker process.
+    """
+    os.chdir(directory)
+    storage = CSVStorage() if engine == "csv" else SQLiteStorage()
+    ids = [storage.allocate_ids(1, 0) for _ in range(count)]
+    storage.close()
+    return ids
+
+
+def test_allocate_id_is_above_ids_in_use_and_persists(data_dir):
+    database = EmployeeDB()
+    highest = max(employee.id for employee in
+                  database.emp_list + database.archived_list)
+
+    first = database.allocate_id()
+    block = database.allocate_id(10)
+
+    assert first == highest + 1
+    assert block == first + 1
+    assert EmployeeDB().allocate_id() == block + 10
+
+
+@pytest.mark.parametrize("engine", ["csv", "sqlite"])
+def test_allocate_ids_unique_across_processes(workdir, engine):
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(_allocate, [str(workdir)] * 4,
+                                    [engine] * 4, [50] * 4))
+
+    ids = [id_num for result in results for id_num in result]
+    assert len(set(ids)) == len(ids) == 200
+
+
+def _csv_rows():
+    """Returns the archived and active rows of the csv files, the way
+    EmployeeDB tells them apart.
+    """
+    archived_rows, employee_rows = CSVStorage().load()
+    archived_ids = {row["ID"] for row in archived_rows}
+    return archived_rows, [row for row in employee_rows
+                           if row["ID"] not in archived_ids]
+
+
+def test_import_csv_round_trip(data_dir):
+    sqlite_storage = import_csv()
+    # Importing again replaces the rows rather than adding to them.
+    import_csv().close()
+
+    assert sqlite_storage.load() == _csv_rows()
+    archived_ids, employee_ids = sqlite_storage.index_rows()
+    archived_rows, employee_rows = _csv_rows()
+    assert archived_ids == [int(row["ID"]) for row in archived_rows]
+    assert employee_ids == [int(row["ID"]) for row in employee_rows]
+    row = employee_rows[0]
+    assert sqlite_storage.read_row(int(row["ID"])) == row
+    sqlite_storage.close()
+
+
+def test_sqlite_update_and_archive_are_saved(data_dir):
+    sqlite_storage = import_csv()
+    first, second, third = (row for row in sqlite_storage.load()[1][:3])
+
+    sqlite_storage.update_row(first["ID"], ["Dept", "Phone"],
+                              ["QA", "(801)555-0103"])
+    sqlite_storage.update_rows([(second["ID"], ["Title"], ["Lead"]),
+                                (third["ID"], ["City"], ["Provo"])])
+    sqlite_storage.archive_row(dict(third, City="Provo"))
+    sqlite_storage.close()
+
+    archived_rows, employee_rows = SQLiteStorage().load()
+    rows = {row["ID"]: row for row in employee_rows}
+    assert (rows[first["ID"]]["Dept"], rows[first["ID"]]["Phone"]) == \
+        ("QA", "(801)555-0103")
+    assert rows[second["ID"]]["Title"] == "Lead"
+    assert third["ID"] not in rows
+    assert archived_rows[-1] == dict(third, City="Provo")
+
+
+def test_sqlite_rejects_unknown_field(data_dir):
+    sqlite_storage = import_csv()
+    first, second = (row for row in sqlite_storage.load()[1][:2])
+    before = sqlite_storage.load()
+
+    with pytest.raises(Exception, match="Nickname"):
+        sqlite_storage.update_row(first["ID"], ["Nickname"], ["Bob"])
+    with pytest.raises(Exception, match="Nickname"):
+        sqlite_storage.update_rows([(first["ID"], ["Dept"], ["QA"]),
+                                    (second["ID"], ["Nickname"], ["Bob"])])
+
+    assert sqlite_storage.load() == before
+    sqlite_storage.close()